@@ -0,0 +1,120 @@
+"""
+chat_history_bench.py
+
+Latency of /chats/history queries on one long conversation.
+
+Seeds --messages messages (default 100k) between two existing users, then times
+the old unpaginated OR query against the keyset pages /chats/history now
+serves (latest page, a page from the middle via `before`, and the `after` poll
+for new messages), printing p50/p95/p99 per query. The seeded messages are
+deleted again unless --keep is given.
+
+Run data/migrate.py first so the conversation index exists.
+
+Usage:
+  python benchmarks/chat_history_bench.py --user1 1 --user2 2 --messages 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from psycopg2.extras import execute_values
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from db import db_cursor  # noqa: E402
+from user_utils import chat_history_page  # noqa: E402
+
+from load_test import percentile  # noqa: E402
+
+MARKER = "[history-bench]"
+
+
+def seed(user1, user2, count):
+    # One message a second, alternating senders, ending now
+    start = datetime.now() - timedelta(seconds=count)
+    rows = (
+        (user1, user2) if i % 2 else (user2, user1)
+        for i in range(count)
+    )
+    with db_cursor(commit=True) as cur:
+        execute_values(
+            cur,
+            "INSERT INTO messages (from_user_id, to_user_id, text, created_at, seen) VALUES %s;",
+            (
+                (sender, recipient, f"{MARKER} {i}", start + timedelta(seconds=i), True)
+                for i, (sender, recipient) in enumerate(rows)
+            ),
+            page_size=5000,
+        )
+
+
+def old_query(user1, user2):
+    with db_cursor() as cur:
+        cur.execute(
+            """
+            SELECT from_user_id, to_user_id, text, created_at
+              FROM messages
+             WHERE (from_user_id = %s AND to_user_id = %s)
+                OR (from_user_id = %s AND to_user_id = %s)
+             ORDER BY created_at ASC;
+            """,
+            (user1, user2, user2, user1),
+        )
+        return cur.fetchall()
+
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main(args):
+    print(f"Seeding {args.messages} messages between users {args.user1} and {args.user2} ...")
+    seed(args.user1, args.user2, args.messages)
+    try:
+        with db_cursor() as cur:
+            cur.execute("ANALYZE messages;")
+        rows, _ = chat_history_page(args.user1, args.user2, limit=1)
+        newest_id = rows[-1][0]
+        with db_cursor() as cur:
+            cur.execute(
+                "SELECT message_id FROM messages WHERE text = %s;",
+                (f"{MARKER} {args.messages // 2}",),
+            )
+            middle_id = cur.fetchone()[0]
+
+        cases = [
+            ("old: full history", lambda: old_query(args.user1, args.user2), max(1, args.iterations // 10)),
+            ("latest page", lambda: chat_history_page(args.user1, args.user2, limit=args.page), args.iterations),
+            ("before=middle", lambda: chat_history_page(args.user1, args.user2, before=middle_id, limit=args.page), args.iterations),
+            ("after=newest (poll)", lambda: chat_history_page(args.user1, args.user2, after=newest_id, limit=args.page), args.iterations),
+        ]
+        print(f"{'query':<22}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name, fn, iterations in cases:
+            samples = timed(fn, iterations)
+            print(
+                f"{name:<22}{len(samples):>6}{1000 * percentile(samples, 50):>10.2f}"
+                f"{1000 * percentile(samples, 95):>10.2f}{1000 * percentile(samples, 99):>10.2f}"
+            )
+    finally:
+        if not args.keep:
+            with db_cursor(commit=True) as cur:
+                cur.execute("DELETE FROM messages WHERE text LIKE %s;", (MARKER + "%",))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--user1", type=int, required=True)
+    parser.add_argument("--user2", type=int, required=True)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--page", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--keep", action="store_true", help="don't delete the seeded messages")
+    main(parser.parse_args())
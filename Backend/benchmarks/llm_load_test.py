@@ -0,0 +1,104 @@
+"""
+llm_load_test.py
+
+Concurrent load test for the LLM-backed endpoints:
+  POST /emotion, POST /chat
+
+Meant to be run against the API started with the stub provider, so the numbers
+show the server's own overhead (admission control, sessions, streaming) rather
+than model speed:
+
+  LLM_PROVIDER=stub LLM_STUB_LATENCY_MS=50 LLM_STUB_TOKENS_PER_SEC=200 \\
+      uvicorn filmbuddy:app --port 5000
+  python benchmarks/llm_load_test.py --clients 50 --duration 20
+
+Rejections from admission control (429/503) are counted separately from errors.
+"""
+
+import argparse
+import asyncio
+import itertools
+import time
+from collections import defaultdict
+
+import httpx
+
+from load_test import percentile
+
+EMOTION_TEXTS = [
+    "I had an amazing day and want something fun",
+    "feeling a bit down, nothing too heavy please",
+    "meh, not sure what I want",
+]
+
+
+def cache_buster(i: int) -> str:
+    """`i` spelled in letters ("bc" for 12): sentiment.normalize() keeps
+    only letters, so a number suffix would map every text to one memo key."""
+    return "".join("abcdefghij"[int(d)] for d in str(i))
+
+
+async def run_client(client, deadline, latencies, errors, rejected, stream):
+    counter = itertools.count()
+    session_id = None
+    while time.perf_counter() < deadline:
+        i = next(counter)
+        if i % 2 == 0:
+            name = "/emotion"
+            body = {"user_text": f"{EMOTION_TEXTS[i % len(EMOTION_TEXTS)]} take {cache_buster(i)}",
+                    "alpha": 0.5}
+        else:
+            name = "/chat"
+            body = {"message": f"Recommend me a movie like number {i}", "stream": stream}
+            if session_id:
+                body["session_id"] = session_id
+        start = time.perf_counter()
+        try:
+            resp = await client.post(name, json=body)
+            if resp.status_code == 200 and name == "/chat" and not stream:
+                session_id = resp.json().get("session_id")
+            status = resp.status_code
+        except httpx.HTTPError:
+            status = None
+        elapsed = time.perf_counter() - start
+        if status == 200:
+            latencies[name].append(elapsed)
+        elif status in (429, 503):
+            rejected[name] += 1
+        else:
+            errors[name] += 1
+
+
+async def main(args):
+    names = ["/emotion", "/chat"]
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=120) as client:
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        rejected = defaultdict(int)
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*[
+            run_client(client, deadline, latencies, errors, rejected, args.stream)
+            for _ in range(args.clients)
+        ])
+        wall = time.perf_counter() - start
+
+    print(f"{args.clients} concurrent clients, {wall:.1f}s")
+    print(f"{'endpoint':<12}{'req':>8}{'rej':>6}{'err':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name in names:
+        lat = latencies[name]
+        print(
+            f"{name:<12}{len(lat):>8}{rejected[name]:>6}{errors[name]:>6}{len(lat) / wall:>9.1f}"
+            f"{1000 * percentile(lat, 50):>9.1f}{1000 * percentile(lat, 95):>9.1f}"
+            f"{1000 * percentile(lat, 99):>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--stream", action="store_true", help="use streaming /chat replies")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,94 @@
+"""
+load_test.py
+
+Concurrent load test for the database-bound endpoints:
+  GET /users/friends, GET /chats/history, GET /movies/unrated
+
+Logs in once, then runs N concurrent clients that hit the endpoints
+round-robin for a fixed duration and prints throughput and latency
+percentiles per endpoint.
+
+Usage (API must be running, e.g. uvicorn filmbuddy:app --port 5000):
+  python benchmarks/load_test.py --username alice --password secret --peer-id 2 --clients 50
+"""
+
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+
+import httpx
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[k]
+
+
+async def run_client(client, paths, deadline, latencies, errors):
+    i = 0
+    while time.perf_counter() < deadline:
+        name, path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            resp = await client.get(path)
+            ok = resp.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        elapsed = time.perf_counter() - start
+        if ok:
+            latencies[name].append(elapsed)
+        else:
+            errors[name] += 1
+
+
+async def main(args):
+    paths = [
+        ("/users/friends", "/users/friends"),
+        ("/chats/history", f"/chats/history?peer_id={args.peer_id}"),
+        ("/movies/unrated", "/movies/unrated"),
+    ]
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        resp = await client.post(
+            "/users/login", json={"username": args.username, "password": args.password}
+        )
+        resp.raise_for_status()
+
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*[
+            run_client(client, paths, deadline, latencies, errors)
+            for _ in range(args.clients)
+        ])
+        wall = time.perf_counter() - start
+
+    print(f"{args.clients} concurrent clients, {wall:.1f}s")
+    print(f"{'endpoint':<18}{'req':>8}{'err':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    total = 0
+    for name, _ in paths:
+        lat = latencies[name]
+        total += len(lat)
+        print(
+            f"{name:<18}{len(lat):>8}{errors[name]:>6}{len(lat) / wall:>9.1f}"
+            f"{1000 * percentile(lat, 50):>9.1f}{1000 * percentile(lat, 95):>9.1f}"
+            f"{1000 * percentile(lat, 99):>9.1f}"
+        )
+    print(f"{'total':<18}{total:>8}{sum(errors.values()):>6}{total / wall:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--peer-id", type=int, required=True, help="user id to fetch chat history with")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    asyncio.run(main(parser.parse_args()))
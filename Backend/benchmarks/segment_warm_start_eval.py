@@ -0,0 +1,132 @@
+"""
+segment_warm_start_eval.py
+
+Accuracy of the warm start for new users (recommendation/segments.py and
+alg.fold_in) on the MovieLens-100k u1–u5 splits, without the database.
+
+For each split, --cold-share of the test users are treated as new: their
+ratings are removed from u<k>.base before training the SVD. Each of them then
+"onboards" with their first n base ratings (by timestamp), and is evaluated
+on their u<k>.test ratings:
+
+  RMSE, for each n, of fold-ins with
+    - old reg    the SVD's own reg_pu (what fold-ins used before), no prior
+    - no prior   FOLD_IN_REG, shrinking towards zero
+    - segment    FOLD_IN_REG, shrinking towards their demographic segment
+
+  precision@10 for users with no ratings yet (relevant = test rating ≥ 4) of
+    - SVD        ranking by item bias alone (the model with nothing to go on)
+    - popular    the most liked movies overall
+    - segment    their segment's top-list
+
+Usage:
+  python benchmarks/segment_warm_start_eval.py [--splits 1 2 3 4 5] [--ratings 1 3 5 10 20]
+"""
+
+import argparse
+import os
+import random
+import sys
+
+import numpy as np
+import pandas as pd
+from surprise import Dataset, Reader, SVD
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from recommendation import alg, segments  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "MovieLens100K")
+COLUMNS = ["user_id", "movie_id", "rating", "ts"]
+RMSE_METHODS = ("old reg", "no prior", "segment")
+TOP_METHODS = ("SVD", "popular", "segment")
+
+
+def squared_error(svd, trainset, bu, pu, test):
+    inner = [trainset._raw2inner_id_items.get(str(mid)) for mid in test["movie_id"]]
+    known = np.array([i is not None for i in inner])
+    idx = np.array([i for i in inner if i is not None], dtype=int)
+    est = np.full(len(test), trainset.global_mean + bu)
+    est[known] += svd.bi[idx] + svd.qi[idx] @ pu
+    return float(((np.clip(est, 1, 5) - test["rating"].to_numpy()) ** 2).sum()), len(test)
+
+
+def run_split(k, args, users, rng, totals):
+    base = pd.read_csv(os.path.join(DATA_DIR, f"u{k}.base"), sep="\t", names=COLUMNS)
+    test = pd.read_csv(os.path.join(DATA_DIR, f"u{k}.test"), sep="\t", names=COLUMNS)
+    test_users = sorted(test["user_id"].unique())
+    cold = set(rng.sample(test_users, int(len(test_users) * args.cold_share)))
+
+    train = base[~base["user_id"].isin(cold)].astype({"user_id": str, "movie_id": str})
+    data = Dataset.load_from_df(train[["user_id", "movie_id", "rating"]], Reader(rating_scale=(1, 5)))
+    trainset = data.build_full_trainset()
+    svd = SVD(random_state=0)
+    svd.fit(trainset)
+    segs = segments.build(svd, trainset, users[["user_id", "age", "gender"]].itertuples(index=False))
+    everyone = segs.lookup(None, None)
+    raw_items = np.array([int(trainset.to_raw_iid(i)) for i in range(trainset.n_items)])
+    by_bias = raw_items[np.argsort(-svd.bi)][:10].tolist()
+
+    def add(key, value, count):
+        acc = totals.setdefault(key, [0.0, 0])
+        acc[0] += value
+        acc[1] += count
+
+    for user_id in cold:
+        history = base[base["user_id"] == user_id].sort_values("ts")
+        user_test = test[test["user_id"] == user_id]
+        profile = users[users["user_id"] == user_id].iloc[0]
+        segment = segs.lookup(profile["age"], profile["gender"])
+
+        relevant = set(user_test["movie_id"][user_test["rating"] >= segments.LIKED_RATING])
+        if relevant:
+            for method, top in (("SVD", by_bias), ("popular", everyone.top[:10]),
+                                ("segment", segment.top[:10])):
+                add(("top", method), len(relevant.intersection(top)) / 10, 1)
+
+        for n in args.ratings:
+            seen = list(zip(history["movie_id"][:n], history["rating"][:n]))
+            for method, prior, reg in (("old reg", None, svd.reg_pu),
+                                       ("no prior", None, None),
+                                       ("segment", (segment.bu, segment.pu), None)):
+                bu, pu = alg.fold_in(svd, trainset, seen, prior, reg=reg)
+                add(("rmse", method, n), *squared_error(svd, trainset, bu, pu, user_test))
+
+    for user_id in set(test_users) - cold:
+        inner = trainset.to_inner_uid(str(user_id))
+        add(("rmse", "established"), *squared_error(
+            svd, trainset, svd.bu[inner], svd.pu[inner], test[test["user_id"] == user_id]
+        ))
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    users = pd.read_csv(os.path.join(DATA_DIR, "u.user"), sep="|",
+                        names=["user_id", "age", "gender", "occupation", "zip_code"])
+
+    totals = {}
+    for k in args.splits:
+        run_split(k, args, users, rng, totals)
+        print(f"split u{k} done")
+
+    def rmse(key):
+        return np.sqrt(totals[key][0] / totals[key][1])
+
+    print(f"\nRMSE on the test ratings of new users (FOLD_IN_REG={alg.FOLD_IN_REG}):")
+    print(f"{'ratings':>8}" + "".join(f"{m:>10}" for m in RMSE_METHODS))
+    for n in args.ratings:
+        print(f"{n:>8}" + "".join(f"{rmse(('rmse', m, n)):>10.4f}" for m in RMSE_METHODS))
+    print(f"established users (trained factors): {rmse(('rmse', 'established')):.4f}")
+
+    print("\nprecision@10 for new users without ratings:")
+    for method in TOP_METHODS:
+        value, count = totals[("top", method)]
+        print(f"  {method:<8} {value / count:.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--splits", type=int, nargs="+", default=[1, 2, 3, 4, 5])
+    parser.add_argument("--ratings", type=int, nargs="+", default=[1, 3, 5, 10, 20])
+    parser.add_argument("--cold-share", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,78 @@
+"""
+title_search_bench.py
+
+Latency of the /movies/search index (title_search.TitleIndex) on a large
+catalog, without the database or the API.
+
+Builds --titles synthetic titles (default 100k) by recombining words from the
+ML-100k titles, indexes them, then times a mix of queries (full titles, single
+words, 1–2 letter prefixes, infixes, accented and misses) and prints the build
+time, the cost of an incremental add and p50/p95/p99 search latency.
+
+Usage:
+  python benchmarks/title_search_bench.py --titles 100000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from catalog import Snapshot  # noqa: E402
+from title_search import TitleIndex  # noqa: E402
+
+from load_test import percentile  # noqa: E402
+
+ITEM_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "MovieLens100K", "u.item")
+
+
+def synthetic_titles(count, rng):
+    with open(ITEM_FILE, encoding="latin-1") as f:
+        base = [line.split("|")[1] for line in f if "|" in line]
+    words = [w for title in base for w in title.rsplit(" (", 1)[0].split()]
+    titles = list(base)
+    while len(titles) < count:
+        n = rng.randint(1, 5)
+        titles.append(f"{' '.join(rng.choice(words) for _ in range(n))} ({rng.randint(1920, 2024)})")
+    return titles[:count], base
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    titles, base = synthetic_titles(args.titles, rng)
+
+    index = TitleIndex()
+    start = time.perf_counter()
+    index.sync(Snapshot(list(enumerate(titles, 1)), []))
+    print(f"indexed {len(index)} titles in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    index.add(len(titles) + 1, "Brand New Movie (2025)")
+    print(f"incremental add: {1000 * (time.perf_counter() - start):.3f} ms")
+
+    queries = (
+        [rng.choice(base).rsplit(" (", 1)[0] for _ in range(200)]          # full titles
+        + [rng.choice(base).split()[0] for _ in range(200)]                # first words
+        + [rng.choice(base)[:2] for _ in range(100)]                       # 1–2 letter prefixes
+        + ["eye", "wars", "ather", "miserables", "les miserables", "amelie", "zzzqx"] * 10
+    )
+    samples = []
+    for _ in range(args.rounds):
+        for q in queries:
+            start = time.perf_counter()
+            index.search(q, limit=20)
+            samples.append(time.perf_counter() - start)
+    print(
+        f"{len(samples)} searches: p50 {1000 * percentile(samples, 50):.3f} ms, "
+        f"p95 {1000 * percentile(samples, 95):.3f} ms, p99 {1000 * percentile(samples, 99):.3f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--titles", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,180 @@
+"""
+catalog.py
+
+In-memory snapshot of the movie catalog (movies + genres) for the read-only
+catalog endpoints, instead of querying Postgres on every request.
+
+  * The snapshot is immutable and carries a content hash (`version`), so
+    ETags are the same on every worker and a client holding the current one
+    gets a 304 without a body.
+  * /admin/movies(/import) adds the new movies to the snapshot right away
+    (`add_movies`); other workers pick it up on their next periodic reload
+    (CATALOG_REFRESH_INTERVAL).
+  * /movies/unrated is the catalog minus the user's rated ids, which are
+    cached per user and updated in place when they rate something.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from fastapi import Request, Response
+
+from db import db_cursor
+from rating_events import by_user
+
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "300"))
+RATED_IDS_CACHE_SIZE = int(os.getenv("RATED_IDS_CACHE_SIZE", "10000"))
+RATED_IDS_TTL = float(os.getenv("RATED_IDS_TTL", "300"))
+
+
+class Snapshot:
+    __slots__ = ("movies", "titles", "by_title", "genres", "version", "_encoded")
+
+    def __init__(self, movies: List[Tuple[int, str]], genres: List[Tuple[int, str]]):
+        self.movies = movies                                   # ordered by movie_id
+        self.titles = dict(movies)
+        self.by_title = [mid for mid, _ in sorted(movies, key=lambda m: (m[1], m[0]))]
+        self.genres = genres                                   # ordered by name
+        digest = hashlib.sha1()
+        for mid, title in movies:
+            digest.update(f"{mid}\0{title}\n".encode("utf-8"))
+        for gid, name in genres:
+            digest.update(f"g{gid}\0{name}\n".encode("utf-8"))
+        self.version = digest.hexdigest()[:16]
+        self._encoded: Dict[str, bytes] = {}
+
+    def encoded(self, view: str, build: Callable[[], object]) -> bytes:
+        """JSON body for a full (unpaginated) view, serialized once per snapshot."""
+        body = self._encoded.get(view)
+        if body is None:
+            body = self._encoded[view] = json.dumps(build()).encode("utf-8")
+        return body
+
+
+class Catalog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Snapshot] = None
+        self._loaded_at = 0.0
+        self._rated: "OrderedDict[int, Tuple[float, FrozenSet[int]]]" = OrderedDict()
+        self._rated_lock = threading.Lock()
+        self.stats_counters = {"reloads": 0, "not_modified": 0, "rated_hits": 0, "rated_misses": 0}
+
+    # ─── snapshot ────────────────────────────────────────────────────────────
+    def _load(self) -> Snapshot:
+        with db_cursor() as cur:
+            cur.execute("SELECT movie_id, title FROM movies ORDER BY movie_id;")
+            movies = cur.fetchall()
+            cur.execute("SELECT genre_id, name FROM genres ORDER BY name;")
+            genres = cur.fetchall()
+        return Snapshot(movies, genres)
+
+    def _publish(self, snapshot: Snapshot) -> None:
+        self._snapshot = snapshot
+        self._loaded_at = time.monotonic()
+
+    def snapshot(self) -> Snapshot:
+        snap = self._snapshot
+        if snap is not None and time.monotonic() - self._loaded_at < CATALOG_REFRESH_INTERVAL:
+            return snap
+        with self._lock:
+            if self._snapshot is not snap:
+                return self._snapshot  # another thread reloaded meanwhile
+            self._publish(self._load())
+            self.stats_counters["reloads"] += 1
+            return self._snapshot
+
+    def add_movie(self, movie_id: int, title: str) -> None:
+        """Adds a movie just inserted by this worker without a full reload."""
+        self.add_movies([(movie_id, title)])
+
+    def add_movies(self, added: List[Tuple[int, str]]) -> None:
+        """Adds movies just inserted by this worker, as one new snapshot."""
+        with self._lock:
+            snap = self._snapshot
+            if snap is None:
+                return  # loaded on first use anyway
+            ids = {movie_id for movie_id, _ in added}
+            movies = [m for m in snap.movies if m[0] not in ids] + list(added)
+            movies.sort()
+            self._publish(Snapshot(movies, snap.genres))
+
+    def invalidate(self) -> None:
+        """Forces a reload from the database on next use."""
+        with self._lock:
+            self._loaded_at = 0.0
+
+    # ─── per-user rated ids ──────────────────────────────────────────────────
+    def rated_ids(self, user_id: int) -> FrozenSet[int]:
+        now = time.monotonic()
+        with self._rated_lock:
+            entry = self._rated.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._rated.move_to_end(user_id)
+                self.stats_counters["rated_hits"] += 1
+                return entry[1]
+            self.stats_counters["rated_misses"] += 1
+
+        with db_cursor() as cur:
+            cur.execute("SELECT movie_id FROM ratings WHERE user_id = %s;", (user_id,))
+            rated = frozenset(row[0] for row in cur.fetchall())
+
+        with self._rated_lock:
+            self._rated[user_id] = (now + RATED_IDS_TTL, rated)
+            self._rated.move_to_end(user_id)
+            while len(self._rated) > RATED_IDS_CACHE_SIZE:
+                self._rated.popitem(last=False)
+        return rated
+
+    def note_rated(self, user_id: int, movie_ids) -> None:
+        """Records new ratings by `user_id` in the cached rated set (if cached)."""
+        with self._rated_lock:
+            entry = self._rated.get(user_id)
+            if entry is not None:
+                self._rated[user_id] = (entry[0], entry[1] | frozenset(movie_ids))
+
+    def on_rating_events(self, events) -> None:
+        """Rating event consumer (inline): keeps cached rated sets current."""
+        for user_id, user_events in by_user(events).items():
+            self.note_rated(user_id, [e.movie_id for e in user_events])
+
+    def stats(self) -> dict:
+        snap = self._snapshot
+        return {
+            "version": snap.version if snap else None,
+            "movies": len(snap.movies) if snap else 0,
+            "rated_ids_cached_users": len(self._rated),
+            **self.stats_counters,
+        }
+
+
+catalog = Catalog()
+
+
+def paginate(items: list, offset: Optional[int], limit: Optional[int]) -> list:
+    if offset is None and limit is None:
+        return items
+    offset = offset or 0
+    return items[offset: offset + limit if limit is not None else None]
+
+
+def cached_json(request: Request, etag: str, body: Callable[[], bytes],
+                total: Optional[int] = None) -> Response:
+    """
+    JSON response with an ETag; answers 304 when the client already has it.
+    `body` is only called when a body is actually sent.
+    """
+    etag = f'"{etag}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if total is not None:
+        headers["X-Total-Count"] = str(total)
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        catalog.stats_counters["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=body(), media_type="application/json", headers=headers)
@@ -0,0 +1,265 @@
+"""
+chat_hub.py
+
+Push delivery of chat messages over WebSockets (/chats/ws), replacing the
+/chats/unread poll.
+
+  * Each open socket subscribes to its user's messages in an in-process hub.
+  * /chats/send publishes with Postgres NOTIFY (sent on commit, so receivers
+    never see a message that was rolled back). A listener thread in every
+    API worker LISTENs and hands notifications to its local hub, so the
+    recipient gets the message whichever worker their socket is on.
+  * Messages pushed to a socket are marked seen in batches (one UPDATE every
+    CHAT_SEEN_FLUSH_INTERVAL seconds) instead of one UPDATE per poll.
+
+A connected user costs one query when the socket opens (their backlog of
+unread messages) and nothing while idle.
+"""
+
+import asyncio
+import json
+import os
+import select
+import threading
+import traceback
+from typing import Dict, List, Optional, Set
+
+import psycopg2
+import psycopg2.extensions
+
+from db import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER, db_cursor
+
+CHANNEL = "chat_messages"
+# NOTIFY payloads must stay under 8000 bytes; longer messages are sent by id
+# and fetched by the worker that delivers them.
+MAX_NOTIFY_PAYLOAD = 7500
+CHAT_SEEN_FLUSH_INTERVAL = float(os.getenv("CHAT_SEEN_FLUSH_INTERVAL", "1"))
+# Messages buffered per socket before a slow client is disconnected.
+CHAT_WS_QUEUE_SIZE = int(os.getenv("CHAT_WS_QUEUE_SIZE", "256"))
+
+_MESSAGE_COLUMNS = """
+    m.message_id, m.from_user_id, u.username, m.to_user_id, m.text, m.created_at
+"""
+
+
+def _message_dict(row) -> dict:
+    return {
+        "message_id": row[0],
+        "from_user_id": row[1],
+        "from_username": row[2],
+        "to_user_id": row[3],
+        "text": row[4],
+        "ts": row[5].isoformat(),
+    }
+
+
+def store_message(from_user_id: int, to_user_id: int, text: str) -> dict:
+    """
+    Inserts a message and publishes it to the recipient, in one transaction.
+    Returns the stored message.
+    """
+    with db_cursor(commit=True) as cur:
+        cur.execute(
+            f"""
+            WITH m AS (
+                INSERT INTO messages (from_user_id, to_user_id, text)
+                VALUES (%s, %s, %s)
+                RETURNING message_id, from_user_id, to_user_id, text, created_at
+            )
+            SELECT {_MESSAGE_COLUMNS}
+              FROM m
+              JOIN users u ON u.user_id = m.from_user_id;
+            """,
+            (from_user_id, to_user_id, text),
+        )
+        message = _message_dict(cur.fetchone())
+        payload = json.dumps(message)
+        if len(payload.encode("utf-8")) > MAX_NOTIFY_PAYLOAD:
+            payload = json.dumps(
+                {"message_id": message["message_id"], "to_user_id": to_user_id}
+            )
+        if hub.listening:
+            cur.execute("SELECT pg_notify(%s, %s);", (CHANNEL, payload))
+    if not hub.listening:
+        # No LISTEN connection (yet): at least reach sockets on this worker
+        hub.deliver_threadsafe(message)
+    return message
+
+
+def unread_messages(user_id: int) -> List[dict]:
+    """Messages sent to `user_id` that haven't been marked seen, oldest first."""
+    with db_cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT {_MESSAGE_COLUMNS}
+              FROM messages m
+              JOIN users u ON u.user_id = m.from_user_id
+             WHERE m.to_user_id = %s
+               AND m.seen = FALSE
+             ORDER BY m.created_at ASC;
+            """,
+            (user_id,),
+        )
+        return [_message_dict(row) for row in cur.fetchall()]
+
+
+def _fetch_message(message_id: int) -> Optional[dict]:
+    with db_cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT {_MESSAGE_COLUMNS}
+              FROM messages m
+              JOIN users u ON u.user_id = m.from_user_id
+             WHERE m.message_id = %s;
+            """,
+            (message_id,),
+        )
+        row = cur.fetchone()
+    return _message_dict(row) if row else None
+
+
+class ChatHub:
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._seen: Set[int] = set()
+        self._seen_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._listener: Optional[threading.Thread] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self.listening = False
+        self.stats_counters = {
+            "delivered": 0, "notifications": 0, "seen_flushes": 0,
+            "seen_marked": 0, "dropped_slow_clients": 0,
+        }
+
+    # ─── subscriptions (event loop only) ─────────────────────────────────────
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=CHAT_WS_QUEUE_SIZE)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def deliver(self, message: dict) -> None:
+        for queue in list(self._subscribers.get(message["to_user_id"], ())):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Client isn't reading; the socket handler closes it on None
+                self.stats_counters["dropped_slow_clients"] += 1
+                self.unsubscribe(message["to_user_id"], queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    def deliver_threadsafe(self, message: dict) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.deliver, message)
+
+    def mark_seen(self, message_ids: List[int]) -> None:
+        """Queues messages to be marked seen by the next batched UPDATE."""
+        self.stats_counters["delivered"] += len(message_ids)
+        with self._seen_lock:
+            self._seen.update(message_ids)
+
+    def unseen(self, messages: List[dict]) -> List[dict]:
+        """Drops messages already delivered but not yet flushed as seen."""
+        with self._seen_lock:
+            return [m for m in messages if m["message_id"] not in self._seen]
+
+    # ─── background work ─────────────────────────────────────────────────────
+    def _flush_seen(self) -> None:
+        with self._seen_lock:
+            ids, self._seen = list(self._seen), set()
+        if not ids:
+            return
+        try:
+            with db_cursor(commit=True) as cur:
+                cur.execute(
+                    "UPDATE messages SET seen = TRUE WHERE message_id = ANY(%s) AND seen = FALSE;",
+                    (ids,),
+                )
+            self.stats_counters["seen_flushes"] += 1
+            self.stats_counters["seen_marked"] += len(ids)
+        except Exception:
+            traceback.print_exc()
+            with self._seen_lock:
+                self._seen.update(ids)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(CHAT_SEEN_FLUSH_INTERVAL)
+            if self._seen:
+                await asyncio.to_thread(self._flush_seen)
+
+    def _on_notify(self, payload: str) -> None:
+        self.stats_counters["notifications"] += 1
+        message = json.loads(payload)
+        if message["to_user_id"] not in self._subscribers:
+            return  # nobody connected here; don't even fetch oversized messages
+        if "text" not in message:
+            message = _fetch_message(message["message_id"])
+            if message is None:
+                return
+        self.deliver_threadsafe(message)
+
+    def _listen(self) -> None:
+        """LISTEN loop on a dedicated connection; reconnects with backoff."""
+        backoff = 1.0
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(
+                    dbname=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
+                )
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL};")
+                self.listening = True
+                backoff = 1.0
+                while not self._stopping.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._on_notify(conn.notifies.pop(0).payload)
+            except Exception as e:
+                print(f"chat_hub: LISTEN connection failed ({e}), retrying in {backoff:.0f}s")
+            finally:
+                self.listening = False
+                if conn is not None:
+                    conn.close()
+            if self._stopping.wait(backoff):
+                return
+            backoff = min(backoff * 2, 30.0)
+
+    def start(self) -> List[asyncio.Task]:
+        """Starts the listener thread and seen-flusher (call from the app lifespan)."""
+        self._loop = asyncio.get_running_loop()
+        self._stopping.clear()
+        self._listener = threading.Thread(target=self._listen, name="chat-listen", daemon=True)
+        self._listener.start()
+        self._flusher = asyncio.create_task(self._flush_loop())
+        return [self._flusher]
+
+    def stop(self) -> None:
+        """Stops listening and writes out any seen state still pending."""
+        self._stopping.set()
+        self._flush_seen()
+
+    def stats(self) -> dict:
+        return {
+            "listening": self.listening,
+            "connected_users": len(self._subscribers),
+            "sockets": sum(len(q) for q in self._subscribers.values()),
+            "pending_seen": len(self._seen),
+            **self.stats_counters,
+        }
+
+
+hub = ChatHub()
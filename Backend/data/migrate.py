@@ -0,0 +1,96 @@
+"""
+migrate.py
+
+Applies the SQL files in data/migrations/ (in file-name order) that haven't
+been applied to the movielens database yet, recording each one in the
+schema_migrations table.
+
+Statements run one at a time in autocommit mode so migrations may use
+CREATE INDEX CONCURRENTLY and don't lock tables the API is using. A migration
+is only recorded once every index it creates is valid (a failed CONCURRENTLY
+build leaves an INVALID index behind).
+
+Usage:
+  python data/migrate.py
+"""
+
+import os
+import re
+import sys
+
+import psycopg2
+
+# Connection parameters come from Backend/db.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from db import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER  # noqa: E402
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+
+CREATE_INDEX_RE = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?(\w+)",
+    re.IGNORECASE,
+)
+
+
+def split_statements(sql: str) -> list:
+    """
+    Splits a migration into statements (one per `;` at the end of a line).
+    Each must be sent on its own: a multi-statement query runs as one
+    transaction, where CONCURRENTLY is not allowed.
+    """
+    lines = [line for line in sql.splitlines() if not line.lstrip().startswith("--")]
+    statements = re.split(r";\s*$", "\n".join(lines), flags=re.MULTILINE)
+    return [stmt.strip() for stmt in statements if stmt.strip()]
+
+
+def invalid_indexes(cur, names: list) -> list:
+    cur.execute(
+        """
+        SELECT c.relname
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = ANY(%s) AND NOT i.indisvalid;
+        """,
+        (names,),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def main():
+    # A dedicated (unpooled) connection: autocommit is required for CONCURRENTLY
+    conn = psycopg2.connect(
+        dbname=DB_NAME, user=DB_USER, password=DB_PASS, host=DB_HOST, port=DB_PORT
+    )
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name       TEXT PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """
+        )
+        cur.execute("SELECT name FROM schema_migrations;")
+        applied = {row[0] for row in cur.fetchall()}
+
+        for name in sorted(os.listdir(MIGRATIONS_DIR)):
+            if not name.endswith(".sql") or name in applied:
+                continue
+            print(f"Applying {name} ...")
+            with open(os.path.join(MIGRATIONS_DIR, name), encoding="utf-8") as f:
+                sql = f.read()
+            for statement in split_statements(sql):
+                cur.execute(statement)
+            invalid = invalid_indexes(cur, CREATE_INDEX_RE.findall(sql))
+            if invalid:
+                raise RuntimeError(f"{name}: index(es) {', '.join(invalid)} left INVALID; not recorded")
+            cur.execute("INSERT INTO schema_migrations (name) VALUES (%s);", (name,))
+        print("Database is up to date.")
+    finally:
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
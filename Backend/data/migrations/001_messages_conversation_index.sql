@@ -0,0 +1,10 @@
+-- Chat history is read per conversation, newest page first, and paged with
+-- (created_at, message_id) cursors. Index the canonical conversation key
+-- (lower user id, higher user id) so both directions of a conversation are one
+-- contiguous index range, in the order /chats/history reads it.
+--
+-- A failed CONCURRENTLY build leaves an INVALID index behind that IF NOT EXISTS
+-- would then skip, so drop any leftover first.
+DROP INDEX CONCURRENTLY IF EXISTS messages_conversation_idx;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS messages_conversation_idx
+    ON messages (LEAST(from_user_id, to_user_id), GREATEST(from_user_id, to_user_id), created_at, message_id);
@@ -0,0 +1,275 @@
+"""
+db.py
+
+Shared PostgreSQL connection pool for the whole backend.
+
+Every module used to open a fresh psycopg2 connection per query (TCP + auth
+handshake each time). Now they all call `get_db_connection()` from here, which
+hands out a pooled connection. Calling `.close()` on it (or leaving a
+`with get_db_connection() as conn:` block) returns it to the pool instead of
+closing the socket. Use one of those (or `db_cursor()`) at every call site: a
+connection that is never given back costs a pool slot. As a safety net, a
+proxy that is garbage-collected unclosed is reclaimed on the next acquire.
+"""
+
+import gc
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Database connection parameters
+DB_NAME = "movielens"
+DB_USER = "postgres"
+DB_PASS = os.getenv("PASSWORD")
+DB_HOST = "localhost"
+DB_PORT = 5432
+
+# Pool sizing: at most DB_POOL_MAX connections are open at once; up to
+# DB_POOL_IDLE of them are kept around between requests.
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_IDLE = int(os.getenv("DB_POOL_IDLE", str(DB_POOL_MAX)))
+# How long a caller may wait for a free connection before we give up.
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# ────────────────────────────────────────────────────────────────────────────────
+
+
+class PoolTimeout(RuntimeError):
+    """Raised when no pooled connection became free within DB_POOL_TIMEOUT."""
+
+
+class PooledConnection:
+    """
+    Thin proxy around a psycopg2 connection. Everything is forwarded to the
+    real connection except `close()`, which hands it back to the pool.
+    """
+
+    def __init__(self, pool: "ConnectionPool", conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get("_conn")
+        if conn is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return getattr(conn, name)
+
+    def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+    def __del__(self):
+        # Safety net for a caller that never closed us: without it the pool
+        # slot would be lost for good. This can run inside the cyclic GC, in any
+        # thread and while pool locks are held, so only queue the connection;
+        # the next acquire() releases it.
+        conn = self.__dict__.get("_conn")
+        if conn is not None:
+            self._conn = None
+            self._pool.orphan(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._conn is not None and exc_type is not None:
+            self._conn.rollback()
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """
+    Thread-safe, lazily filled pool of psycopg2 connections.
+
+    Unlike psycopg2.pool.ThreadedConnectionPool it blocks (up to `timeout`)
+    when exhausted instead of raising immediately, and it keeps counters so
+    we can see how often connections are reused and how long callers wait.
+    """
+
+    def __init__(self, max_size: int, max_idle: int, timeout: float, **connect_kwargs):
+        self.max_size = max_size
+        self.max_idle = min(max_idle, max_size)
+        self.timeout = timeout
+        self._connect_kwargs = connect_kwargs
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = deque()
+        self._orphans = deque()   # connections of garbage-collected, unclosed proxies
+        self._lock = threading.Lock()
+
+        # Metrics
+        self._created = 0
+        self._discarded = 0
+        self._checkouts = 0
+        self._in_use = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._reclaimed = 0
+
+    def acquire(self):
+        """Returns a raw psycopg2 connection, reusing an idle one if possible."""
+        start = time.perf_counter()
+        self._reclaim_orphans()
+        if not self._slots.acquire(timeout=self.timeout) and not self._reclaim_after_gc():
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeout(
+                f"No database connection available after {self.timeout:.1f}s "
+                f"(pool size {self.max_size})."
+            )
+        waited = time.perf_counter() - start
+
+        conn = None
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+            if waited > 0.001:
+                self._waits += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            while self._idle:
+                candidate = self._idle.pop()
+                if candidate.closed:
+                    self._discarded += 1
+                    continue
+                conn = candidate
+                break
+
+        if conn is None:
+            try:
+                conn = psycopg2.connect(**self._connect_kwargs)
+            except Exception:
+                with self._lock:
+                    self._in_use -= 1
+                self._slots.release()
+                raise
+            with self._lock:
+                self._created += 1
+        return conn
+
+    def release(self, conn) -> None:
+        """Returns `conn` to the pool, rolling back anything left uncommitted."""
+        keep = not conn.closed
+        if keep:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                keep = False
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    keep = False
+
+        with self._lock:
+            self._in_use -= 1
+            if keep and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                conn = None
+            else:
+                self._discarded += 1
+        if conn is not None and not conn.closed:
+            conn.close()
+        self._slots.release()
+
+    def orphan(self, conn) -> None:
+        """Queues a connection whose proxy was garbage-collected unclosed."""
+        self._orphans.append(conn)   # deque.append is atomic; no lock needed
+
+    def _reclaim_orphans(self) -> int:
+        reclaimed = 0
+        while True:
+            try:
+                conn = self._orphans.popleft()
+            except IndexError:
+                break
+            self.release(conn)
+            reclaimed += 1
+        if reclaimed:
+            with self._lock:
+                self._reclaimed += reclaimed
+        return reclaimed
+
+    def _reclaim_after_gc(self) -> bool:
+        """Last try when exhausted: an unclosed proxy kept alive by a reference
+        cycle (an exception traceback, typically) is only finalized by the GC."""
+        gc.collect()
+        return bool(self._reclaim_orphans()) and self._slots.acquire(blocking=False)
+
+    def close_all(self) -> None:
+        """Closes every idle connection (used on shutdown)."""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            if not conn.closed:
+                conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "connections_created": self._created,
+                "connections_discarded": self._discarded,
+                "checkouts": checkouts,
+                "reused_checkouts": checkouts - self._created,
+                "reuse_ratio": (checkouts - self._created) / checkouts if checkouts else 0.0,
+                "waits": self._waits,
+                "wait_avg_ms": 1000 * self._wait_total / checkouts if checkouts else 0.0,
+                "wait_max_ms": 1000 * self._wait_max,
+                "timeouts": self._timeouts,
+                "reclaimed_unclosed": self._reclaimed,
+            }
+
+
+pool = ConnectionPool(
+    max_size=DB_POOL_MAX,
+    max_idle=DB_POOL_IDLE,
+    timeout=DB_POOL_TIMEOUT,
+    dbname=DB_NAME,
+    user=DB_USER,
+    password=DB_PASS,
+    host=DB_HOST,
+    port=DB_PORT,
+)
+
+
+def get_db_connection() -> PooledConnection:
+    """
+    Returns a pooled connection to the movielens database.
+    Call `.close()` (or use it as a context manager) to give it back.
+    """
+    return PooledConnection(pool, pool.acquire())
+
+
+@contextmanager
+def db_cursor(commit: bool = False):
+    """
+    Convenience wrapper: yields a cursor on a pooled connection and
+    returns the connection afterwards (committing first if `commit`).
+    """
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            yield cur
+            if commit:
+                conn.commit()
+        finally:
+            cur.close()
+
+
+def pool_stats() -> dict:
+    """Pool metrics: reuse counts, wait times, current usage."""
+    return pool.stats()
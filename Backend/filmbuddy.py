@@ -1,35 +1,68 @@
 import asyncio
+import os
 import traceback
-from typing import List, Dict, Any, Optional
+import json
+import csv
+import io
+from typing import AsyncIterator, List, Dict, Any, Optional
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Depends, Response, Request
+from fastapi import FastAPI, HTTPException, Depends, Response, Request, WebSocket
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, validator
-
-
-from ollama import Client
-from server.ollama_server import OllamaServer
-from recommendation import alg
-from user_utils import get_db_connection
-import bcrypt
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.concurrency import run_in_threadpool
+import anyio
+from pydantic import BaseModel, ValidationError, validator
+
+
+from server.ollama_server import OllamaServer, keep_models_warm
+from recommendation import alg, popularity
+from recommendation.filters import Filter
+from llm import admission, blurbs, chat_sessions, comment_jobs, providers, routing, sentiment
+import db
+from catalog import cached_json, catalog, paginate
+from title_search import index as title_index
+from chat_hub import hub as chat_hub, store_message, unread_messages
+from rating_events import bus as rating_bus
+from db import db_cursor
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# Blocking endpoints (plain `def`) and run_in_threadpool() calls share this many worker threads
+API_THREADPOOL_SIZE = int(os.getenv("API_THREADPOOL_SIZE", "40"))
+# /chats/history page size (default and upper bound)
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "50"))
+CHAT_HISTORY_MAX_PAGE_SIZE = 200
+# Most ratings accepted by one POST /ratings/bulk
+RATINGS_BULK_MAX = int(os.getenv("RATINGS_BULK_MAX", "1000"))
+# Most movies accepted by one POST /admin/movies/import
+ADMIN_IMPORT_MAX = int(os.getenv("ADMIN_IMPORT_MAX", "5000"))
+# Longest "exclude" list accepted by the /recommend endpoints
+RECOMMEND_MAX_EXCLUDE = 1000
 
 from user_utils import (
     add_new_user,
-    list_all_movies,
     add_or_update_rating,
+    add_or_update_ratings,
+    insert_movies,
     user_exists,
+    user_from_session_token,
+    chat_history_page,
     create_access_token,
-    get_current_user
+    get_current_user,
+    get_current_admin,
+    auth_cache_stats,
+    get_login_record,
+    hash_password,
+    check_password,
+    password_hash_stats,
 )
 
 
 
 # Globals to hold the Ollama server context and client
 ollama_server: OllamaServer = None
-client: Client = None
+client: providers.LLMProvider = None
 
 
 
@@ -39,60 +72,93 @@ def check_user_id(user_id: int) -> bool:
     # (adjust upper bound as you wish)
 
 
-async def interpret_emotion(
-    client: Client, user_text: str, alpha: float
-) -> float:
+def check_page(offset: Optional[int], limit: Optional[int]) -> None:
+    if offset is not None and offset < 0:
+        raise HTTPException(status_code=400, detail="offset must be >= 0.")
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be >= 1.")
+
+
+def parse_recommend_filter(data: Dict[str, Any]) -> Filter:
     """
-    Calls Ollama to interpret the user's emotion (0.0–1.0) and returns a float.
+    Optional filters of the /recommend endpoints:
+      "genres": [genre_id, ...]   (any of them)
+      "year_from", "year_to": int (release year range, inclusive)
+      "exclude": [movie_id, ...]
     """
-    prompt = (
-        "You are an analysis assistant.\n"
-        "ALWAYS RESPOND ONLY WITH A SINGLE FLOAT NUMBER BETWEEN 0.0 AND 1.0 FOR EMOTIONS, POSITIVE IS BIGGER.\n"
-        f"User input: \"{user_text}\""
+    genre_ids = data.get("genres") or []
+    year_from, year_to = data.get("year_from"), data.get("year_to")
+    exclude = data.get("exclude") or []
+
+    genre_names = dict(catalog.snapshot().genres) if genre_ids else {}
+    if not isinstance(genre_ids, list) or any(
+        not isinstance(gid, int) or gid not in genre_names for gid in genre_ids
+    ):
+        raise HTTPException(status_code=400, detail="genres must be a list of existing genre ids.")
+    for year in (year_from, year_to):
+        if year is not None and (not isinstance(year, int) or not 1800 <= year <= 2100):
+            raise HTTPException(status_code=400, detail="year_from/year_to must be years.")
+    if year_from is not None and year_to is not None and year_from > year_to:
+        raise HTTPException(status_code=400, detail="year_from must be ≤ year_to.")
+    if (not isinstance(exclude, list) or len(exclude) > RECOMMEND_MAX_EXCLUDE
+            or not all(isinstance(mid, int) for mid in exclude)):
+        raise HTTPException(
+            status_code=400,
+            detail=f"exclude must be a list of at most {RECOMMEND_MAX_EXCLUDE} movie ids.",
+        )
+    return Filter(
+        genres=tuple(sorted(genre_names[gid] for gid in set(genre_ids))),
+        year_from=year_from,
+        year_to=year_to,
+        exclude=frozenset(exclude),
     )
-    response = client.generate(model="llama3.1", prompt=prompt)
-    try:
-        raw = response.get("response", "0.5").strip()
-        alpha_out = float(raw)
-    except (ValueError, AttributeError):
-        alpha_out = 0.5
 
-    # Clamp to [0.0, 1.0]
-    return max(0.0, min(1.0, alpha_out))
 
+def sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """Formats one server-sent event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
 
-def movie_response_str(client: Client, movie: str) -> str:
-    """
-    Uses Ollama chat (streaming) to get a short recommendation/fun fact about `movie`.
-    Returns the full concatenated string.
-    """
-    messages = [
-        {"role": "system", "content": "You are a movie expert assistant."},
-        {
-            "role": "user",
-            "content": (
-                f"Based on my algorithm, the predicted movie is '{movie}'. "
-                "Provide a concise recommendation or fun fact about this movie."
-            ),
-        },
-    ]
 
-    # stream=True returns an iterator of chunks; concatenate them
-    full = ""
-    for chunk in client.chat(model="llama3.1", messages=messages, stream=True):
-        full += chunk["message"]["content"]
-    return full.strip()
+def event_stream_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """Wraps an iterator of already formatted SSE events in a streaming response."""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
-async def chat_response(client: Client, history: List[Dict[str, str]]) -> str:
+def sse_response(pieces: AsyncIterator[str], first: Optional[Dict[str, Any]] = None) -> StreamingResponse:
     """
-    Uses Ollama chat (streaming) to reply given a Slack‐style `history` of messages.
-    Returns the full concatenated assistant reply.
+    Streams LLM output to the browser as server-sent events:
+      event: meta   (optional, `first` payload, sent immediately)
+      data: {"delta": "..."}   one per generated piece
+      event: done   {"text": "<full reply>"}
     """
-    full = ""
-    for chunk in client.chat(model="llama3.1", messages=history, stream=True):
-        full += chunk["message"]["content"]
-    return full.strip()
+    async def events():
+        if first is not None:
+            yield sse_event(first, event="meta")
+        full = ""
+        try:
+            async for piece in pieces:
+                full += piece
+                yield sse_event({"delta": piece})
+        except Exception as e:
+            traceback.print_exc()
+            yield sse_event({"detail": str(e)}, event="error")
+            return
+        yield sse_event({"text": full.strip()}, event="done")
+
+    return event_stream_response(events())
+
+
+async def build_popularity() -> None:
+    """Bulk-builds the popularity index off the event loop (startup)."""
+    try:
+        await asyncio.to_thread(popularity.index.build)
+    except Exception:
+        traceback.print_exc()
 
 
 @asynccontextmanager
@@ -103,16 +169,41 @@ async def lifespan(app: FastAPI):
     global ollama_server, client
 
     # Startup logic
-    ollama_server = OllamaServer(host="127.0.0.1:11435")
-    ollama_server.__enter__()  # Start OllamaServer
-    client = Client(host="http://127.0.0.1:11435")
-    client.pull("llama3.1")  # Preload the model
+    # Database-bound endpoints are plain `def`, so FastAPI runs them in this
+    # bounded threadpool instead of on the event loop.
+    anyio.to_thread.current_default_thread_limiter().total_tokens = API_THREADPOOL_SIZE
+    client = providers.create_provider(host="http://127.0.0.1:11435")
+    background = []
+    if client.name == "ollama":
+        # Ollama starts (or restarts) under the supervisor; the routed models are
+        # pulled and loaded in the background while non-LLM routes are already served.
+        models = routing.models()
+        ollama_server = OllamaServer(host="127.0.0.1:11435", max_loaded_models=len(models))
+        await asyncio.to_thread(ollama_server.__enter__)  # Start OllamaServer
+        background.append(asyncio.create_task(keep_models_warm(ollama_server, lambda: client, models)))
+    background.append(asyncio.create_task(blurbs.run_warmer(lambda: client)))
+    background += comment_jobs.start(lambda: client)
+    background += chat_hub.start()
+    # Rating writes feed the rated-id cache right away, and recommender
+    # fold-ins and popularity counters in batches
+    rating_bus.subscribe(catalog.on_rating_events, inline=True)
+    rating_bus.subscribe(alg.fold_in_events)
+    rating_bus.subscribe(popularity.index.on_rating_events)
+    rating_bus.start()
+    background.append(asyncio.create_task(build_popularity()))
 
     yield  # Hand over control to FastAPI
 
+    for task in background:
+        task.cancel()
+
     # Shutdown logic
+    chat_hub.stop()
+    await asyncio.to_thread(rating_bus.stop)
+    await client.aclose()
     if ollama_server:
         ollama_server.__exit__(None, None, None)
+    db.pool.close_all()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -130,6 +221,62 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(admission.FairnessKeyMiddleware)
+# Catalog lists are large and repetitive; event streams are left uncompressed
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+
+@app.get("/health/live")
+async def liveness():
+    """
+    GET /health/live
+    The API process is up and serving requests.
+    """
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def readiness(response: Response):
+    """
+    GET /health/ready
+    200 once Ollama answers and every routed model is loaded, 503 until then.
+    Non-LLM routes work regardless; this only gates the AI features.
+    (The stub LLM provider is always ready.)
+    """
+    if client is not None and client.name == "stub":
+        return {"ready": True, "provider": "stub"}
+    status = ollama_server.status() if ollama_server else {"models": "not started"}
+    ready = ollama_server is not None and ollama_server.ready()
+    if not ready:
+        response.status_code = 503
+    return {"ready": ready, "provider": "ollama", "ollama": status}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    GET /metrics
+    Returns internal counters, e.g. database pool reuse and wait times.
+    """
+    return {
+        "db_pool": db.pool_stats(),
+        "auth_cache": auth_cache_stats(),
+        "password_hashing": password_hash_stats(),
+        "blurb_cache": blurbs.stats(),
+        "emotion": sentiment.stats(),
+        "chat": chat_sessions.stats(),
+        "comment_jobs": comment_jobs.stats(),
+        "llm_admission": admission.stats(),
+        "chat_push": chat_hub.stats(),
+        "catalog": catalog.stats(),
+        "recommender_single_flight": alg.single_flight_stats(),
+        "recommender_model": alg.model_stats(),
+        "popularity": popularity.index.stats(),
+        "rating_events": rating_bus.stats(),
+        "llm_provider": client.stats() if client else None,
+        "llm_tasks": routing.stats(),
+        "ollama": ollama_server.status() if ollama_server else None,
+    }
 
 
 # ────────────────────────────────────────────────────────────────────────────────
@@ -140,13 +287,20 @@ app.add_middleware(
 async def get_top_recommendation(data: Dict[str, Any]):
     """
     POST /recommend/top
-    Body JSON: { "user_id": int, "alpha": float }
+    Body JSON: { "user_id": int, "alpha": float,
+                 "stream": bool (optional), "defer_comment": bool (optional),
+                 filters (optional, see parse_recommend_filter) }
     Returns:
       {
         "movie_id": int,
         "title": str,
         "comment": str
       }
+    With "stream": true the reply is a text/event-stream instead: a `meta`
+    event with movie_id/title, then the comment as `delta` events.
+    With "defer_comment": true the reply comes back as soon as the movie is
+    picked, with "comment_job_id" (and "comment": null unless it was cached);
+    fetch the comment from /recommend/comments/{job_id}.
     """
     user_id = data.get("user_id")
     alpha = data.get("alpha")
@@ -158,8 +312,9 @@ async def get_top_recommendation(data: Dict[str, Any]):
         alpha = float(alpha)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid alpha value.")
+    filters = await run_in_threadpool(parse_recommend_filter, data)
 
-    df = alg.recommend_top_n_movies(user_id, 1, alpha)
+    df = await run_in_threadpool(alg.recommend_top_n_movies, user_id, 1, alpha, filters)
     if df.empty:
         raise HTTPException(status_code=404, detail="No recommendation found.")
 
@@ -167,7 +322,22 @@ async def get_top_recommendation(data: Dict[str, Any]):
     movie_id = df.iloc[0]["movie_id"]
     print(f"Top recommendation for user {user_id}: {title} (ID: {movie_id})")
     movie_id = int(movie_id)
-    comment = movie_response_str(client, title)
+    blurbs.note_recommended(movie_id, title)
+    if data.get("stream"):
+        admission.ensure_capacity()
+        return sse_response(
+            blurbs.stream_blurb(client, movie_id, title),
+            first={"movie_id": movie_id, "title": title},
+        )
+    if data.get("defer_comment"):
+        job = await comment_jobs.submit(movie_id, title)
+        return {
+            "movie_id": movie_id,
+            "title": title,
+            "comment": job["comment"],
+            "comment_job_id": job["job_id"],
+        }
+    comment = await blurbs.get_blurb(client, movie_id, title)
 
     return {
         "movie_id": movie_id,
@@ -176,12 +346,54 @@ async def get_top_recommendation(data: Dict[str, Any]):
     }
 
 
+@app.get("/recommend/comments/{job_id}")
+async def get_recommendation_comment(job_id: str, wait: float = 0.0):
+    """
+    GET /recommend/comments/{job_id}?wait=<seconds>
+    Returns { "job_id", "movie_id", "title", "status", "comment" } where status is
+    "queued" | "running" | "done" | "fallback". With wait > 0 (max 30) the call
+    blocks until the comment is ready or the wait runs out.
+    """
+    if wait > 0:
+        job = await comment_jobs.wait(job_id, min(wait, 30.0))
+    else:
+        job = await asyncio.to_thread(comment_jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Comment job not found.")
+    return job
+
+
+@app.get("/recommend/comments/{job_id}/events")
+async def stream_recommendation_comment(job_id: str):
+    """
+    GET /recommend/comments/{job_id}/events
+    Server-sent events: pushes a single `comment` event once the job finishes.
+    """
+    job = await asyncio.to_thread(comment_jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Comment job not found.")
+
+    async def events():
+        current = job
+        while current["status"] not in (comment_jobs.DONE, comment_jobs.FALLBACK):
+            # Keep the connection alive while the worker is busy
+            yield ": waiting\n\n"
+            current = await comment_jobs.wait(job_id, 15.0)
+            if current is None:
+                yield sse_event({"detail": "Comment job not found."}, event="error")
+                return
+        yield sse_event(current, event="comment")
+
+    return event_stream_response(events())
+
 
 @app.post("/recommend/top_list")
 async def get_top_list(data: Dict[str, Any]):
     """
     POST /recommend/top_list
-    Body JSON: { "user_id": int, "alpha": float, "n": int (optional, default=5) }
+    Body JSON: { "user_id": int, "alpha": float, "n": int (optional, default=5),
+                 "comments": bool (optional), "stream": bool (optional),
+                 filters (optional, see parse_recommend_filter) }
     Returns:
       {
         "movies": [
@@ -189,6 +401,10 @@ async def get_top_list(data: Dict[str, Any]):
           ...
         ]
       }
+    With "comments": true every movie also gets a "comment" (LLM blurb);
+    blurbs are generated concurrently. Adding "stream": true sends the list
+    right away as a `meta` event, then one `comment` event
+    ({ "movie_id", "comment" }) per movie as each blurb finishes.
     """
     user_id = data.get("user_id")
     alpha = data.get("alpha")
@@ -201,9 +417,31 @@ async def get_top_list(data: Dict[str, Any]):
         n = int(n)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid alpha or n value.")
+    filters = await run_in_threadpool(parse_recommend_filter, data)
 
-    df = alg.recommend_top_n_movies(user_id, n, alpha)
+    df = await run_in_threadpool(alg.recommend_top_n_movies, user_id, n, alpha, filters)
     records = df.to_dict(orient="records")
+    for rec in records:
+        blurbs.note_recommended(rec["movie_id"], rec["title"])
+
+    if not data.get("comments"):
+        return {"movies": records}
+
+    movies = [(rec["movie_id"], rec["title"]) for rec in records]
+    if data.get("stream"):
+        admission.ensure_capacity()
+
+        async def events():
+            yield sse_event({"movies": records}, event="meta")
+            async for movie_id, comment in blurbs.iter_blurbs(client, movies):
+                yield sse_event({"movie_id": movie_id, "comment": comment}, event="comment")
+            yield sse_event({}, event="done")
+
+        return event_stream_response(events())
+
+    comments = {mid: comment async for mid, comment in blurbs.iter_blurbs(client, movies)}
+    for rec in records:
+        rec["comment"] = comments.get(rec["movie_id"])
     return {"movies": records}
 
 
@@ -215,7 +453,8 @@ async def adjust_alpha(data: Dict[str, Any]):
     Returns:
       {
         "alpha_interpreted": float,
-        "alpha_adjusted": float
+        "alpha_adjusted": float,
+        "source": "memo" | "lexicon" | "llm"
       }
     """
     user_text = data.get("user_text", "")
@@ -226,48 +465,83 @@ async def adjust_alpha(data: Dict[str, Any]):
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid alpha value.")
 
-    interpreted = await interpret_emotion(client, user_text, alpha)
+    interpreted, source = await sentiment.score_emotion(client, user_text)
     adjusted = (interpreted + alpha) / 2.0
 
-    return {"alpha_interpreted": interpreted, "alpha_adjusted": adjusted}
+    return {"alpha_interpreted": interpreted, "alpha_adjusted": adjusted, "source": source}
 
 
 @app.post("/chat")
 async def chat_endpoint(data: Dict[str, Any]):
     """
     POST /chat
-    Body JSON: { "history": [ { "role": "user"|"assistant"|"system", "content": str }, ... ] }
-    Returns:
-      { "reply": "<assistant-generated text>" }
+    Session mode (preferred):
+      Body JSON: { "message": str, "session_id": str (optional), "stream": bool (optional) }
+      Returns:   { "reply": "<assistant-generated text>", "session_id": str }
+      The server keeps the conversation; omit session_id to start a new one.
+    Legacy mode:
+      Body JSON: { "history": [ { "role": "user"|"assistant"|"system", "content": str }, ... ],
+                   "stream": bool (optional) }
+      Returns:   { "reply": "<assistant-generated text>" }
+    With "stream": true the reply is sent as server-sent `delta` events instead
+    (session mode sends a `meta` event with the session_id first).
     """
+    message = data.get("message")
+    if message is not None:
+        if not isinstance(message, str) or not message.strip():
+            raise HTTPException(status_code=400, detail="`message` must be a non-empty string.")
+        session = chat_sessions.get_session(data.get("session_id"))
+        if data.get("stream"):
+            admission.ensure_capacity()
+            return sse_response(
+                chat_sessions.stream_session_reply(client, session, message.strip()),
+                first={"session_id": session.session_id},
+            )
+        reply = await chat_sessions.session_reply(client, session, message.strip())
+        return {"reply": reply, "session_id": session.session_id}
+
     history = data.get("history")
     if not isinstance(history, list):
         raise HTTPException(status_code=400, detail="`history` must be a list of messages.")
 
-    reply = await chat_response(client, history)
+    if data.get("stream"):
+        admission.ensure_capacity()
+        return sse_response(chat_sessions.stream_chat_response(client, history))
+
+    reply = await chat_sessions.chat_response(client, history)
     return {"reply": reply}
 
 
+@app.delete("/chat/sessions/{session_id}")
+async def end_chat_session(session_id: str):
+    """
+    DELETE /chat/sessions/{session_id}
+    Forgets a server-side chat session.
+    """
+    if not chat_sessions.end_session(session_id):
+        raise HTTPException(status_code=404, detail="Chat session not found.")
+    return {"success": True}
+
+
 # ────────────────────────────────────────────────────────────────────────────────
 # New endpoints for user‐management, movie‐listing, and rating
 # ────────────────────────────────────────────────────────────────────────────────
 
 @app.get("/genres", response_model=List[Dict[str, Any]])
-async def list_genres(current_user: int = Depends(get_current_user)):
+def list_genres(request: Request, current_user: int = Depends(get_current_user)):
     """
     GET /api/genres
     Returns a list of all genres: [{"genre_id": int, "name": str}, ...]
+    Served from the catalog snapshot; supports If-None-Match.
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT genre_id, name FROM genres ORDER BY name;")
-        rows = cur.fetchall()
-    finally:
-        cur.close()
-        conn.close()
-
-    return [{"genre_id": gid, "name": name} for gid, name in rows]
+    snap = catalog.snapshot()
+    return cached_json(
+        request,
+        f"genres-{snap.version}",
+        lambda: snap.encoded("genres", lambda: [
+            {"genre_id": gid, "name": name} for gid, name in snap.genres
+        ]),
+    )
 
 @app.post("/users/register")
 async def register_user(data: Dict[str, Any], response: Response):
@@ -308,8 +582,11 @@ async def register_user(data: Dict[str, Any], response: Response):
     if not isinstance(raw_password, str) or len(raw_password) < 4:
         raise HTTPException(status_code=400, detail="Password must be ≥4 characters.")
 
+    password_hash = await hash_password(raw_password)
     try:
-        new_id = add_new_user(username, age, gender, occupation, zip_code, raw_password)
+        new_id = await run_in_threadpool(
+            add_new_user, username, age, gender, occupation, zip_code, password_hash
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -328,7 +605,7 @@ async def register_user(data: Dict[str, Any], response: Response):
     return {"user_id": new_id}
 
 @app.get("/users/{user_id}/rating_count")
-async def get_rating_count(user_id: int):
+def get_rating_count(user_id: int):
     """
     Returns how many ratings this user has submitted so far.
     Response: { "count": <integer> }
@@ -338,15 +615,12 @@ async def get_rating_count(user_id: int):
         raise HTTPException(status_code=404, detail="User not found.")
 
     # 2) Query the ratings table
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT COUNT(*) FROM ratings WHERE user_id = %s;",
-        (user_id,)
-    )
-    count = cur.fetchone()[0]
-    cur.close()
-    conn.close()
+    with db_cursor() as cur:
+        cur.execute(
+            "SELECT COUNT(*) FROM ratings WHERE user_id = %s;",
+            (user_id,)
+        )
+        count = cur.fetchone()[0]
 
     return {"count": count}
 
@@ -368,19 +642,7 @@ async def login_user(data: Dict[str, Any], response: Response):
     if not isinstance(raw_password, str) or not raw_password:
         raise HTTPException(status_code=400, detail="Password required.")
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT user_id, is_dummy, password_hash, alpha, is_admin
-          FROM users
-         WHERE username = %s;
-        """,
-        (username,)
-    )
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    row = await run_in_threadpool(get_login_record, username)
 
     if row is None:
         raise HTTPException(status_code=404, detail="User not found.")
@@ -396,7 +658,7 @@ async def login_user(data: Dict[str, Any], response: Response):
             raise HTTPException(status_code=500, detail="No password set for this user.")
         if isinstance(stored_hash, memoryview):
             stored_hash = bytes(stored_hash)
-        if not bcrypt.checkpw(raw_password.encode("utf-8"), stored_hash):
+        if not await check_password(raw_password, stored_hash):
             raise HTTPException(status_code=401, detail="Incorrect password.")
 
     # Issue JWT with both user_id and is_admin
@@ -423,7 +685,7 @@ async def logout(response: Response):
     return {"success": True}
 
 @app.put("/users/{user_id}/alpha")
-async def update_user_alpha(user_id: int, data: Dict[str, Any]):
+def update_user_alpha(user_id: int, data: Dict[str, Any]):
     """
     PUT /users/{user_id}/alpha
     Body JSON: { "alpha": float }
@@ -438,32 +700,25 @@ async def update_user_alpha(user_id: int, data: Dict[str, Any]):
         raise HTTPException(status_code=404, detail="User not found.")
 
     # Update in database
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE users SET alpha = %s WHERE user_id = %s;",
-        (new_alpha, user_id)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db_cursor(commit=True) as cur:
+        cur.execute(
+            "UPDATE users SET alpha = %s WHERE user_id = %s;",
+            (new_alpha, user_id)
+        )
     return {"alpha": new_alpha}
 
 @app.get("/users/by-username/{username}")
-async def get_user_by_username(username: str):
+def get_user_by_username(username: str):
     """
     GET /api/users/by-username/{username}
     Returns { "user_id": int } or 404 if not found
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT user_id FROM users WHERE username = %s;",
-        (username,),
-    )
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    with db_cursor() as cur:
+        cur.execute(
+            "SELECT user_id FROM users WHERE username = %s;",
+            (username,),
+        )
+        row = cur.fetchone()
     if not row:
         raise HTTPException(status_code=404, detail=f"User '{username}' not found.")
     return {"user_id": row[0]}
@@ -472,32 +727,28 @@ from fastapi import HTTPException, Depends
 from typing import Dict, Any
 
 @app.get("/users/friends")
-async def list_friends(current_user: int = Depends(get_current_user)):
+def list_friends(current_user: int = Depends(get_current_user)):
     """
     List all friends of the current user.
     Returns: [ { "user_id": int, "username": str }, ... ]
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    print
-    cur.execute(
-        """
-        SELECT u.user_id, u.username
-          FROM friends f
-          JOIN users u ON u.user_id = f.friend_id
-         WHERE f.user_id = %s
-         ORDER BY u.username;
-        """,
-        (current_user,),
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    with db_cursor() as cur:
+        cur.execute(
+            """
+            SELECT u.user_id, u.username
+              FROM friends f
+              JOIN users u ON u.user_id = f.friend_id
+             WHERE f.user_id = %s
+             ORDER BY u.username;
+            """,
+            (current_user,),
+        )
+        rows = cur.fetchall()
 
     return [{"user_id": r[0], "username": r[1]} for r in rows]
 
 @app.post("/users/friends")
-async def add_friend(
+def add_friend(
     data: Dict[str, Any],
     current_user: int = Depends(get_current_user),
 ):
@@ -510,12 +761,9 @@ async def add_friend(
         uname = data.get("friend_username", "").strip()
         if not uname:
             raise HTTPException(status_code=400, detail="Must provide friend_id or friend_username.")
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT user_id FROM users WHERE username = %s;", (uname,))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
+        with db_cursor() as cur:
+            cur.execute("SELECT user_id FROM users WHERE username = %s;", (uname,))
+            row = cur.fetchone()
         if not row:
             raise HTTPException(status_code=404, detail=f"User '{uname}' not found.")
         fid = row[0]
@@ -527,25 +775,21 @@ async def add_friend(
     if not user_exists(fid):
         raise HTTPException(status_code=404, detail=f"User {fid} not found.")
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO friends (user_id, friend_id)
-        VALUES (%s, %s)
-        ON CONFLICT DO NOTHING;
-        """,
-        (current_user, fid),
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db_cursor(commit=True) as cur:
+        cur.execute(
+            """
+            INSERT INTO friends (user_id, friend_id)
+            VALUES (%s, %s)
+            ON CONFLICT DO NOTHING;
+            """,
+            (current_user, fid),
+        )
 
     return {"success": True}
 
 
 @app.delete("/users/friends/{friend_id}")
-async def remove_friend(
+def remove_friend(
     friend_id: int,
     current_user: int = Depends(get_current_user),
 ):
@@ -553,39 +797,33 @@ async def remove_friend(
     DELETE /api/users/friends/{friend_id}
     Removes the mutual friendship AND any friend_requests between the two users.
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # 1) Remove both directions of the friendship
-    cur.execute(
-        """
-        DELETE FROM friends
-         WHERE (user_id = %s AND friend_id = %s)
-            OR (user_id = %s AND friend_id = %s);
-        """,
-        (current_user, friend_id, friend_id, current_user),
-    )
-
-    # 2) Remove any friend_requests between them (any status)
-    cur.execute(
-        """
-        DELETE FROM friend_requests
-         WHERE (from_user_id = %s AND to_user_id = %s)
-            OR (from_user_id = %s AND to_user_id = %s);
-        """,
-        (current_user, friend_id, friend_id, current_user),
-    )
+    with db_cursor(commit=True) as cur:
+        # 1) Remove both directions of the friendship
+        cur.execute(
+            """
+            DELETE FROM friends
+             WHERE (user_id = %s AND friend_id = %s)
+                OR (user_id = %s AND friend_id = %s);
+            """,
+            (current_user, friend_id, friend_id, current_user),
+        )
 
-    conn.commit()
-    cur.close()
-    conn.close()
+        # 2) Remove any friend_requests between them (any status)
+        cur.execute(
+            """
+            DELETE FROM friend_requests
+             WHERE (from_user_id = %s AND to_user_id = %s)
+                OR (from_user_id = %s AND to_user_id = %s);
+            """,
+            (current_user, friend_id, friend_id, current_user),
+        )
 
     return {"success": True}
 
 
 # 1️⃣ Send a friend request
 @app.post("/users/friend_requests")
-async def send_friend_request(
+def send_friend_request(
     data: Dict[str, Any],
     current_user: int = Depends(get_current_user),
 ):
@@ -598,10 +836,9 @@ async def send_friend_request(
         uname = (data.get("friend_username") or "").strip()
         if not uname:
             raise HTTPException(400, "Must provide friend_username or friend_id")
-        conn = get_db_connection(); cur = conn.cursor()
-        cur.execute("SELECT user_id FROM users WHERE username = %s;", (uname,))
-        row = cur.fetchone()
-        cur.close(); conn.close()
+        with db_cursor() as cur:
+            cur.execute("SELECT user_id FROM users WHERE username = %s;", (uname,))
+            row = cur.fetchone()
         if not row:
             raise HTTPException(404, f"User '{uname}' not found.")
         fid = row[0]
@@ -613,8 +850,7 @@ async def send_friend_request(
     if not user_exists(fid):
         raise HTTPException(404, f"User {fid} not found")
 
-    conn = get_db_connection(); cur = conn.cursor()
-    try:
+    with db_cursor(commit=True) as cur:
         cur.execute(
             """
             INSERT INTO friend_requests (from_user_id, to_user_id)
@@ -623,38 +859,34 @@ async def send_friend_request(
             """,
             (current_user, fid),
         )
-        conn.commit()
-    finally:
-        cur.close(); conn.close()
 
     return {"success": True}
 
 
 # 2️⃣ List incoming requests
 @app.get("/users/friend_requests")
-async def list_friend_requests(current_user: int = Depends(get_current_user)):
+def list_friend_requests(current_user: int = Depends(get_current_user)):
     """
     GET /api/users/friend_requests
     Returns a list of pending requests TO me:
       [ { request_id, from_user_id, from_username, created_at }, … ]
     """
-    conn = get_db_connection(); cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT fr.request_id,
-               fr.from_user_id,
-               u.username AS from_username,
-               fr.created_at
-          FROM friend_requests fr
-          JOIN users u ON u.user_id = fr.from_user_id
-         WHERE fr.to_user_id = %s
-           AND fr.status = 'pending'
-         ORDER BY fr.created_at ASC;
-        """,
-        (current_user,),
-    )
-    rows = cur.fetchall()
-    cur.close(); conn.close()
+    with db_cursor() as cur:
+        cur.execute(
+            """
+            SELECT fr.request_id,
+                   fr.from_user_id,
+                   u.username AS from_username,
+                   fr.created_at
+              FROM friend_requests fr
+              JOIN users u ON u.user_id = fr.from_user_id
+             WHERE fr.to_user_id = %s
+               AND fr.status = 'pending'
+             ORDER BY fr.created_at ASC;
+            """,
+            (current_user,),
+        )
+        rows = cur.fetchall()
 
     return [
         {
@@ -669,7 +901,7 @@ async def list_friend_requests(current_user: int = Depends(get_current_user)):
 
 # 3️⃣ Respond to a request
 @app.post("/users/friend_requests/{request_id}/respond")
-async def respond_friend_request(
+def respond_friend_request(
     request_id: int,
     data: Dict[str, Any],
     current_user: int = Depends(get_current_user),
@@ -682,77 +914,64 @@ async def respond_friend_request(
     if not isinstance(accept, bool):
         raise HTTPException(status_code=400, detail="Missing 'accept' boolean")
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # 1) Verify there is a pending request to this user
-    cur.execute(
-        """
-        SELECT from_user_id, to_user_id
-          FROM friend_requests
-         WHERE request_id = %s
-           AND status = 'pending';
-        """,
-        (request_id,),
-    )
-    row = cur.fetchone()
-    if not row:
-        cur.close()
-        conn.close()
-        raise HTTPException(status_code=404, detail="Request not found or already handled")
-
-    fid, tid = row
-    if tid != current_user:
-        cur.close()
-        conn.close()
-        raise HTTPException(status_code=403, detail="Not your request to respond to")
-
-    # 2) If accepted, insert mutual friendship
-    if accept:
+    with db_cursor(commit=True) as cur:
+        # 1) Verify there is a pending request to this user
         cur.execute(
             """
-            INSERT INTO friends (user_id, friend_id)
-            VALUES (%s, %s)
-            ON CONFLICT DO NOTHING;
-            INSERT INTO friends (user_id, friend_id)
-            VALUES (%s, %s)
-            ON CONFLICT DO NOTHING;
+            SELECT from_user_id, to_user_id
+              FROM friend_requests
+             WHERE request_id = %s
+               AND status = 'pending';
             """,
-            (current_user, fid, fid, current_user),
+            (request_id,),
         )
+        row = cur.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Request not found or already handled")
 
-    # 3) Delete the request row regardless of accept/reject
-    cur.execute(
-        "DELETE FROM friend_requests WHERE request_id = %s;",
-        (request_id,),
-    )
+        fid, tid = row
+        if tid != current_user:
+            raise HTTPException(status_code=403, detail="Not your request to respond to")
 
-    conn.commit()
-    cur.close()
-    conn.close()
+        # 2) If accepted, insert mutual friendship
+        if accept:
+            cur.execute(
+                """
+                INSERT INTO friends (user_id, friend_id)
+                VALUES (%s, %s)
+                ON CONFLICT DO NOTHING;
+                INSERT INTO friends (user_id, friend_id)
+                VALUES (%s, %s)
+                ON CONFLICT DO NOTHING;
+                """,
+                (current_user, fid, fid, current_user),
+            )
+
+        # 3) Delete the request row regardless of accept/reject
+        cur.execute(
+            "DELETE FROM friend_requests WHERE request_id = %s;",
+            (request_id,),
+        )
 
     return {"success": True}
 
 @app.get("/users/friend_requests/outgoing")
-async def list_outgoing_requests(current_user: int = Depends(get_current_user)):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT fr.request_id,
-               fr.to_user_id,
-               u.username AS to_username
-          FROM friend_requests fr
-          JOIN users u ON u.user_id = fr.to_user_id
-         WHERE fr.from_user_id = %s
-           AND fr.status = 'pending'
-         ORDER BY fr.created_at;
-        """,
-        (current_user,),
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+def list_outgoing_requests(current_user: int = Depends(get_current_user)):
+    with db_cursor() as cur:
+        cur.execute(
+            """
+            SELECT fr.request_id,
+                   fr.to_user_id,
+                   u.username AS to_username
+              FROM friend_requests fr
+              JOIN users u ON u.user_id = fr.to_user_id
+             WHERE fr.from_user_id = %s
+               AND fr.status = 'pending'
+             ORDER BY fr.created_at;
+            """,
+            (current_user,),
+        )
+        rows = cur.fetchall()
 
     return [
       {"request_id": r[0], "to_user_id": r[1], "to_username": r[2]}
@@ -760,7 +979,7 @@ async def list_outgoing_requests(current_user: int = Depends(get_current_user)):
     ]
 
 @app.post("/chats/send")
-async def send_message(
+def send_message(
     data: Dict[str, Any],
     from_user_id: int = Depends(get_current_user)   # now derived from the session cookie
 ):
@@ -784,19 +1003,8 @@ async def send_message(
     if not user_exists(to_user_id):
         raise HTTPException(status_code=404, detail=f"Recipient user {to_user_id} not found.")
 
-    # 3) Insert into DB
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO messages (from_user_id, to_user_id, text)
-        VALUES (%s, %s, %s);
-        """,
-        (from_user_id, to_user_id, text),
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    # 3) Insert into DB and push to the recipient's open sockets
+    store_message(from_user_id, to_user_id, text)
 
     return {"success": True}
 
@@ -804,103 +1012,127 @@ async def send_message(
 
 
 @app.get("/chats/history")
-async def get_history(
+def get_history(
     peer_id: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = CHAT_HISTORY_PAGE_SIZE,
     current_user: int = Depends(get_current_user),
 ):
     """
-    GET /api/chats/history?user1=<int>&user2=<int>
-    Returns JSON: { "messages": [ { "from": int, "to": int, "text": str, "ts": str }, … ] }
-    Only returns messages where (from = user1 AND to = user2) OR (from = user2 AND to = user1), ordered by timestamp ascending.
+    GET /api/chats/history?peer_id=<int>[&before=<message_id> | &after=<message_id>][&limit=<int>]
+    Returns JSON: {
+      "messages": [ { "message_id": int, "from": int, "to": int, "text": str, "ts": str }, … ],
+      "has_more": bool
+    }
+    Messages between the current user and peer_id, oldest first, one page at a time:
+    without a cursor the latest `limit` messages; `before` pages back through older
+    messages (has_more: older ones remain); `after` fetches what arrived since
+    (has_more: call again with the new newest id).
     """
     user1 = current_user
     user2 = peer_id
 
-    if not isinstance(user1, int) or not isinstance(user2, int):
-        raise HTTPException(status_code=400, detail="user1 and user2 must be integers.")
-    # In a production app, confirm that the caller is either user1 or user2, to prevent snooping.
-    # For now, we assume the front-end won’t lie.
-    if not user_exists(user1) or not user_exists(user2):
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Pass either before or after, not both.")
+    if limit < 1 or limit > CHAT_HISTORY_MAX_PAGE_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"limit must be between 1 and {CHAT_HISTORY_MAX_PAGE_SIZE}."
+        )
+    if not user_exists(user2):
         raise HTTPException(status_code=404, detail="One or both users not found.")
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT from_user_id, to_user_id, text, created_at
-          FROM messages
-         WHERE (from_user_id = %s AND to_user_id = %s)
-            OR (from_user_id = %s AND to_user_id = %s)
-         ORDER BY created_at ASC;
-        """,
-        (user1, user2, user2, user1),
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    rows, has_more = chat_history_page(user1, user2, before=before, after=after, limit=limit)
 
     return {
         "messages": [
             {
-                "from": r[0],
-                "to": r[1],
-                "text": r[2],
-                "ts": r[3].isoformat(),
+                "message_id": r[0],
+                "from": r[1],
+                "to": r[2],
+                "text": r[3],
+                "ts": r[4].isoformat(),
             }
             for r in rows
-        ]
+        ],
+        "has_more": has_more,
     }
 
 @app.get("/chats/unread")
-async def get_unread_messages(current_user: int = Depends(get_current_user)):
+def get_unread_messages(current_user: int = Depends(get_current_user)):
     """
     GET /api/chats/unread
     Returns all messages sent *to* current_user that have not yet been marked seen,
     along with the sender's username. Then marks them seen.
+    Superseded by the /chats/ws push channel; kept for older clients.
     """
-    user_id = current_user
-
-    conn = get_db_connection()
-    cur = conn.cursor()
-    # 1) Select unread messages + sender username
-    cur.execute(
-        """
-        SELECT m.message_id, m.from_user_id, u.username AS from_username, m.text, m.created_at
-          FROM messages m
-          JOIN users u ON u.user_id = m.from_user_id
-         WHERE m.to_user_id = %s
-           AND m.seen = FALSE
-         ORDER BY m.created_at ASC;
-        """,
-        (user_id,),
-    )
-    rows = cur.fetchall()
+    messages = chat_hub.unseen(unread_messages(current_user))
+    # Marked seen by the hub's next batched UPDATE (no write when nothing is new)
+    chat_hub.mark_seen([m["message_id"] for m in messages])
+    return messages
 
-    # 2) Mark them seen
-    cur.execute(
-        "UPDATE messages SET seen = TRUE WHERE to_user_id = %s AND seen = FALSE;",
-        (user_id,),
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
 
-    return [
-        {
-            "message_id":   row[0],
-            "from_user_id": row[1],
-            "from_username": row[2],
-            "text":         row[3],
-            "ts":           row[4].isoformat(),
-        }
-        for row in rows
-    ]
+@app.websocket("/chats/ws")
+async def chat_socket(websocket: WebSocket):
+    """
+    WS /api/chats/ws
+    Pushes messages sent to the logged-in user as they arrive, as JSON objects
+    shaped like /chats/unread items. Unread messages are sent first on connect.
+    Delivered messages are marked seen. Closes with 4401 if not authenticated.
+
+    CORS does not cover WebSockets, and the session cookie is sent with
+    cross-site handshakes too, so a handshake from a browser page on another
+    origin is refused (policy violation) before anything else.
+    """
+    origin = websocket.headers.get("origin")
+    if origin is not None and origin not in origins:
+        await websocket.close(code=1008)
+        return
+
+    try:
+        user_id = await run_in_threadpool(
+            user_from_session_token, websocket.cookies.get("session_token")
+        )
+    except HTTPException:
+        await websocket.close(code=4401)
+        return
+
+    await websocket.accept()
+    queue = chat_hub.subscribe(user_id)
+
+    async def push():
+        backlog = chat_hub.unseen(await run_in_threadpool(unread_messages, user_id))
+        for message in backlog:
+            await websocket.send_json(message)
+        chat_hub.mark_seen([m["message_id"] for m in backlog])
+        while True:
+            message = await queue.get()
+            if message is None:  # too slow to keep up; the client reconnects
+                await websocket.close(code=1013)
+                return
+            await websocket.send_json(message)
+            chat_hub.mark_seen([message["message_id"]])
+
+    async def drain():
+        # Nothing is expected from the client; this just notices it leaving
+        while True:
+            await websocket.receive_text()
+
+    tasks = [asyncio.create_task(push()), asyncio.create_task(drain())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Collect the disconnect (or whatever ended the socket) quietly
+        await asyncio.gather(*tasks, return_exceptions=True)
+        chat_hub.unsubscribe(user_id, queue)
 
 
 @app.get("/movies")
-async def get_movies():
+def get_movies(request: Request, offset: Optional[int] = None, limit: Optional[int] = None):
     """
-    GET /movies
+    GET /movies[?offset=<int>&limit=<int>]
     Returns:
       {
         "movies": [
@@ -908,47 +1140,115 @@ async def get_movies():
           ...
         ]
       }
+    Served from the catalog snapshot with an ETag (send If-None-Match to get a
+    304). With offset/limit only that slice is returned and X-Total-Count
+    carries the full count.
     """
+    check_page(offset, limit)
     try:
-        movies = list_all_movies()
+        snap = catalog.snapshot()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Could not list movies: {e}")
 
-    return {
-        "movies": [
-            {"movie_id": mid, "title": title}
-            for mid, title in movies
-        ]
-    }
+    def body() -> bytes:
+        if offset is None and limit is None:
+            return snap.encoded("movies", lambda: {
+                "movies": [{"movie_id": mid, "title": title} for mid, title in snap.movies]
+            })
+        page = paginate(snap.movies, offset, limit)
+        return json.dumps(
+            {"movies": [{"movie_id": mid, "title": title} for mid, title in page]}
+        ).encode("utf-8")
+
+    return cached_json(
+        request, f"movies-{snap.version}-{offset}-{limit}", body, total=len(snap.movies)
+    )
 
 @app.get("/movies/unrated")
-async def list_unrated_movies(current_user: int = Depends(get_current_user)):
-    """
-    GET /api/movies/unrated
-    Returns all movies that the current user has not yet rated.
-    """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT m.movie_id, m.title
-          FROM movies m
-     LEFT JOIN ratings r
-            ON r.movie_id = m.movie_id
-           AND r.user_id = %s
-         WHERE r.user_id IS NULL
-         ORDER BY m.title
-        """,
-        (current_user,),
+def list_unrated_movies(
+    request: Request,
+    offset: Optional[int] = None,
+    limit: Optional[int] = None,
+    current_user: int = Depends(get_current_user),
+):
+    """
+    GET /api/movies/unrated[?offset=<int>&limit=<int>]
+    Returns all movies that the current user has not yet rated, ordered by title.
+    Computed from the catalog snapshot minus the user's (cached) rated ids;
+    supports If-None-Match and offset/limit like /movies.
+    """
+    check_page(offset, limit)
+    snap = catalog.snapshot()
+    rated = catalog.rated_ids(current_user)
+    unrated = [mid for mid in snap.by_title if mid not in rated]
+    # frozenset hashes of ints are stable across processes, so ETags match on every worker
+    rated_tag = format(hash(rated) & 0xFFFFFFFFFFFF, "x")
+
+    def body() -> bytes:
+        page = paginate(unrated, offset, limit)
+        return json.dumps(
+            [{"movie_id": mid, "title": snap.titles[mid]} for mid in page]
+        ).encode("utf-8")
+
+    return cached_json(
+        request,
+        f"unrated-{snap.version}-{rated_tag}-{len(rated)}-{offset}-{limit}",
+        body,
+        total=len(unrated),
     )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
 
-    return [{"movie_id": mid, "title": t} for mid, t in rows]
+@app.get("/movies/search")
+def search_movies(
+    request: Request,
+    q: str,
+    limit: int = 20,
+    exclude_rated: bool = False,
+):
+    """
+    GET /api/movies/search?q=<text>[&limit=<int>][&exclude_rated=true]
+    Returns: { "movies": [ { "movie_id": int, "title": str }, ... ] }, best match first.
+    Case- and accent-insensitive; every word of `q` must occur in the title.
+    exclude_rated=true (requires login) leaves out movies the user already rated.
+    """
+    if limit < 1 or limit > 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100.")
+    exclude = catalog.rated_ids(get_current_user(request)) if exclude_rated else ()
+
+    title_index.sync(catalog.snapshot())
+    results = title_index.search(q, limit=limit, exclude=exclude)
+    return {"movies": [{"movie_id": mid, "title": title} for mid, title in results]}
+
+@app.get("/movies/trending")
+def trending_movies(
+    request: Request,
+    kind: str = "trending",
+    genre_id: Optional[int] = None,
+    limit: int = 20,
+    exclude_rated: bool = False,
+):
+    """
+    GET /api/movies/trending[?kind=trending|top][&genre_id=<int>][&limit=<int>][&exclude_rated=true]
+    Returns: { "movies": [ { "movie_id": int, "title": str }, ... ] }, best first.
+    kind=trending: most rated recently (time-decayed count);
+    kind=top:      best rated recently (Bayesian average of decayed ratings).
+    exclude_rated=true (requires login) leaves out movies the user already rated.
+    """
+    if kind not in popularity.KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(popularity.KINDS)}.")
+    if limit < 1 or limit > 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100.")
+    if not popularity.index.ready:
+        raise HTTPException(status_code=503, detail="Popularity index is loading.", headers={"Retry-After": "5"})
+    exclude = catalog.rated_ids(get_current_user(request)) if exclude_rated else ()
+
+    titles = catalog.snapshot().titles
+    movie_ids = popularity.index.top(limit, genre_id=genre_id, kind=kind, exclude=exclude)
+    return {"movies": [
+        {"movie_id": mid, "title": titles[mid]} for mid in movie_ids if mid in titles
+    ]}
 
 @app.post("/ratings")
-async def rate_movie(
+def rate_movie(
     data: Dict[str, Any],
     current_user: int = Depends(get_current_user),
 ):
@@ -976,6 +1276,48 @@ async def rate_movie(
 
     return {"success": True}
 
+@app.post("/ratings/bulk")
+def rate_movies_bulk(
+    data: Dict[str, Any],
+    current_user: int = Depends(get_current_user),
+):
+    """
+    POST /api/ratings/bulk
+    Body JSON: { "ratings": [ { "movie_id": int, "rating": int }, ... ] }
+    Saves all ratings in one transaction (all or nothing); if a movie appears
+    more than once the last rating wins. Uses session cookie to identify user.
+    Returns: { "success": true, "saved": <number of distinct movies> }
+    """
+    items = data.get("ratings")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="ratings must be a non-empty list.")
+    if len(items) > RATINGS_BULK_MAX:
+        raise HTTPException(
+            status_code=400, detail=f"At most {RATINGS_BULK_MAX} ratings per request."
+        )
+
+    titles = catalog.snapshot().titles
+    ratings: Dict[int, int] = {}
+    for i, item in enumerate(items):
+        movie_id = item.get("movie_id") if isinstance(item, dict) else None
+        rating = item.get("rating") if isinstance(item, dict) else None
+        if not isinstance(movie_id, int) or movie_id <= 0:
+            raise HTTPException(status_code=400, detail=f"ratings[{i}]: invalid movie_id.")
+        if movie_id not in titles:
+            raise HTTPException(status_code=400, detail=f"ratings[{i}]: movie {movie_id} does not exist.")
+        if not isinstance(rating, int) or not (1 <= rating <= 5):
+            raise HTTPException(status_code=400, detail=f"ratings[{i}]: rating must be 1–5.")
+        ratings[movie_id] = rating
+
+    try:
+        add_or_update_ratings(current_user, list(ratings.items()))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not save ratings: {e}")
+
+    return {"success": True, "saved": len(ratings)}
+
 class MovieWithGenres(BaseModel):
     title: str
     release_date: str               # e.g. "01-Jan-2000"
@@ -987,76 +1329,107 @@ class MovieWithGenres(BaseModel):
             raise ValueError("Each genre ID must be a positive integer")
         return v
 
-def get_current_admin(
-    user_id: int = Depends(get_current_user)   # <-- only depends on get_current_user
-):
+def _save_movies(movies: List[MovieWithGenres]) -> List[int]:
     """
-    Ensures the logged-in user is an admin.
+    Validates genres against the cached catalog, inserts the movies in one
+    transaction and makes them visible to the catalog, search and recommender.
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            "SELECT is_admin FROM users WHERE user_id = %s;",
-            (user_id,),
-        )
-        row = cur.fetchone()
-    finally:
-        cur.close()
-        conn.close()
+    genre_names = dict(catalog.snapshot().genres)
+    for i, movie in enumerate(movies):
+        for gid in movie.genres:
+            if gid not in genre_names:
+                where = f"movies[{i}]: " if len(movies) > 1 else ""
+                raise HTTPException(400, f"{where}Genre {gid} does not exist.")
 
-    if not row or not row[0]:
-        raise HTTPException(status_code=403, detail="Admin privileges required.")
+    try:
+        movie_ids = insert_movies([(m.title, m.release_date, m.genres) for m in movies])
+    except Exception as e:
+        raise HTTPException(500, detail=f"Could not add movies: {e}")
 
-    return user_id
+    catalog.add_movies([(movie_id, m.title) for movie_id, m in zip(movie_ids, movies)])
+    popularity.index.add_movies([(movie_id, m.genres) for movie_id, m in zip(movie_ids, movies)])
+    alg.add_movies([
+        (movie_id, m.title, [genre_names[gid] for gid in m.genres], m.release_date)
+        for movie_id, m in zip(movie_ids, movies)
+    ])
+    return movie_ids
 
 @app.post("/admin/movies")
-async def add_movie(
+def add_movie(
     data: MovieWithGenres,
     user_id: int = Depends(get_current_admin)
 ):
-    print(data)
     """
     Admin-only: add a new movie (auto movie_id), then assign its genres.
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        # 1) Insert into movies
-        cur.execute(
-            """
-            INSERT INTO movies (title, release_date)
-            VALUES (%s, %s)
-            RETURNING movie_id;
-            """,
-            (data.title, data.release_date),
-        )
-        movie_id = cur.fetchone()[0]
-
-        # 2) Insert into movie_genres
-        for gid in data.genres:
-            # verify genre exists
-            cur.execute("SELECT 1 FROM genres WHERE genre_id = %s;", (gid,))
-            if cur.fetchone() is None:
-                raise HTTPException(400, f"Genre {gid} does not exist.")
-            cur.execute(
-                """
-                INSERT INTO movie_genres (movie_id, genre_id)
-                VALUES (%s, %s)
-                ON CONFLICT DO NOTHING;
-                """,
-                (movie_id, gid),
-            )
+    movie_id = _save_movies([data])[0]
+    return {"success": True, "movie_id": movie_id}
 
-        conn.commit()
-    except HTTPException:
-        conn.rollback()
-        raise
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(500, detail=f"Could not add movie: {e}")
-    finally:
-        cur.close()
-        conn.close()
-
-    return {"success": True, "movie_id": movie_id}
\ No newline at end of file
+def _parse_movie_csv(body: bytes) -> List[Dict[str, Any]]:
+    """
+    UTF-8 CSV with a header row: title,release_date,genres
+    genres holds genre ids or names separated by "|", e.g. "1|Comedy".
+    Blocking (catalog snapshot), so run it in the threadpool.
+    """
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        raise HTTPException(400, f"CSV is not valid UTF-8: {e}")
+    genre_ids = {name.lower(): gid for gid, name in catalog.snapshot().genres}
+    items = []
+    try:
+        rows = list(csv.DictReader(io.StringIO(text)))
+    except csv.Error as e:
+        raise HTTPException(400, f"Malformed CSV: {e}")
+    for line, row in enumerate(rows, start=2):
+        genres = []
+        for genre in filter(None, (g.strip() for g in (row.get("genres") or "").split("|"))):
+            if genre.isdigit():
+                genres.append(int(genre))
+            elif genre.lower() in genre_ids:
+                genres.append(genre_ids[genre.lower()])
+            else:
+                raise HTTPException(400, f"line {line}: unknown genre {genre!r}.")
+        items.append({
+            "title": (row.get("title") or "").strip(),
+            "release_date": (row.get("release_date") or "").strip(),
+            "genres": genres,
+        })
+    return items
+
+@app.post("/admin/movies/import")
+async def import_movies(
+    request: Request,
+    user_id: int = Depends(get_current_admin)
+):
+    """
+    Admin-only: add many movies at once.
+    Body is either JSON { "movies": [ { "title", "release_date", "genres": [int] }, ... ] }
+    or, with Content-Type: text/csv, a CSV file (see _parse_movie_csv).
+    All movies are inserted or none. Up to ADMIN_IMPORT_MAX movies per request.
+    Returns: { "success": true, "movie_ids": [int, ...] } in input order.
+    """
+    if request.headers.get("content-type", "").startswith("text/csv"):
+        items = await run_in_threadpool(_parse_movie_csv, await request.body())
+    else:
+        try:
+            items = (await request.json()).get("movies")
+        except (ValueError, AttributeError):
+            raise HTTPException(400, "Body must be JSON {\"movies\": [...]} or text/csv.")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(400, "No movies to import.")
+    if len(items) > ADMIN_IMPORT_MAX:
+        raise HTTPException(400, f"At most {ADMIN_IMPORT_MAX} movies per import.")
+
+    movies = []
+    for i, item in enumerate(items):
+        try:
+            movie = MovieWithGenres(**item)
+        except (ValidationError, TypeError) as e:
+            raise HTTPException(400, f"movies[{i}]: {e}")
+        if not movie.title:
+            raise HTTPException(400, f"movies[{i}]: title is required.")
+        movies.append(movie)
+
+    movie_ids = await run_in_threadpool(_save_movies, movies)
+    return {"success": True, "movie_ids": movie_ids}
\ No newline at end of file
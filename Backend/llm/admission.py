@@ -0,0 +1,220 @@
+"""
+admission.py
+
+Admission control in front of every Ollama call.
+
+At most LLM_MAX_CONCURRENT generations run at once. Everything else waits in a
+bounded queue ordered by priority (emotion > recommendation comments > free
+chat > background work) and, within a priority, round-robin across users so
+one busy client can't starve the rest. When the queue is full the caller is
+rejected immediately (429 if that user already has too much queued, 503 if the
+whole queue is full) instead of piling more work onto the model runner.
+
+The "user" is taken from a context variable set per request by
+FairnessKeyMiddleware (session cookie, else client address).
+"""
+
+import asyncio
+import contextvars
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException
+
+EMOTION, RECOMMENDATION, CHAT, BACKGROUND = 0, 1, 2, 3
+PRIORITY_NAMES = {EMOTION: "emotion", RECOMMENDATION: "recommendation",
+                  CHAT: "chat", BACKGROUND: "background"}
+
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+LLM_MAX_QUEUE_PER_USER = int(os.getenv("LLM_MAX_QUEUE_PER_USER", "4"))
+# Longest a request may wait for a slot before giving up with 503.
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+
+user_key: contextvars.ContextVar[str] = contextvars.ContextVar("llm_user_key", default="anonymous")
+
+
+class FairnessKeyMiddleware:
+    """ASGI middleware: tags each request with a per-user key for fair queueing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            key = None
+            for name, value in scope.get("headers", []):
+                if name == b"cookie" and b"session_token=" in value:
+                    key = value.split(b"session_token=", 1)[1].split(b";", 1)[0][-24:].decode("latin-1")
+                    break
+            if key is None and scope.get("client"):
+                key = scope["client"][0]
+            user_key.set(key or "anonymous")
+        await self.app(scope, receive, send)
+
+
+class _Waiter:
+    __slots__ = ("future", "enqueued_at", "priority", "user")
+
+    def __init__(self, future: asyncio.Future, priority: int, user: str):
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.priority = priority
+        self.user = user
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, max_queue: int, max_queue_per_user: int,
+                 queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        # priority → (user → their waiters); OrderedDict order is the round-robin order
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Waiter]]"] = {
+            p: OrderedDict() for p in PRIORITY_NAMES
+        }
+        self._queued = 0
+        self._queued_per_user: Dict[str, int] = {}
+
+        self.admitted = {p: 0 for p in PRIORITY_NAMES}
+        self.rejected_user = 0
+        self.rejected_full = 0
+        self.timeouts = 0
+        self._wait_total = {p: 0.0 for p in PRIORITY_NAMES}
+        self._wait_max = {p: 0.0 for p in PRIORITY_NAMES}
+
+    def ensure_capacity(self, user: Optional[str] = None) -> None:
+        """Raises 429/503 right away if a new request from `user` would be rejected."""
+        if self.in_flight < self.max_concurrent:
+            return
+        user = user or user_key.get()
+        if self._queued_per_user.get(user, 0) >= self.max_queue_per_user:
+            self.rejected_user += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many AI requests from you in progress, please wait.",
+                headers={"Retry-After": "2"},
+            )
+        if self._queued >= self.max_queue:
+            self.rejected_full += 1
+            raise HTTPException(
+                status_code=503,
+                detail="The AI assistant is busy, please try again shortly.",
+                headers={"Retry-After": "5"},
+            )
+
+    def _record_admit(self, priority: int, waited: float) -> None:
+        self.admitted[priority] += 1
+        self._wait_total[priority] += waited
+        self._wait_max[priority] = max(self._wait_max[priority], waited)
+
+    def _dequeue(self, waiter: _Waiter) -> None:
+        users = self._queues[waiter.priority]
+        waiters = users.get(waiter.user)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del users[waiter.user]
+            self._queued -= 1
+            left = self._queued_per_user[waiter.user] - 1
+            if left:
+                self._queued_per_user[waiter.user] = left
+            else:
+                del self._queued_per_user[waiter.user]
+
+    async def acquire(self, priority: int, user: Optional[str] = None) -> None:
+        user = user or user_key.get()
+        if self.in_flight < self.max_concurrent and self._queued == 0:
+            self.in_flight += 1
+            self._record_admit(priority, 0.0)
+            return
+
+        self.ensure_capacity(user)
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), priority, user)
+        self._queues[priority].setdefault(user, deque()).append(waiter)
+        self._queued += 1
+        self._queued_per_user[user] = self._queued_per_user.get(user, 0) + 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._dequeue(waiter)
+            if waiter.future.done():
+                # Granted at the last moment; keep the slot
+                return
+            self.timeouts += 1
+            raise HTTPException(
+                status_code=503,
+                detail="The AI assistant is busy, please try again shortly.",
+                headers={"Retry-After": "5"},
+            )
+        except asyncio.CancelledError:
+            self._dequeue(waiter)
+            if waiter.future.done():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """Frees a slot and hands it to the next waiter (priority, then round-robin)."""
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            if not users:
+                continue
+            user, waiters = next(iter(users.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                users.move_to_end(user)
+            else:
+                del users[user]
+            self._queued -= 1
+            left = self._queued_per_user[user] - 1
+            if left:
+                self._queued_per_user[user] = left
+            else:
+                del self._queued_per_user[user]
+            # in_flight stays the same: the slot passes straight to the waiter
+            self._record_admit(priority, time.perf_counter() - waiter.enqueued_at)
+            waiter.future.set_result(None)
+            return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int, user: Optional[str] = None):
+        await self.acquire(priority, user)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        per_priority = {}
+        for p, name in PRIORITY_NAMES.items():
+            admitted = self.admitted[p]
+            per_priority[name] = {
+                "queued": sum(len(w) for w in self._queues[p].values()),
+                "admitted": admitted,
+                "wait_avg_ms": 1000 * self._wait_total[p] / admitted if admitted else 0.0,
+                "wait_max_ms": 1000 * self._wait_max[p],
+            }
+        return {
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "queue_depth": self._queued,
+            "queue_limit": self.max_queue,
+            "rejected_429": self.rejected_user,
+            "rejected_503": self.rejected_full,
+            "timeouts": self.timeouts,
+            "by_priority": per_priority,
+        }
+
+
+controller = AdmissionController(
+    LLM_MAX_CONCURRENT, LLM_MAX_QUEUE, LLM_MAX_QUEUE_PER_USER, LLM_QUEUE_TIMEOUT
+)
+slot = controller.slot
+ensure_capacity = controller.ensure_capacity
+stats = controller.stats
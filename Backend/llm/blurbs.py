@@ -0,0 +1,376 @@
+"""
+blurbs.py
+
+LLM-generated movie blurbs ("recommendation or fun fact about X") with a
+two-tier cache:
+  1. in-memory LRU (BLURB_CACHE_SIZE entries)
+  2. on-disk SQLite store (BLURB_CACHE_PATH), shared across restarts/workers
+
+Entries are keyed by (movie_id, model, PROMPT_VERSION), so changing the model
+or bumping PROMPT_VERSION after editing the prompt naturally misses.
+
+A background warmer pre-generates blurbs for the movies the recommender
+returns most often.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from collections import Counter, OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from llm import admission, routing
+from llm.providers import LLMProvider
+from singleflight import AsyncSingleFlight
+
+BLURB_MODEL = routing.model_for(routing.BLURB)
+# Bump whenever the prompt in blurb_messages() changes.
+PROMPT_VERSION = 1
+
+BLURB_CACHE_SIZE = int(os.getenv("BLURB_CACHE_SIZE", "512"))
+BLURB_CACHE_PATH = os.getenv(
+    "BLURB_CACHE_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "data", "blurb_cache.sqlite3"),
+)
+# Warmer: every BLURB_WARM_INTERVAL seconds, make sure the BLURB_WARM_TOP most
+# recommended movies have a cached blurb.
+BLURB_WARM_INTERVAL = float(os.getenv("BLURB_WARM_INTERVAL", "300"))
+BLURB_WARM_TOP = int(os.getenv("BLURB_WARM_TOP", "20"))
+# Max blurb generations in flight against Ollama at once (match OLLAMA_NUM_PARALLEL).
+BLURB_CONCURRENCY = int(os.getenv("BLURB_CONCURRENCY", "4"))
+
+CacheKey = Tuple[int, str, int]
+
+
+def blurb_messages(movie: str) -> list:
+    return [
+        {"role": "system", "content": "You are a movie expert assistant."},
+        {
+            "role": "user",
+            "content": (
+                f"Based on my algorithm, the predicted movie is '{movie}'. "
+                "Provide a concise recommendation or fun fact about this movie."
+            ),
+        },
+    ]
+
+
+async def stream_movie_response(client: LLMProvider, movie: str) -> AsyncIterator[str]:
+    """
+    Uses Ollama chat (streaming) to get a short recommendation/fun fact about `movie`.
+    Yields the reply piece by piece as the model generates it.
+    """
+    messages = blurb_messages(movie)
+    async for chunk in await routing.chat(client, routing.BLURB, messages, stream=True):
+        yield chunk["message"]["content"]
+
+
+async def movie_response_str(client: LLMProvider, movie: str) -> str:
+    """
+    Returns the full concatenated recommendation/fun fact about `movie` (uncached).
+    """
+    full = ""
+    async for piece in stream_movie_response(client, movie):
+        full += piece
+    return full.strip()
+
+
+class BlurbCache:
+    """
+    In-memory LRU in front of a SQLite table. Each entry also remembers how
+    long it took to generate, so hits can be reported as saved LLM time.
+
+    Lookups are async: LRU hits are answered right away, SQLite reads and
+    writes run in a worker thread so they never block the event loop.
+    """
+
+    def __init__(self, path: str, capacity: int):
+        self.capacity = capacity
+        self._memory: "OrderedDict[CacheKey, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()      # LRU and counters
+        self._db_lock = threading.Lock()   # the SQLite connection
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS blurbs (
+                movie_id       INTEGER NOT NULL,
+                model          TEXT    NOT NULL,
+                prompt_version INTEGER NOT NULL,
+                text           TEXT    NOT NULL,
+                gen_seconds    REAL    NOT NULL,
+                created_at     REAL    NOT NULL,
+                PRIMARY KEY (movie_id, model, prompt_version)
+            )
+            """
+        )
+        self._db.commit()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.generated = 0
+        self.generation_seconds = 0.0
+
+    def _remember(self, key: CacheKey, value: Tuple[str, float]) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def peek(self, key: CacheKey) -> Optional[str]:
+        """The blurb if it is in the in-memory LRU (no disk access)."""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is None:
+                return None
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            self.saved_seconds += value[1]
+            return value[0]
+
+    def _disk_get(self, key: CacheKey) -> Optional[Tuple[str, float]]:
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT text, gen_seconds FROM blurbs "
+                "WHERE movie_id = ? AND model = ? AND prompt_version = ?;",
+                key,
+            ).fetchone()
+
+    def _disk_put(self, key: CacheKey, text: str, gen_seconds: float) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO blurbs "
+                "(movie_id, model, prompt_version, text, gen_seconds, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?);",
+                (*key, text, gen_seconds, time.time()),
+            )
+            self._db.commit()
+
+    async def get(self, key: CacheKey) -> Optional[str]:
+        text = self.peek(key)
+        if text is not None:
+            return text
+
+        row = await asyncio.to_thread(self._disk_get, key)
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self._remember(key, (row[0], row[1]))
+            self.disk_hits += 1
+            self.saved_seconds += row[1]
+            return row[0]
+
+    async def contains(self, key: CacheKey) -> bool:
+        """Like get() but without touching the hit/miss counters."""
+        with self._lock:
+            if key in self._memory:
+                return True
+        return await asyncio.to_thread(self._disk_get, key) is not None
+
+    async def put(self, key: CacheKey, text: str, gen_seconds: float) -> None:
+        with self._lock:
+            self._remember(key, (text, gen_seconds))
+            self.generated += 1
+            self.generation_seconds += gen_seconds
+        await asyncio.to_thread(self._disk_put, key, text, gen_seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "generated": self.generated,
+                "avg_generation_seconds": (
+                    self.generation_seconds / self.generated if self.generated else 0.0
+                ),
+                "saved_generation_seconds": self.saved_seconds,
+            }
+
+
+cache = BlurbCache(BLURB_CACHE_PATH, BLURB_CACHE_SIZE)
+
+# How often each movie has been returned by the recommender (movie_id → count),
+# plus its title so the warmer can build the prompt.
+_recommended: Counter = Counter()
+_titles: Dict[int, str] = {}
+_recommended_lock = threading.Lock()
+# Identical concurrent generations (same cache key) share one Ollama call
+_flights = AsyncSingleFlight("blurbs")
+# Created lazily so it binds to the running event loop
+_generation_slots: Optional[asyncio.Semaphore] = None
+
+
+def _slots() -> asyncio.Semaphore:
+    global _generation_slots
+    if _generation_slots is None:
+        _generation_slots = asyncio.Semaphore(BLURB_CONCURRENCY)
+    return _generation_slots
+
+
+def cache_key(movie_id: int) -> CacheKey:
+    return (int(movie_id), BLURB_MODEL, PROMPT_VERSION)
+
+
+def note_recommended(movie_id: int, title: str) -> None:
+    """Records that the recommender returned this movie (feeds the warmer)."""
+    with _recommended_lock:
+        _recommended[int(movie_id)] += 1
+        _titles[int(movie_id)] = title
+
+
+async def get_blurb(client: LLMProvider, movie_id: int, title: str) -> str:
+    """
+    Returns the blurb for `movie_id`, from cache if possible, otherwise
+    generating and storing it.
+    """
+    text = await cache.get(cache_key(movie_id))
+    if text is not None:
+        return text
+    return await _generate(client, movie_id, title)
+
+
+async def _generate(
+    client: LLMProvider, movie_id: int, title: str, priority: int = admission.RECOMMENDATION
+) -> str:
+    """
+    Generates (under the concurrency cap) and caches a fresh blurb. If the same
+    blurb is already being generated, waits for that generation instead.
+    """
+    async def generate() -> str:
+        async with _slots(), admission.slot(priority):
+            start = time.perf_counter()
+            text = await movie_response_str(client, title)
+        if text:
+            await cache.put(cache_key(movie_id), text, time.perf_counter() - start)
+        return text
+
+    return await _flights.do(cache_key(movie_id), generate)
+
+
+async def iter_blurbs(
+    client: LLMProvider, movies: List[Tuple[int, str]]
+) -> AsyncIterator[Tuple[int, Optional[str]]]:
+    """
+    Yields (movie_id, blurb) for every (movie_id, title) in `movies` as soon as
+    each one is ready: cached blurbs first, then fresh generations running
+    concurrently. One call has at most LLM_MAX_QUEUE_PER_USER of them waiting
+    for admission at a time (all share the caller's fairness key), so a long
+    list queues behind itself instead of being rejected with 429. A failed
+    generation yields None for that movie instead of aborting the rest.
+    """
+    pending = []
+    for movie_id, title in movies:
+        text = await cache.get(cache_key(movie_id))
+        if text is not None:
+            yield movie_id, text
+        else:
+            pending.append((movie_id, title))
+
+    per_request = asyncio.Semaphore(max(1, min(BLURB_CONCURRENCY, admission.LLM_MAX_QUEUE_PER_USER)))
+
+    async def one(movie_id: int, title: str) -> Tuple[int, Optional[str]]:
+        try:
+            async with per_request:
+                return movie_id, await _generate(client, movie_id, title)
+        except Exception:
+            traceback.print_exc()
+            return movie_id, None
+
+    tasks = [asyncio.create_task(one(mid, title)) for mid, title in pending]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def stream_blurb(client: LLMProvider, movie_id: int, title: str) -> AsyncIterator[str]:
+    """
+    Streaming variant of get_blurb(): a cached blurb is yielded in one piece,
+    otherwise the generation is streamed through and cached once complete.
+    The streaming caller leads the single-flight for the blurb, so concurrent
+    requests for it (streamed or not) wait for its result instead of starting
+    their own generation; if the leader fails or its client goes away, they
+    get the error.
+    """
+    key = cache_key(movie_id)
+    text = await cache.get(key)
+    # No await between the in-flight check and the claim: they are atomic on the loop
+    flight = _flights.claim(key) if text is None else None
+    if text is None and flight is None:
+        # Someone is already generating this blurb; share their result
+        text = await _generate(client, movie_id, title)
+    if text is not None:
+        yield text
+        return
+
+    start = time.perf_counter()
+    full = ""
+    try:
+        async with _slots(), admission.slot(admission.RECOMMENDATION):
+            async for piece in stream_movie_response(client, title):
+                full += piece
+                yield piece
+    except BaseException as e:
+        flight.set_exception(e if isinstance(e, Exception) else RuntimeError("blurb stream abandoned"))
+        raise
+    text = full.strip()
+    flight.set_result(text)
+    if text:
+        await cache.put(key, text, time.perf_counter() - start)
+
+
+async def warm_popular(client: LLMProvider, top_k: int = BLURB_WARM_TOP) -> int:
+    """
+    Generates blurbs for the `top_k` most recommended movies that are not
+    cached yet. Returns how many were generated.
+    """
+    with _recommended_lock:
+        popular = [(mid, _titles[mid]) for mid, _ in _recommended.most_common(top_k)]
+
+    generated = 0
+    for movie_id, title in popular:
+        if await cache.contains(cache_key(movie_id)):
+            continue
+        if await _generate(client, movie_id, title, priority=admission.BACKGROUND):
+            generated += 1
+    return generated
+
+
+async def run_warmer(get_client, interval: float = BLURB_WARM_INTERVAL) -> None:
+    """
+    Background task: periodically pre-generates blurbs for popular movies.
+    `get_client` is called each round so the task always uses the live client.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        client = get_client()
+        if client is None:
+            continue
+        try:
+            generated = await warm_popular(client)
+            if generated:
+                print(f"Blurb warmer: generated {generated} blurb(s)")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            traceback.print_exc()
+
+
+def stats() -> dict:
+    return {
+        **cache.stats(),
+        "tracked_movies": len(_recommended),
+        "single_flight": _flights.stats(),
+    }
@@ -0,0 +1,261 @@
+"""
+chat_sessions.py
+
+Server-side chat sessions for /chat.
+
+Instead of the client resending its whole history every turn, the server keeps
+each conversation and sends Ollama as little as possible:
+
+  * While the conversation fits the token budget we continue from the
+    `context` Ollama returned on the previous turn, so only the new user
+    message is sent and the model doesn't re-read the transcript.
+  * Once it grows past the budget, older turns are folded into a rolling
+    summary (generated in the background, after the reply has been sent) and
+    the next turn starts fresh from summary + the last CHAT_KEEP_TURNS turns.
+
+Time-to-first-token is recorded per mode so the stateless (full history)
+path and the session paths can be compared in /metrics.
+"""
+
+import asyncio
+import os
+import statistics
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Dict, List, Optional
+
+from llm import admission, routing
+from llm.providers import LLMProvider
+
+CHAT_MODEL = routing.model_for(routing.CHAT)
+SYSTEM_PROMPT = (
+    "You are Filmbuddy, a friendly movie assistant. Keep answers short and "
+    "helpful, and remember what the user told you about their tastes."
+)
+
+# Verbatim turns (user + assistant messages) kept after compaction.
+CHAT_KEEP_TURNS = int(os.getenv("CHAT_KEEP_TURNS", "8"))
+# Rough prompt budget (tokens) before older turns are summarized.
+CHAT_TOKEN_BUDGET = int(os.getenv("CHAT_TOKEN_BUDGET", "2048"))
+CHAT_SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", "1800"))
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "1000"))
+
+_TTFT_SAMPLES = 200
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting
+    return len(text) // 4 + 1
+
+
+class ChatSession:
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.turns: List[Dict[str, str]] = []
+        self.summary = ""
+        # Token context returned by Ollama for the conversation so far
+        self.context: Optional[List[int]] = None
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+        # A summary is being generated (at most one at a time)
+        self.compacting = False
+
+    def prompt_tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(
+            estimate_tokens(t["content"]) for t in self.turns
+        )
+
+    def render_prompt(self, user_text: str) -> str:
+        """Transcript used when there is no reusable context."""
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of the conversation so far: {self.summary}")
+        for turn in self.turns[-CHAT_KEEP_TURNS:]:
+            speaker = "User" if turn["role"] == "user" else "Assistant"
+            parts.append(f"{speaker}: {turn['content']}")
+        parts.append(f"User: {user_text}")
+        return "\n".join(parts)
+
+
+_sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+_ttft: Dict[str, deque] = {}
+_compactions = 0
+_compaction_tasks: set = set()
+
+
+def _record_ttft(mode: str, seconds: float) -> None:
+    _ttft.setdefault(mode, deque(maxlen=_TTFT_SAMPLES)).append(seconds)
+
+
+async def _timed(mode: str, pieces: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Passes `pieces` through, recording time until the first non-empty one."""
+    start = time.perf_counter()
+    first = True
+    async for piece in pieces:
+        if first and piece:
+            _record_ttft(mode, time.perf_counter() - start)
+            first = False
+        yield piece
+
+
+def get_session(session_id: Optional[str]) -> ChatSession:
+    """Returns the live session for `session_id`, or a brand-new one."""
+    now = time.monotonic()
+    # Expire idle sessions (oldest first)
+    while _sessions:
+        oldest = next(iter(_sessions.values()))
+        if now - oldest.updated_at < CHAT_SESSION_TTL and len(_sessions) < CHAT_MAX_SESSIONS:
+            break
+        _sessions.popitem(last=False)
+
+    session = _sessions.get(session_id) if session_id else None
+    if session is None:
+        session = ChatSession(uuid.uuid4().hex)
+        _sessions[session.session_id] = session
+    _sessions.move_to_end(session.session_id)
+    session.updated_at = now
+    return session
+
+
+def end_session(session_id: str) -> bool:
+    return _sessions.pop(session_id, None) is not None
+
+
+async def stream_chat_response(
+    client: LLMProvider, history: List[Dict[str, str]]
+) -> AsyncIterator[str]:
+    """
+    Stateless path: uses Ollama chat (streaming) to reply given a Slack‐style
+    `history` of messages. Yields the assistant reply piece by piece.
+    """
+    async def pieces():
+        async for chunk in await routing.chat(client, routing.CHAT, history, stream=True):
+            yield chunk["message"]["content"]
+
+    async with admission.slot(admission.CHAT):
+        async for piece in _timed("full_history", pieces()):
+            yield piece
+
+
+async def chat_response(client: LLMProvider, history: List[Dict[str, str]]) -> str:
+    """
+    Returns the full concatenated assistant reply for `history`.
+    """
+    full = ""
+    async for piece in stream_chat_response(client, history):
+        full += piece
+    return full.strip()
+
+
+async def _summarize(client: LLMProvider, session: ChatSession) -> None:
+    """
+    Folds all but the last CHAT_KEEP_TURNS turns into session.summary.
+
+    The lock is only held to copy the turns and to swap the result in, not
+    while the summary waits for a BACKGROUND slot and generates; otherwise
+    the user's next turn would queue behind background work. Turns added in
+    the meantime are kept.
+    """
+    global _compactions
+    async with session.lock:
+        old = session.turns[:-CHAT_KEEP_TURNS]
+        if not old or session.compacting:
+            return
+        session.compacting = True
+        summary = session.summary
+
+    try:
+        transcript = "\n".join(f"{t['role']}: {t['content']}" for t in old)
+        prompt = (
+            "Summarize this conversation between a user and a movie assistant in at most "
+            "five sentences. Keep names of movies, genres and the user's preferences.\n\n"
+            f"Earlier summary: {summary or '(none)'}\n\n{transcript}"
+        )
+        try:
+            async with admission.slot(admission.BACKGROUND):
+                response = await routing.generate(client, routing.CHAT, prompt)
+        except Exception:
+            traceback.print_exc()
+            return
+
+        async with session.lock:
+            # Only appends happen while compacting, so the summarized turns are still first
+            session.summary = (response.get("response") or "").strip()
+            session.turns = session.turns[len(old):]
+            session.context = None
+            _compactions += 1
+    finally:
+        session.compacting = False
+
+
+async def stream_session_reply(
+    client: LLMProvider, session: ChatSession, user_text: str
+) -> AsyncIterator[str]:
+    """
+    Streams the assistant reply to `user_text` within `session`, updating the
+    stored history/context once the reply is complete.
+    """
+    async with session.lock:
+        if session.context is not None:
+            mode, prompt, context = "session_context", user_text, session.context
+        else:
+            mode, prompt, context = "session_rebuild", session.render_prompt(user_text), None
+
+        full = ""
+        new_context = None
+        async with admission.slot(admission.CHAT):
+            stream = await routing.generate(
+                client, routing.CHAT, prompt, system=SYSTEM_PROMPT, context=context, stream=True
+            )
+
+            async def pieces():
+                nonlocal new_context
+                async for chunk in stream:
+                    if chunk.get("done"):
+                        new_context = chunk.get("context")
+                    yield chunk.get("response") or ""
+
+            async for piece in _timed(mode, pieces()):
+                full += piece
+                yield piece
+
+        session.turns.append({"role": "user", "content": user_text})
+        session.turns.append({"role": "assistant", "content": full.strip()})
+        session.context = list(new_context) if new_context else None
+        session.updated_at = time.monotonic()
+
+        over_budget = (
+            session.prompt_tokens() > CHAT_TOKEN_BUDGET
+            or (session.context is not None and len(session.context) > CHAT_TOKEN_BUDGET)
+        )
+
+    if over_budget and len(session.turns) > CHAT_KEEP_TURNS:
+        task = asyncio.create_task(_summarize(client, session))
+        _compaction_tasks.add(task)
+        task.add_done_callback(_compaction_tasks.discard)
+
+
+async def session_reply(client: LLMProvider, session: ChatSession, user_text: str) -> str:
+    full = ""
+    async for piece in stream_session_reply(client, session, user_text):
+        full += piece
+    return full.strip()
+
+
+def stats() -> dict:
+    ttft = {}
+    for mode, samples in _ttft.items():
+        values = sorted(samples)
+        ttft[mode] = {
+            "samples": len(values),
+            "avg_ms": 1000 * statistics.fmean(values),
+            "p50_ms": 1000 * values[len(values) // 2],
+            "p95_ms": 1000 * values[min(len(values) - 1, int(0.95 * len(values)))],
+        }
+    return {
+        "active_sessions": len(_sessions),
+        "compactions": _compactions,
+        "time_to_first_token": ttft,
+    }
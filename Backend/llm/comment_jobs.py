@@ -0,0 +1,283 @@
+"""
+comment_jobs.py
+
+Background queue for recommendation comments (LLM blurbs), so /recommend/top
+can answer as soon as the recommender is done and hand out a job id for the
+comment instead.
+
+Jobs live in a small SQLite table (COMMENT_JOBS_PATH), so unfinished work is
+picked up again after a restart. Worker tasks run on the event loop; each job
+gets COMMENT_JOB_TIMEOUT seconds, after which it is completed with a canned
+blurb rather than left hanging. Store access goes through asyncio.to_thread.
+
+Several API processes can share the store, so every unfinished job is claimed
+by the process that queued it (claimed_by / claimed_at). Each process renews
+its claims every COMMENT_JOB_HEARTBEAT seconds. Only jobs whose claim is older
+than COMMENT_JOB_CLAIM_TTL (their process is gone) are taken over and re-queued,
+at startup and on every heartbeat.
+"""
+
+import asyncio
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable, Dict, Optional
+
+from llm import blurbs
+from llm.providers import LLMProvider
+
+COMMENT_JOBS_PATH = os.getenv(
+    "COMMENT_JOBS_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "data", "comment_jobs.sqlite3"),
+)
+COMMENT_JOB_WORKERS = int(os.getenv("COMMENT_JOB_WORKERS", "2"))
+COMMENT_JOB_TIMEOUT = float(os.getenv("COMMENT_JOB_TIMEOUT", "60"))
+# Finished jobs are forgotten after this many seconds.
+COMMENT_JOB_RETENTION = float(os.getenv("COMMENT_JOB_RETENTION", "86400"))
+# How often wait() re-reads a job that another worker process is running.
+COMMENT_JOB_POLL_INTERVAL = float(os.getenv("COMMENT_JOB_POLL_INTERVAL", "1"))
+# Claims on unfinished jobs are renewed this often, and expire after COMMENT_JOB_CLAIM_TTL.
+COMMENT_JOB_HEARTBEAT = float(os.getenv("COMMENT_JOB_HEARTBEAT", "10"))
+COMMENT_JOB_CLAIM_TTL = float(os.getenv("COMMENT_JOB_CLAIM_TTL", "60"))
+
+# Identifies this process in claimed_by
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+QUEUED, RUNNING, DONE, FALLBACK = "queued", "running", "done", "fallback"
+
+
+def fallback_comment(title: str) -> str:
+    return f"{title} is our top pick for you right now. We think you'll enjoy it!"
+
+
+class CommentJobStore:
+    """SQLite-backed job table; all methods are safe to call from any thread."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS comment_jobs (
+                job_id      TEXT PRIMARY KEY,
+                movie_id    INTEGER NOT NULL,
+                title       TEXT    NOT NULL,
+                status      TEXT    NOT NULL,
+                comment     TEXT,
+                created_at  REAL    NOT NULL,
+                finished_at REAL,
+                claimed_by  TEXT,
+                claimed_at  REAL
+            )
+            """
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(comment_jobs);")}
+        for column, kind in (("claimed_by", "TEXT"), ("claimed_at", "REAL")):
+            if column not in columns:  # store created before claims existed
+                self._db.execute(f"ALTER TABLE comment_jobs ADD COLUMN {column} {kind};")
+        self._db.commit()
+
+    def create(self, movie_id: int, title: str, status: str = QUEUED,
+               comment: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO comment_jobs "
+                "(job_id, movie_id, title, status, comment, created_at, finished_at, claimed_by, claimed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);",
+                (job_id, movie_id, title, status, comment, now,
+                 now if comment is not None else None, WORKER_ID, now),
+            )
+            self._db.commit()
+        return job_id
+
+    def set_status(self, job_id: str, status: str, comment: Optional[str] = None) -> None:
+        """Updates the job, (re)claiming it for this process."""
+        now = time.time()
+        finished = now if status in (DONE, FALLBACK) else None
+        with self._lock:
+            self._db.execute(
+                "UPDATE comment_jobs SET status = ?, comment = ?, finished_at = ?, "
+                "claimed_by = ?, claimed_at = ? WHERE job_id = ?;",
+                (status, comment, finished, WORKER_ID, now, job_id),
+            )
+            self._db.commit()
+
+    def heartbeat(self) -> None:
+        """Renews this process's claims on its unfinished jobs."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE comment_jobs SET claimed_at = ? "
+                "WHERE claimed_by = ? AND status IN (?, ?);",
+                (time.time(), WORKER_ID, QUEUED, RUNNING),
+            )
+            self._db.commit()
+
+    def claim_stale(self, ttl: float) -> list:
+        """
+        Claims the unfinished jobs whose claim expired `ttl` seconds ago (or
+        that were never claimed) and returns them, oldest first. One UPDATE,
+        so two processes never take over the same job.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute(
+                "UPDATE comment_jobs SET claimed_by = ?, claimed_at = ? "
+                "WHERE status IN (?, ?) AND (claimed_at IS NULL OR claimed_at < ?) "
+                "RETURNING job_id, movie_id, title, created_at;",
+                (WORKER_ID, now, QUEUED, RUNNING, now - ttl),
+            ).fetchall()
+            self._db.commit()
+        return [row[:3] for row in sorted(rows, key=lambda row: row[3])]
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT job_id, movie_id, title, status, comment FROM comment_jobs WHERE job_id = ?;",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("job_id", "movie_id", "title", "status", "comment"), row))
+
+    def purge(self, older_than: float) -> None:
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM comment_jobs WHERE finished_at IS NOT NULL AND finished_at < ?;",
+                (time.time() - older_than,),
+            )
+            self._db.commit()
+
+
+store = CommentJobStore(COMMENT_JOBS_PATH)
+
+_queue: Optional[asyncio.Queue] = None
+_done_events: Dict[str, asyncio.Event] = {}
+_stats = {"submitted": 0, "completed": 0, "fallbacks": 0, "timeouts": 0, "reclaimed": 0}
+
+
+async def submit(movie_id: int, title: str) -> Dict:
+    """
+    Creates a comment job for the movie and returns its current state.
+    A blurb that is already in the in-memory cache completes the job
+    immediately (one on disk is picked up by the worker without generating).
+    """
+    _stats["submitted"] += 1
+    cached = blurbs.cache.peek(blurbs.cache_key(movie_id))
+    if cached is not None:
+        job_id = await asyncio.to_thread(store.create, movie_id, title, status=DONE, comment=cached)
+        _stats["completed"] += 1
+        return {"job_id": job_id, "status": DONE, "comment": cached}
+
+    job_id = await asyncio.to_thread(store.create, movie_id, title)
+    _done_events[job_id] = asyncio.Event()
+    _queue.put_nowait((job_id, movie_id, title))
+    return {"job_id": job_id, "status": QUEUED, "comment": None}
+
+
+def get(job_id: str) -> Optional[Dict]:
+    return store.get(job_id)
+
+
+async def wait(job_id: str, timeout: float,
+               poll_interval: float = COMMENT_JOB_POLL_INTERVAL) -> Optional[Dict]:
+    """
+    Waits up to `timeout` seconds for the job to finish, then returns its state
+    (None if the job is gone). Jobs queued in this process are awaited on their
+    done event; a job submitted by another worker process on the shared store
+    has none, so its row is polled every `poll_interval` seconds instead.
+    """
+    event = _done_events.get(job_id)
+    if event is not None:
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return await asyncio.to_thread(store.get, job_id)
+
+    deadline = time.monotonic() + timeout
+    while True:
+        job = await asyncio.to_thread(store.get, job_id)
+        remaining = deadline - time.monotonic()
+        if job is None or job["status"] in (DONE, FALLBACK) or remaining <= 0:
+            return job
+        await asyncio.sleep(min(poll_interval, remaining))
+
+
+async def _run_job(client: LLMProvider, job_id: str, movie_id: int, title: str) -> None:
+    await asyncio.to_thread(store.set_status, job_id, RUNNING)
+    status, comment = FALLBACK, fallback_comment(title)
+    if client is not None:
+        try:
+            text = await asyncio.wait_for(
+                blurbs.get_blurb(client, movie_id, title), COMMENT_JOB_TIMEOUT
+            )
+            if text:
+                status, comment = DONE, text
+        except asyncio.TimeoutError:
+            _stats["timeouts"] += 1
+        except Exception:
+            traceback.print_exc()
+
+    await asyncio.to_thread(store.set_status, job_id, status, comment)
+    _stats["completed"] += 1
+    if status == FALLBACK:
+        _stats["fallbacks"] += 1
+    event = _done_events.pop(job_id, None)
+    if event is not None:
+        event.set()
+
+
+async def _worker(get_client: Callable[[], Optional[LLMProvider]]) -> None:
+    while True:
+        job_id, movie_id, title = await _queue.get()
+        try:
+            await _run_job(get_client(), job_id, movie_id, title)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            traceback.print_exc()
+        finally:
+            _queue.task_done()
+
+
+def _requeue(jobs: list) -> None:
+    for job_id, movie_id, title in jobs:
+        if job_id not in _done_events:
+            _done_events[job_id] = asyncio.Event()
+            _queue.put_nowait((job_id, movie_id, title))
+            _stats["reclaimed"] += 1
+
+
+async def _heartbeat() -> None:
+    """Keeps this process's claims alive and takes over jobs of dead processes."""
+    while True:
+        await asyncio.sleep(COMMENT_JOB_HEARTBEAT)
+        try:
+            await asyncio.to_thread(store.heartbeat)
+            _requeue(await asyncio.to_thread(store.claim_stale, COMMENT_JOB_CLAIM_TTL))
+        except Exception:
+            traceback.print_exc()
+
+
+def start(get_client: Callable[[], Optional[LLMProvider]]) -> list:
+    """
+    Starts the worker tasks (call from the app lifespan) and re-queues the
+    unfinished jobs no live process holds (claim expired). Returns the tasks so
+    they can be cancelled.
+    """
+    global _queue
+    _queue = asyncio.Queue()
+    store.purge(COMMENT_JOB_RETENTION)
+    _requeue(store.claim_stale(COMMENT_JOB_CLAIM_TTL))
+    tasks = [asyncio.create_task(_worker(get_client)) for _ in range(COMMENT_JOB_WORKERS)]
+    return tasks + [asyncio.create_task(_heartbeat())]
+
+
+def stats() -> dict:
+    return {**_stats, "queued": _queue.qsize() if _queue is not None else 0}
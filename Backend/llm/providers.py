@@ -0,0 +1,212 @@
+"""
+providers.py
+
+The LLM backend behind every AI feature, chosen with LLM_PROVIDER:
+
+  * "ollama" (default): the local Ollama server, over one shared pool of
+    keep-alive HTTP connections instead of a new connection per call.
+  * "stub": a deterministic in-process fake with configurable latency, token
+    rate and failure injection, so the API can be load-tested (and run in CI)
+    without a GPU, a model download or the network.
+
+Both expose the subset of the Ollama client API the app uses (chat, generate,
+pull) with the same arguments and response shapes, so callers don't care which
+one they got.
+"""
+
+import abc
+import asyncio
+import hashlib
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+from ollama import AsyncClient, ResponseError
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "ollama")
+
+# Ollama HTTP connection pool
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "16"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "300"))
+OLLAMA_REQUEST_TIMEOUT = float(os.getenv("OLLAMA_REQUEST_TIMEOUT", "300"))
+
+# Stub behaviour
+LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "50"))      # time to first token
+LLM_STUB_TOKENS_PER_SEC = float(os.getenv("LLM_STUB_TOKENS_PER_SEC", "200"))
+LLM_STUB_REPLY_TOKENS = int(os.getenv("LLM_STUB_REPLY_TOKENS", "40"))
+LLM_STUB_FAILURE_RATE = float(os.getenv("LLM_STUB_FAILURE_RATE", "0"))
+LLM_STUB_SEED = int(os.getenv("LLM_STUB_SEED", "0"))
+
+
+class LLMProvider(abc.ABC):
+    """Interface shared by all backends (mirrors ollama.AsyncClient)."""
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def chat(self, model: str, messages: List[Dict[str, str]], stream: bool = False, **kwargs):
+        ...
+
+    @abc.abstractmethod
+    async def generate(self, model: str, prompt: str = "", stream: bool = False, **kwargs):
+        ...
+
+    @abc.abstractmethod
+    async def pull(self, model: str) -> Dict[str, Any]:
+        ...
+
+    async def aclose(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"provider": self.name}
+
+
+class OllamaProvider(LLMProvider):
+    name = "ollama"
+
+    def __init__(self, host: str):
+        self.host = host
+        limits = httpx.Limits(
+            max_connections=OLLAMA_MAX_CONNECTIONS,
+            max_keepalive_connections=OLLAMA_MAX_CONNECTIONS,
+            keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY,
+        )
+        self._client = AsyncClient(host=host, timeout=OLLAMA_REQUEST_TIMEOUT, limits=limits)
+
+    async def chat(self, model, messages, stream=False, **kwargs):
+        return await self._client.chat(model=model, messages=messages, stream=stream, **kwargs)
+
+    async def generate(self, model, prompt="", stream=False, **kwargs):
+        return await self._client.generate(model=model, prompt=prompt, stream=stream, **kwargs)
+
+    async def pull(self, model):
+        return await self._client.pull(model)
+
+    async def aclose(self) -> None:
+        await self._client.close()
+
+
+_WORDS = (
+    "a", "classic", "film", "with", "great", "characters", "and", "a", "story", "that",
+    "keeps", "you", "watching", "until", "the", "end", "fans", "of", "the", "genre",
+    "will", "enjoy", "its", "sharp", "dialogue", "memorable", "score", "and", "twists",
+)
+
+
+class StubProvider(LLMProvider):
+    """
+    Deterministic fake: the reply depends only on (model, prompt), arrives after
+    `latency_ms` and then streams at `tokens_per_sec`. A `failure_rate` fraction
+    of calls raise ollama.ResponseError (decided by a seeded RNG, so runs repeat).
+    Prompts asking for a single number get a number, so /emotion parses.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency_ms: float = LLM_STUB_LATENCY_MS,
+                 tokens_per_sec: float = LLM_STUB_TOKENS_PER_SEC,
+                 reply_tokens: int = LLM_STUB_REPLY_TOKENS,
+                 failure_rate: float = LLM_STUB_FAILURE_RATE,
+                 seed: int = LLM_STUB_SEED):
+        self.latency = latency_ms / 1000.0
+        self.token_interval = 1.0 / tokens_per_sec if tokens_per_sec > 0 else 0.0
+        self.reply_tokens = reply_tokens
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+
+    def _tokens(self, model: str, prompt: str) -> List[str]:
+        digest = hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).digest()
+        if "FLOAT NUMBER" in prompt.upper():
+            return [f"{digest[0] / 255:.2f}"]
+        rng = random.Random(digest)
+        words = [rng.choice(_WORDS) for _ in range(self.reply_tokens)]
+        words[0] = words[0].capitalize()
+        return [w + ("." if i == len(words) - 1 else " ") for i, w in enumerate(words)]
+
+    async def _run(self, model: str, prompt: str) -> AsyncIterator[str]:
+        self.calls += 1
+        fail = self._rng.random() < self.failure_rate
+        await asyncio.sleep(self.latency)
+        if fail:
+            self.failures += 1
+            raise ResponseError("stub provider: injected failure", 500)
+        for token in self._tokens(model, prompt):
+            yield token
+            if self.token_interval:
+                await asyncio.sleep(self.token_interval)
+
+    @staticmethod
+    def _done_fields(tokens: int, prompt: str, started: float) -> Dict[str, Any]:
+        elapsed = int((time.perf_counter() - started) * 1e9)
+        return {
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": elapsed,
+            "prompt_eval_count": len(prompt) // 4 + 1,
+            "eval_count": tokens,
+            "eval_duration": elapsed,
+        }
+
+    async def chat(self, model, messages, stream=False, **kwargs):
+        prompt = "\n".join(m.get("content", "") for m in messages)
+
+        async def chunks():
+            started = time.perf_counter()
+            count = 0
+            async for token in self._run(model, prompt):
+                count += 1
+                yield {"model": model, "message": {"role": "assistant", "content": token}, "done": False}
+            yield {"model": model, "message": {"role": "assistant", "content": ""},
+                   **self._done_fields(count, prompt, started)}
+
+        if stream:
+            return chunks()
+        content, last = "", None
+        async for chunk in chunks():
+            content += chunk["message"]["content"]
+            last = chunk
+        return {**last, "message": {"role": "assistant", "content": content}}
+
+    async def generate(self, model, prompt="", stream=False, context: Optional[List[int]] = None, **kwargs):
+        system = kwargs.get("system") or ""
+        full_prompt = f"{system}\n{prompt}" if system else prompt
+
+        async def chunks():
+            started = time.perf_counter()
+            count = 0
+            if prompt:
+                async for token in self._run(model, full_prompt):
+                    count += 1
+                    yield {"model": model, "response": token, "done": False}
+            # Fake token context that grows like a real one would
+            new_context = list(context or []) + list(range(len(full_prompt) // 4 + count))
+            yield {"model": model, "response": "", "context": new_context,
+                   **self._done_fields(count, full_prompt, started)}
+
+        if stream:
+            return chunks()
+        response, last = "", None
+        async for chunk in chunks():
+            response += chunk["response"]
+            last = chunk
+        return {**last, "response": response}
+
+    async def pull(self, model):
+        return {"status": "success"}
+
+    def stats(self):
+        return {"provider": self.name, "calls": self.calls, "injected_failures": self.failures}
+
+
+def create_provider(host: str) -> LLMProvider:
+    """Builds the provider selected by LLM_PROVIDER."""
+    if LLM_PROVIDER == "stub":
+        return StubProvider()
+    if LLM_PROVIDER != "ollama":
+        raise ValueError(f"Unknown LLM_PROVIDER {LLM_PROVIDER!r} (expected 'ollama' or 'stub')")
+    return OllamaProvider(host)
@@ -0,0 +1,117 @@
+"""
+routing.py
+
+Per-task model routing. Each kind of LLM work names the model it runs on:
+
+  * emotion – one-number classification, fine on a small quantized model
+  * blurb   – short recommendation comments
+  * chat    – open conversation (and its summaries), keeps the big model
+
+Every call goes out with the same keep_alive the warm-up task uses, so all
+routed models stay resident in Ollama instead of evicting each other, and its
+latency and token throughput (from Ollama's eval_count / eval_duration) are
+recorded per task for /metrics.
+"""
+
+import os
+import statistics
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List
+
+from llm.providers import LLMProvider
+from server.ollama_server import OLLAMA_KEEP_ALIVE
+
+EMOTION, BLURB, CHAT = "emotion", "blurb", "chat"
+
+MODELS = {
+    EMOTION: os.getenv("LLM_MODEL_EMOTION", "llama3.2:1b"),
+    BLURB: os.getenv("LLM_MODEL_BLURB", "llama3.1"),
+    CHAT: os.getenv("LLM_MODEL_CHAT", "llama3.1"),
+}
+
+_SAMPLES = 200
+_latency: Dict[str, deque] = {task: deque(maxlen=_SAMPLES) for task in MODELS}
+_tokens_per_sec: Dict[str, deque] = {task: deque(maxlen=_SAMPLES) for task in MODELS}
+_calls = {task: 0 for task in MODELS}
+_tokens = {task: 0 for task in MODELS}
+
+
+def model_for(task: str) -> str:
+    return MODELS[task]
+
+
+def models() -> List[str]:
+    """Distinct models in use (what the warm-up task keeps loaded)."""
+    return sorted(set(MODELS.values()))
+
+
+def _record(task: str, started: float, final: Any) -> None:
+    _calls[task] += 1
+    _latency[task].append(time.perf_counter() - started)
+    if final is None:
+        return
+    count = final.get("eval_count") or 0
+    duration = final.get("eval_duration") or 0
+    _tokens[task] += count
+    if count and duration:
+        _tokens_per_sec[task].append(count / (duration / 1e9))
+
+
+async def _recorded(task: str, started: float, stream: AsyncIterator) -> AsyncIterator:
+    final = None
+    async for chunk in stream:
+        if chunk.get("done"):
+            final = chunk
+        yield chunk
+    _record(task, started, final)
+
+
+async def chat(client: LLMProvider, task: str, messages: List[Dict[str, str]],
+               stream: bool = False, **kwargs):
+    """client.chat() on the task's model; same return value as the client."""
+    started = time.perf_counter()
+    response = await client.chat(
+        model=MODELS[task], messages=messages, stream=stream, keep_alive=OLLAMA_KEEP_ALIVE, **kwargs
+    )
+    if stream:
+        return _recorded(task, started, response)
+    _record(task, started, response)
+    return response
+
+
+async def generate(client: LLMProvider, task: str, prompt: str, stream: bool = False, **kwargs):
+    """client.generate() on the task's model; same return value as the client."""
+    started = time.perf_counter()
+    response = await client.generate(
+        model=MODELS[task], prompt=prompt, stream=stream, keep_alive=OLLAMA_KEEP_ALIVE, **kwargs
+    )
+    if stream:
+        return _recorded(task, started, response)
+    _record(task, started, response)
+    return response
+
+
+def _summary(values) -> Dict[str, float]:
+    values = sorted(values)
+    if not values:
+        return {}
+    return {
+        "avg": statistics.fmean(values),
+        "p50": values[len(values) // 2],
+        "p95": values[min(len(values) - 1, int(0.95 * len(values)))],
+    }
+
+
+def stats() -> dict:
+    out = {}
+    for task, model in MODELS.items():
+        latency = _summary(_latency[task])
+        out[task] = {
+            "model": model,
+            "calls": _calls[task],
+            "tokens": _tokens[task],
+            "latency_ms": {k: 1000 * v for k, v in latency.items()},
+            "tokens_per_sec": _summary(_tokens_per_sec[task]),
+        }
+    return out
@@ -0,0 +1,216 @@
+"""
+sentiment.py
+
+Tiered emotion scoring for /emotion (0.0 = very negative, 1.0 = very positive):
+
+  1. memo      – previously scored text (normalized) is answered from an LRU.
+  2. lexicon   – a tiny in-process word lexicon with negation/intensifier
+                 handling. Answers in microseconds when the signal is clear.
+  3. LLM       – ambiguous or mixed text falls back to an Ollama generate call.
+
+A small sample of confident lexicon answers is also sent to the LLM in the
+background so we can track how often the two tiers agree.
+"""
+
+import asyncio
+import os
+import random
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from llm import admission, routing
+from llm.providers import LLMProvider
+
+EMOTION_MODEL = routing.model_for(routing.EMOTION)
+
+SENTIMENT_MEMO_SIZE = int(os.getenv("SENTIMENT_MEMO_SIZE", "2048"))
+# Lexicon answers need at least this much net evidence to skip the LLM.
+SENTIMENT_CONFIDENCE = float(os.getenv("SENTIMENT_CONFIDENCE", "1.5"))
+# Fraction of confident lexicon answers double-checked by the LLM.
+SENTIMENT_AUDIT_RATE = float(os.getenv("SENTIMENT_AUDIT_RATE", "0.05"))
+# Two scores "agree" if they're within this distance of each other.
+AGREEMENT_TOLERANCE = 0.25
+
+_POSITIVE = {
+    "good": 1.0, "great": 1.5, "awesome": 2.0, "amazing": 2.0, "fantastic": 2.0,
+    "wonderful": 2.0, "excellent": 2.0, "happy": 1.5, "glad": 1.0, "joy": 1.5,
+    "joyful": 1.5, "love": 1.5, "loving": 1.5, "excited": 1.5, "exciting": 1.5,
+    "fun": 1.0, "funny": 1.0, "cheerful": 1.5, "relaxed": 1.0, "calm": 0.5,
+    "chill": 0.5, "nice": 1.0, "cool": 0.5, "best": 1.5, "delighted": 2.0,
+    "thrilled": 2.0, "optimistic": 1.5, "grateful": 1.5, "content": 1.0,
+    "energetic": 1.0, "pumped": 1.5, "ecstatic": 2.5, "laugh": 1.0, "smile": 1.0,
+    "celebrate": 1.5, "celebrating": 1.5, "fine": 0.5, "okay": 0.3, "ok": 0.3,
+}
+_NEGATIVE = {
+    "bad": 1.0, "sad": 1.5, "unhappy": 1.5, "depressed": 2.5, "depressing": 2.0,
+    "angry": 2.0, "mad": 1.5, "furious": 2.5, "upset": 1.5, "terrible": 2.0,
+    "awful": 2.0, "horrible": 2.0, "tired": 1.0, "exhausted": 1.5, "bored": 1.0,
+    "boring": 1.0, "lonely": 1.5, "anxious": 1.5, "stressed": 1.5, "stress": 1.0,
+    "worried": 1.5, "scared": 1.5, "afraid": 1.5, "hate": 2.0, "miserable": 2.5,
+    "cry": 1.5, "crying": 1.5, "down": 0.5, "blue": 0.5, "heartbroken": 2.5,
+    "annoyed": 1.0, "frustrated": 1.5, "sick": 1.0, "worst": 2.0, "gloomy": 1.5,
+    "meh": 0.5, "grief": 2.5, "hurt": 1.5,
+}
+_NEGATIONS = {"not", "no", "never", "isnt", "dont", "doesnt", "didnt", "cant",
+              "wont", "aint", "nothing", "hardly", "barely"}
+_INTENSIFIERS = {"very": 1.5, "really": 1.5, "so": 1.3, "super": 1.7,
+                 "extremely": 2.0, "incredibly": 2.0, "quite": 1.2, "bit": 0.6,
+                 "slightly": 0.6, "little": 0.7}
+
+_TOKEN_RE = re.compile(r"[a-z']+")
+_FLOAT_RE = re.compile(r"[-+]?\d*\.\d+|[-+]?\d+")
+
+_memo: "OrderedDict[str, float]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {
+    "memo_hits": 0,
+    "lexicon_answers": 0,
+    "llm_answers": 0,
+    "llm_parse_failures": 0,
+    "audits": 0,
+    "agreements": 0,
+}
+_audit_tasks: set = set()
+
+
+def normalize(text: str) -> str:
+    """Lower-cases and collapses whitespace/punctuation; used as the memo key."""
+    return " ".join(_TOKEN_RE.findall(text.lower().replace("’", "'")))
+
+
+def lexicon_score(text: str) -> Tuple[float, bool]:
+    """
+    Scores normalized `text` with the word lexicon.
+    Returns (score in [0, 1], confident).
+    """
+    pos = neg = 0.0
+    negate_left = 0
+    boost = 1.0
+    for raw in text.split():
+        tok = raw.replace("'", "")
+        if tok in _NEGATIONS or raw.endswith("n't"):
+            negate_left = 3
+            continue
+        if tok in _INTENSIFIERS:
+            boost *= _INTENSIFIERS[tok]
+            continue
+
+        weight = 0.0
+        if tok in _POSITIVE:
+            weight = _POSITIVE[tok]
+        elif tok in _NEGATIVE:
+            weight = -_NEGATIVE[tok]
+        if weight:
+            weight *= boost
+            if negate_left:
+                # "not happy" is negative, but "not bad" is only mildly positive
+                weight = -weight * 0.5
+            if weight > 0:
+                pos += weight
+            else:
+                neg -= weight
+        boost = 1.0
+        negate_left = max(0, negate_left - 1)
+
+    net = pos - neg
+    score = 0.5 + 0.5 * (net / (abs(net) + 2.0))
+    mixed = pos > 0 and neg > 0 and min(pos, neg) > 0.5 * max(pos, neg)
+    confident = abs(net) >= SENTIMENT_CONFIDENCE and not mixed
+    return score, confident
+
+
+async def interpret_emotion(
+    client: LLMProvider, user_text: str, priority: int = admission.EMOTION
+) -> Optional[float]:
+    """
+    Calls Ollama to interpret the user's emotion (0.0–1.0).
+    Returns None if the reply contained no usable number.
+    """
+    prompt = (
+        "You are an analysis assistant.\n"
+        "ALWAYS RESPOND ONLY WITH A SINGLE FLOAT NUMBER BETWEEN 0.0 AND 1.0 FOR EMOTIONS, POSITIVE IS BIGGER.\n"
+        f"User input: \"{user_text}\""
+    )
+    async with admission.slot(priority):
+        response = await routing.generate(client, routing.EMOTION, prompt)
+    match = _FLOAT_RE.search(response.get("response") or "")
+    if match is None:
+        with _lock:
+            _stats["llm_parse_failures"] += 1
+        return None
+    # Clamp to [0.0, 1.0]
+    return max(0.0, min(1.0, float(match.group())))
+
+
+def _remember(key: str, score: float) -> None:
+    with _lock:
+        _memo[key] = score
+        _memo.move_to_end(key)
+        while len(_memo) > SENTIMENT_MEMO_SIZE:
+            _memo.popitem(last=False)
+
+
+def _record_agreement(lexicon: float, llm: Optional[float]) -> None:
+    if llm is None:
+        return
+    with _lock:
+        _stats["audits"] += 1
+        if abs(lexicon - llm) <= AGREEMENT_TOLERANCE:
+            _stats["agreements"] += 1
+
+
+async def _audit(client: LLMProvider, text: str, lexicon: float) -> None:
+    try:
+        _record_agreement(
+            lexicon, await interpret_emotion(client, text, priority=admission.BACKGROUND)
+        )
+    except Exception:
+        pass
+
+
+async def score_emotion(client: LLMProvider, user_text: str) -> Tuple[float, str]:
+    """
+    Returns (emotion score in [0, 1], tier that answered: "memo" | "lexicon" | "llm").
+    """
+    key = normalize(user_text)
+    with _lock:
+        cached = _memo.get(key)
+        if cached is not None:
+            _memo.move_to_end(key)
+            _stats["memo_hits"] += 1
+            return cached, "memo"
+
+    lexicon, confident = lexicon_score(key)
+    if confident:
+        with _lock:
+            _stats["lexicon_answers"] += 1
+        _remember(key, lexicon)
+        if client is not None and random.random() < SENTIMENT_AUDIT_RATE:
+            task = asyncio.create_task(_audit(client, user_text, lexicon))
+            _audit_tasks.add(task)
+            task.add_done_callback(_audit_tasks.discard)
+        return lexicon, "lexicon"
+
+    llm = await interpret_emotion(client, user_text)
+    with _lock:
+        _stats["llm_answers"] += 1
+    if llm is None:
+        # Unparseable reply: fall back to the lexicon's best guess (0.5 if no signal)
+        return lexicon, "llm"
+    if lexicon != 0.5:
+        # The lexicon saw some signal, so this is a free agreement sample
+        _record_agreement(lexicon, llm)
+    _remember(key, llm)
+    return llm, "llm"
+
+
+def stats() -> dict:
+    with _lock:
+        audits = _stats["audits"]
+        return {
+            **_stats,
+            "memo_entries": len(_memo),
+            "agreement_rate": _stats["agreements"] / audits if audits else None,
+        }
@@ -0,0 +1,171 @@
+"""
+rating_events.py
+
+In-process stream of rating writes, so the structures derived from ratings
+(rated-id cache, recommender fold-in, popularity counters, ...) are updated
+from the writes themselves instead of rediscovering them with table scans.
+
+  * add_or_update_rating(s) publish one event per saved rating after commit.
+  * Inline consumers run right away in the publishing thread; they are for
+    cheap in-memory updates that the next request must already see.
+  * Batched consumers run on a dispatcher thread, in micro-batches of up to
+    RATING_EVENT_BATCH events collected over at most RATING_EVENT_LINGER_MS.
+  * The buffer holds at most RATING_EVENT_QUEUE_SIZE events. When it is full
+    new events are dropped (and counted): Postgres stays the source of truth,
+    and consumers catch up on the user's next event or the next model rebuild.
+  * With RATING_EVENT_LOG set, every batch is appended to that file as JSON
+    lines (flushed and fsynced once per batch) for offline training/replay.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+RATING_EVENT_QUEUE_SIZE = int(os.getenv("RATING_EVENT_QUEUE_SIZE", "10000"))
+RATING_EVENT_BATCH = int(os.getenv("RATING_EVENT_BATCH", "500"))
+RATING_EVENT_LINGER_MS = float(os.getenv("RATING_EVENT_LINGER_MS", "50"))
+RATING_EVENT_LOG = os.getenv("RATING_EVENT_LOG", "")
+
+
+class RatingEvent(NamedTuple):
+    user_id: int
+    movie_id: int
+    rating: int
+    ts: float
+    # Set when the write replaced an earlier rating of the same movie
+    previous_rating: Optional[int] = None
+    previous_ts: Optional[float] = None
+
+
+Consumer = Callable[[List[RatingEvent]], None]
+
+
+def by_user(events: Iterable[RatingEvent]) -> Dict[int, List[RatingEvent]]:
+    grouped: Dict[int, List[RatingEvent]] = {}
+    for event in events:
+        grouped.setdefault(event.user_id, []).append(event)
+    return grouped
+
+
+def read_log(path: str = RATING_EVENT_LOG) -> Iterable[RatingEvent]:
+    """Replays the events stored in a RATING_EVENT_LOG file, oldest first."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield RatingEvent(**json.loads(line))
+
+
+class RatingBus:
+    def __init__(self):
+        self._queue: "queue.Queue[Optional[RatingEvent]]" = queue.Queue(maxsize=RATING_EVENT_QUEUE_SIZE)
+        self._inline: List[Consumer] = []
+        self._batched: List[Consumer] = []
+        self._thread: Optional[threading.Thread] = None
+        self._log = None
+        self.stats_counters = {
+            "published": 0, "dropped": 0, "batches": 0,
+            "dispatched": 0, "consumer_errors": 0,
+        }
+
+    def subscribe(self, consumer: Consumer, inline: bool = False) -> None:
+        (self._inline if inline else self._batched).append(consumer)
+
+    def _run(self, consumer: Consumer, events: List[RatingEvent]) -> None:
+        try:
+            consumer(events)
+        except Exception:
+            self.stats_counters["consumer_errors"] += 1
+            traceback.print_exc()
+
+    def publish(self, user_id: int, ratings: Iterable[tuple]) -> None:
+        """
+        Publishes saved ratings by `user_id`: (movie_id, rating) pairs, or
+        (movie_id, rating, previous_rating, previous_ts) for re-ratings.
+        Never blocks.
+        """
+        now = time.time()
+        events = [RatingEvent(user_id, movie_id, rating, now, *previous)
+                  for movie_id, rating, *previous in ratings]
+        self.stats_counters["published"] += len(events)
+        for consumer in self._inline:
+            self._run(consumer, events)
+        if self._thread is None:
+            return  # no dispatcher (e.g. a script): nothing would drain the buffer
+        for event in events:
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                self.stats_counters["dropped"] += 1
+
+    # ─── dispatcher ──────────────────────────────────────────────────────────
+    def _next_batch(self) -> Optional[List[RatingEvent]]:
+        """Blocks for one event, then collects more until the batch or linger is up."""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + RATING_EVENT_LINGER_MS / 1000
+        while len(batch) < RATING_EVENT_BATCH:
+            remaining = deadline - time.monotonic()
+            try:
+                event = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is None:
+                self._queue.put_nowait(None)  # let the loop see the stop after this batch
+                break
+            batch.append(event)
+        return batch
+
+    def _write_log(self, batch: List[RatingEvent]) -> None:
+        self._log.write("".join(json.dumps(event._asdict()) + "\n" for event in batch))
+        self._log.flush()
+        os.fsync(self._log.fileno())
+
+    def _dispatch(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if self._log is not None:
+                try:
+                    self._write_log(batch)
+                except OSError:
+                    traceback.print_exc()
+            for consumer in self._batched:
+                self._run(consumer, batch)
+            self.stats_counters["batches"] += 1
+            self.stats_counters["dispatched"] += len(batch)
+
+    def start(self) -> None:
+        """Starts the dispatcher thread (call from the app lifespan)."""
+        if RATING_EVENT_LOG:
+            self._log = open(RATING_EVENT_LOG, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._dispatch, name="rating-events", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Dispatches what is still buffered, then stops the thread."""
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def stats(self) -> dict:
+        return {
+            "buffered": self._queue.qsize(),
+            "queue_limit": RATING_EVENT_QUEUE_SIZE,
+            "log": RATING_EVENT_LOG or None,
+            **self.stats_counters,
+        }
+
+
+bus = RatingBus()
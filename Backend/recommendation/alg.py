@@ -1,38 +1,53 @@
-import psycopg2
+import os
+import threading
+import time
+import traceback
+from typing import NamedTuple
+
 import pandas as pd
 import numpy as np
-import os
 
 from surprise import Dataset, Reader, SVD
 from surprise.model_selection import train_test_split
 from sklearn.metrics.pairwise import cosine_similarity
-from dotenv import load_dotenv
+from db import get_db_connection, db_cursor
+from singleflight import SingleFlight
+from recommendation import popularity, segments
+from recommendation.filters import Filter, ItemFilters, year_of
 
-load_dotenv()
+# Concurrent identical requests share one in-flight computation
+_model_builds = SingleFlight("model_build")
+_recommendations = SingleFlight("recommendations")
 
-# ────────────────────────────────────────────────────────────────────────────────
-# Database connection parameters
-DB_NAME = "movielens"
-DB_USER = "postgres"  
-DB_PASS = os.getenv("PASSWORD")
-DB_HOST = "localhost"
-DB_PORT = 5432
-# ────────────────────────────────────────────────────────────────────────────────
+# A trained model is reused for this many seconds (0 = retrain on every request).
+# New ratings reach it in the meantime through fold_in_user().
+RECOMMENDER_MODEL_TTL = float(os.getenv("RECOMMENDER_MODEL_TTL", "600"))
+
+_model_lock = threading.Lock()
 
-def get_db_connection():
-    """
-    Returns a new psycopg2 connection to the movielens database.
-    """
-    return psycopg2.connect(
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASS,
-        host=DB_HOST,
-        port=DB_PORT
-    )
 
+class _CachedModel(NamedTuple):
+    built_at: float
+    model: tuple                  # what apply_svd_and_genre() returns
+    segments: "segments.Segments"
+    filters: ItemFilters          # genre/decade bitmaps over model[3] (movies_df) rows
 
-def apply_svd_and_genre(test_size=0.2, random_state=42):
+
+_model = None          # _CachedModel
+_user_factors = {}     # raw user id (str) → (bu, pu) folded into the cached model
+_fold_in_stats = {
+    "fold_ins": 0, "fold_in_ratings": 0, "model_builds": 0,
+    "appended_movies": 0, "popularity_fallbacks": 0, "segment_warm_starts": 0,
+}
+# Regularization of fold-ins towards the user's segment (see fold_in());
+# much stronger than SVD's own reg_pu, since a new user has only a few ratings
+FOLD_IN_REG = float(os.getenv("FOLD_IN_REG", "5"))
+# A movie added without ratings starts from the factors of this many
+# genre-similar trained movies (similarity-weighted average).
+NEW_ITEM_NEIGHBOURS = int(os.getenv("NEW_ITEM_NEIGHBOURS", "20"))
+
+
+def apply_svd_and_genre(test_size=0.2, random_state=42, with_similarity=True):
     """
     1. Pull all ratings from PostgreSQL and build a Surprise Dataset.
     2. Split into train/test and fit an SVD model on trainset.
@@ -41,57 +56,58 @@ def apply_svd_and_genre(test_size=0.2, random_state=42):
       - svd: trained Surprise SVD model
       - trainset, testset: Surprise train/test sets
       - movies_df: pandas DataFrame with columns ['movie_id','title',<genre columns>]
-      - genre_similarity: NumPy array (num_movies × num_movies) of genre-based cosine similarities
+      - genre_similarity: NumPy array (num_movies × num_movies) of genre-based cosine similarities,
+        or None with with_similarity=False (only the offline evaluation reads it; the
+        recommender scores genres against the user's profile, see hybrid_recommendations)
       - movie_idx: dict mapping raw_movie_id → index in movies_df / in genre_similarity
     """
     # ─── Step 1: Load and split the rating data from PostgreSQL ──────────────────
-    conn = get_db_connection()
-    # Fetch all (user_id, movie_id, rating) from ratings table
-    df_ratings = pd.read_sql_query(
-        "SELECT user_id AS userId, movie_id AS movieId, rating "
-        "FROM ratings;",
-        conn
-    )
-    df_ratings.rename(columns={
-        "userid": "userId",
-        "movieid": "movieId"
-    }, inplace=True)
-    # Surprise expects userId and movieId as strings (so it can internally index them)
-    df_ratings["userId"] = df_ratings["userId"].astype(str)
-    df_ratings["movieId"] = df_ratings["movieId"].astype(str)
-
-    # Build a Surprise Dataset from the DataFrame
-    reader = Reader(rating_scale=(1, 5))
-    data = Dataset.load_from_df(df_ratings[["userId", "movieId", "rating"]], reader)
-
-    # Split into trainset/testset
-    trainset, testset = train_test_split(data, test_size=test_size, random_state=random_state)
-
-    # Train SVD on the training set
-    svd = SVD(random_state=random_state)
-    svd.fit(trainset)
-
-    # ─── Step 2: Load movie metadata + genres from PostgreSQL ────────────────────
-    # 2a) Load basic movie info
-    df_movies = pd.read_sql_query(
-        "SELECT movie_id, title FROM movies;",
-        conn
-    )
-
-    # 2b) Load all genres
-    df_genres = pd.read_sql_query(
-        "SELECT genre_id, name FROM genres ORDER BY genre_id;",
-        conn
-    )
-    # We'll need a mapping: genre_id → genre_name
-    genre_id_to_name = dict(zip(df_genres["genre_id"], df_genres["name"]))
-
-    # 2c) Load movie-genre relationships
-    df_mg = pd.read_sql_query(
-        "SELECT movie_id, genre_id FROM movie_genres;",
-        conn
-    )
-    conn.close()
+    with get_db_connection() as conn:
+        # Fetch all (user_id, movie_id, rating) from ratings table
+        df_ratings = pd.read_sql_query(
+            "SELECT user_id AS userId, movie_id AS movieId, rating "
+            "FROM ratings;",
+            conn
+        )
+        df_ratings.rename(columns={
+            "userid": "userId",
+            "movieid": "movieId"
+        }, inplace=True)
+        # Surprise expects userId and movieId as strings (so it can internally index them)
+        df_ratings["userId"] = df_ratings["userId"].astype(str)
+        df_ratings["movieId"] = df_ratings["movieId"].astype(str)
+
+        # Build a Surprise Dataset from the DataFrame
+        reader = Reader(rating_scale=(1, 5))
+        data = Dataset.load_from_df(df_ratings[["userId", "movieId", "rating"]], reader)
+
+        # Split into trainset/testset
+        trainset, testset = train_test_split(data, test_size=test_size, random_state=random_state)
+
+        # Train SVD on the training set
+        svd = SVD(random_state=random_state)
+        svd.fit(trainset)
+
+        # ─── Step 2: Load movie metadata + genres from PostgreSQL ────────────────────
+        # 2a) Load basic movie info
+        df_movies = pd.read_sql_query(
+            "SELECT movie_id, title FROM movies;",
+            conn
+        )
+
+        # 2b) Load all genres
+        df_genres = pd.read_sql_query(
+            "SELECT genre_id, name FROM genres ORDER BY genre_id;",
+            conn
+        )
+        # We'll need a mapping: genre_id → genre_name
+        genre_id_to_name = dict(zip(df_genres["genre_id"], df_genres["name"]))
+
+        # 2c) Load movie-genre relationships
+        df_mg = pd.read_sql_query(
+            "SELECT movie_id, genre_id FROM movie_genres;",
+            conn
+        )
 
     # 2d) Pivot df_mg into one-hot genre columns
     # Create a DataFrame where rows = movie_id, columns = genre names, values = 0 or 1
@@ -122,7 +138,7 @@ def apply_svd_and_genre(test_size=0.2, random_state=42):
     genre_matrix = movies_df[genre_cols].values.astype(int)
 
     # Compute cosine similarity (movies × movies)
-    genre_similarity = cosine_similarity(genre_matrix)
+    genre_similarity = cosine_similarity(genre_matrix) if with_similarity else None
 
     # Build a mapping from raw movie_id (int) → index in movies_df (0..num_movies-1)
     movie_idx = {int(mid): idx for idx, mid in enumerate(movies_df["movie_id"].values)}
@@ -130,19 +146,25 @@ def apply_svd_and_genre(test_size=0.2, random_state=42):
     return svd, trainset, testset, movies_df, genre_similarity, movie_idx
 
 
-def hybrid_recommendations(svd, trainset, movies_df, genre_similarity, movie_idx,
-                           user_id, top_n=10, alpha=0.5):
+def hybrid_recommendations(svd, trainset, movies_df, movie_idx,
+                           user_id, top_n=10, alpha=0.5, user_factors=None, allowed=None):
     """
     Generate hybrid recommendations for a user by combining SVD and genre similarity.
 
     - svd: trained SVD model
     - trainset: Surprise Trainset (so we can check which movies are already rated by the user)
     - movies_df: pandas DataFrame with ['movie_id', 'title', <genre columns>]
-    - genre_similarity: NumPy array (num_movies × num_movies)
-    - movie_idx: dict mapping raw_movie_id → index in movies_df / genre_similarity
+    - movie_idx: dict mapping raw_movie_id → index in movies_df
     - user_id: raw user ID (int or str)
     - top_n: number of recommendations to return
     - alpha: weight for SVD score vs genre score (0 ≤ alpha ≤ 1)
+    - user_factors: optional (bu, pu) from fold_in_user(), used instead of the
+      user's trained factors (or when the user isn't in the trainset at all)
+    - allowed: optional boolean mask over movies_df rows (see filters.py);
+      only those movies are recommended
+    Users with neither get the time-decayed popularity score as their CF component.
+    Scores are computed for all movies at once (NumPy), so a filter only
+    changes which rows compete for the top_n.
     """
     # Ensure user_id is a string (Surprise was trained with string IDs)
     raw_uid = str(user_id)
@@ -154,115 +176,359 @@ def hybrid_recommendations(svd, trainset, movies_df, genre_similarity, movie_idx
         # User has no ratings in trainset (they might be brand-new) → cannot produce SVD preds
         inner_uid = None
 
-    # 2) Build a set of movie_ids that the user has already rated (so we skip them)
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT movie_id FROM ratings WHERE user_id = %s;",
-        (user_id,)
-    )
-    rated_by_user = {row[0] for row in cur.fetchall()}
-    cur.close()
-    conn.close()
-
-    # 3) Compute SVD-predicted scores for all movies the user hasn't rated (if inner_uid is not None)
-    svd_scores = {}
-    if inner_uid is not None:
-        for raw_mid in movies_df["movie_id"].astype(int):
-            if raw_mid in rated_by_user:
-                continue
-            try:
-                est = svd.predict(raw_uid, str(raw_mid)).est
-            except:
-                est = svd.predict(raw_uid, raw_mid).est
-            svd_scores[raw_mid] = est
-
-    # 4) Compute a "genre preference vector" for this user:
-    #    - For each movie they have rated, weight its genre vector by the rating,
-    #      then normalize by total sum of ratings.
-    num_movies = movies_df.shape[0]
-    num_genres = genre_similarity.shape[0]  # same as num_movies
-    # Actually, genre_similarity is movies×movies. Instead, we want the genre vector
-    # for each movie. We already have that as genre_matrix in apply_svd_and_genre,
-    # but since we don't pass it here, we can extract from movies_df:
+    # 2) Fetch all (movie_id, rating) for this user; rated movies are skipped
+    with db_cursor() as cur:
+        cur.execute(
+            "SELECT movie_id, rating FROM ratings WHERE user_id = %s;",
+            (user_id,)
+        )
+        user_ratings = cur.fetchall()  # list of (movie_id, rating)
+
+    movie_ids = movies_df["movie_id"].to_numpy(dtype=int)
+    candidates = np.ones(len(movie_ids), dtype=bool) if allowed is None else allowed.copy()
+    rated_rows = [movie_idx[mid] for mid, _ in user_ratings if mid in movie_idx]
+    candidates[rated_rows] = False
+
+    # 3) CF scores for all movies: folded-in or trained factors, else popularity
+    if user_factors is not None:
+        cf_scores = _svd_scores(svd, trainset, movie_ids, *user_factors)
+    elif inner_uid is not None:
+        cf_scores = _svd_scores(svd, trainset, movie_ids, svd.bu[inner_uid], svd.pu[inner_uid])
+    else:
+        # Nothing to personalize with yet: fall back to (decayed) popularity
+        popular = popularity.index.scores()
+        cf_scores = np.array([popular.get(mid, 0.0) for mid in movie_ids.tolist()])
+
+    # 4) The user's genre profile: their rated movies' genre vectors weighted
+    #    by rating, normalized by the total of the ratings (zero if none)
     genre_cols = [col for col in movies_df.columns if col not in ["movie_id", "title"]]
-    # Build a dict: movie_id → genre_vector (NumPy array)
-    movie_genre_map = {
-        int(row["movie_id"]): row[genre_cols].values.astype(float)
-        for _, row in movies_df.iterrows()
-    }
+    genre_matrix = movies_df[genre_cols].to_numpy(dtype=float)
+    user_profile = np.zeros(len(genre_cols), dtype=float)
+    if rated_rows:
+        weights = np.array([rating for mid, rating in user_ratings if mid in movie_idx], dtype=float)
+        user_profile = weights @ genre_matrix[rated_rows] / weights.sum()
+
+    # 5) hybrid_score = alpha * svd_score + (1 - alpha) * (user_profile ⋅ movie_genre_vector)
+    hybrid_scores = alpha * cf_scores + (1 - alpha) * (genre_matrix @ user_profile)
+
+    # 6) Top_n among the candidate rows, best first (ties keep catalog order)
+    rows = np.flatnonzero(candidates)
+    if len(rows) > top_n:
+        rows = rows[np.argpartition(-hybrid_scores[rows], top_n - 1)[:top_n]]
+        rows.sort()
+    rows = rows[np.argsort(-hybrid_scores[rows], kind="stable")]
+
+    # 7) Build a DataFrame of results
+    return pd.DataFrame({
+        "movie_id": movie_ids[rows].tolist(),
+        "title": movies_df["title"].to_numpy()[rows].tolist(),
+        "hybrid_score": hybrid_scores[rows].tolist(),
+    })
+
 
-    # Fetch all (movie_id, rating) for this user
-    conn = get_db_connection()
-    cur = conn.cursor()
+def _svd_scores(svd, trainset, movie_ids, bu, pu):
+    """
+    SVD estimates for every movie at once, as svd.predict() would give them:
+    global mean + biases + qi·pu, movies unknown to the model get the global
+    mean + user bias, clipped to the rating scale.
+    """
+    inner = np.array([trainset._raw2inner_id_items.get(str(mid), -1) for mid in movie_ids.tolist()])
+    known = inner >= 0
+    est = np.full(len(movie_ids), trainset.global_mean + bu)
+    est[known] += svd.bi[inner[known]] + svd.qi[inner[known]] @ pu
+    return np.clip(est, 1.0, 5.0)
+
+
+def _build_model():
+    # The N×N genre-similarity matrix is not needed to recommend (and would
+    # have to be copied under _model_lock on every add_movies())
+    model = apply_svd_and_genre(with_similarity=False)
+    movies_df = model[3]
+    with db_cursor() as cur:
+        cur.execute("SELECT user_id, age, gender FROM users;")
+        users = cur.fetchall()
+        cur.execute("SELECT movie_id, release_date FROM movies;")
+        release = dict(cur.fetchall())
+    years = [year_of(release.get(int(mid))) for mid in movies_df["movie_id"]]
+    return model, segments.build(model[0], model[1], users), ItemFilters(movies_df, years)
+
+
+def _current_model() -> _CachedModel:
+    """The cached model, (re)built through the single-flight when missing or expired."""
+    global _model
+    entry = _model
+    if entry is not None and time.monotonic() - entry.built_at < RECOMMENDER_MODEL_TTL:
+        return entry
+    model, segs, item_filters = _model_builds.do("svd_and_genre", _build_model)
+    with _model_lock:
+        # Compare the trained SVD, not the tuple: add_movies() swaps the tuple
+        if _model is None or _model.model[0] is not model[0]:
+            _model = _CachedModel(time.monotonic(), model, segs, item_filters)
+            _user_factors.clear()  # the new model was trained on their ratings
+            _fold_in_stats["model_builds"] += 1
+        return _model
+
+
+def fold_in(svd, trainset, ratings, prior=None, reg=None):
+    """
+    (bu, pu) for a user from raw (movie_id, rating) pairs against the item
+    factors of a trained SVD: one regularized least-squares solve, shrinking
+    towards `prior` (bu, pu) — e.g. a demographic segment — instead of zero.
+    Items unknown to the model are ignored; with none left this is the prior.
+    """
+    reg = FOLD_IN_REG if reg is None else reg
+    bu0, pu0 = prior if prior is not None else (0.0, np.zeros(svd.qi.shape[1]))
+    inner, values = [], []
+    for mid, rating in ratings:
+        i = trainset._raw2inner_id_items.get(str(mid))
+        if i is not None:
+            inner.append(i)
+            values.append(float(rating))
+    if not inner:
+        return bu0, pu0
+
+    q = svd.qi[inner]
+    residual = np.asarray(values) - trainset.global_mean - svd.bi[inner]
+    bu = float((residual.sum() + reg * bu0) / (len(inner) + reg))
+    residual -= bu
+    pu = np.linalg.solve(q.T @ q + reg * np.eye(q.shape[1]), q.T @ residual + reg * pu0)
+    return bu, pu
+
+
+def _user_profile(cur, user_id):
+    """(segment or None, number of ratings) for one user, in one query."""
     cur.execute(
-        "SELECT movie_id, rating FROM ratings WHERE user_id = %s;",
-        (user_id,)
+        """
+        SELECT age, gender,
+               (SELECT COUNT(*) FROM ratings WHERE user_id = %s)
+          FROM users
+         WHERE user_id = %s;
+        """,
+        (user_id, user_id),
     )
-    user_ratings = cur.fetchall()  # list of (movie_id, rating)
-    cur.close()
-    conn.close()
+    row = cur.fetchone()
+    if row is None:
+        return None, 0
+    segs = _model.segments if _model is not None else None
+    return (segs.lookup(*row[:2]) if segs is not None else None), row[2]
 
-    # Build the user's aggregated genre profile
-    user_profile = np.zeros(len(genre_cols), dtype=float)
-    total_weight = 0.0
-    for mid, rating in user_ratings:
-        if mid in movie_genre_map:
-            user_profile += rating * movie_genre_map[mid]
-            total_weight += rating
-    if total_weight > 0:
-        user_profile /= total_weight
-    # If total_weight == 0, user_profile stays as zero vector
-
-    # 5) For all unseen movies, compute hybrid score:
-    #    hybrid_score = alpha * svd_score + (1 - alpha) * (user_profile ⋅ movie_genre_vector)
-    hybrid_scores = {}
-    for raw_mid in movies_df["movie_id"].astype(int):
-        if raw_mid in rated_by_user:
-            continue
-        # SVD component (if available; else 0)
-        cf_score = svd_scores.get(raw_mid, 0.0)
-        # Content (genre) component
-        genre_vec = movie_genre_map[raw_mid]
-        content_score = float(np.dot(user_profile, genre_vec))
-        # Combine
-        hybrid_scores[raw_mid] = alpha * cf_score + (1 - alpha) * content_score
-
-    # 6) Rank movies by hybrid score descending and take top_n
-    ranked = sorted(hybrid_scores.items(), key=lambda x: x[1], reverse=True)
-    top_n_raw = [mid for mid, _ in ranked[:top_n]]
-
-    # 7) Retrieve titles for the top_n
-    title_map = dict(zip(movies_df["movie_id"].astype(int), movies_df["title"]))
-    titles = [title_map[mid] for mid in top_n_raw]
-
-    # Build a DataFrame of results
+
+def fold_in_user(user_id):
+    """
+    Refits one user's bias and latent factors against the cached model's item
+    factors from all of their current ratings (see fold_in(); the user's
+    demographic segment is the prior), so new ratings show up in their
+    recommendations without retraining. Does nothing while no model is
+    cached; the next build includes the ratings anyway. Best effort: errors
+    are logged, not raised, since the ratings themselves are already saved.
+    """
+    entry = _model
+    if entry is None:
+        return
+    svd, trainset = entry.model[0], entry.model[1]
+
+    try:
+        with db_cursor() as cur:
+            segment, _ = _user_profile(cur, user_id)
+            cur.execute("SELECT movie_id, rating FROM ratings WHERE user_id = %s;", (user_id,))
+            user_ratings = cur.fetchall()
+    except Exception:
+        traceback.print_exc()
+        return
+    if not user_ratings:
+        return
+
+    prior = (segment.bu, segment.pu) if segment is not None else None
+    bu, pu = fold_in(svd, trainset, user_ratings, prior)
+
+    with _model_lock:
+        if _model is not None and _model.model[0] is svd:
+            _user_factors[str(user_id)] = (bu, pu)
+            _fold_in_stats["fold_ins"] += 1
+            _fold_in_stats["fold_in_ratings"] += len(user_ratings)
+
+
+def add_movies(movies):
+    """
+    Appends newly inserted movies to the cached model so they can be
+    recommended before the next rebuild:
+      - a row in movies_df (one-hot genres);
+      - an item bias and factor vector averaged from the NEW_ITEM_NEIGHBOURS
+        most genre-similar movies the SVD was trained on.
+    `movies` is a list of (movie_id, title, [genre names], release_date). Does nothing while
+    no model is cached.
+    """
+    global _model
+    with _model_lock:
+        entry = _model
+        if entry is None or not movies:
+            return
+        svd, trainset, testset, movies_df, genre_sim, movie_idx = entry.model  # genre_sim is None
+        genre_cols = [col for col in movies_df.columns if col not in ["movie_id", "title"]]
+        known = {int(mid) for mid in movies_df["movie_id"]}
+        movies = [m for m in movies if int(m[0]) not in known]
+        if not movies:
+            return
+
+        new_rows = pd.DataFrame(
+            [[int(mid), title] + [int(g in names) for g in genre_cols] for mid, title, names, _ in movies],
+            columns=["movie_id", "title"] + genre_cols,
+        )
+        old_matrix = movies_df[genre_cols].values.astype(int)
+        new_matrix = new_rows[genre_cols].values.astype(int)
+
+        # Genre similarity of the new movies to the existing ones (new × N only)
+        cross = cosine_similarity(new_matrix, old_matrix)
+
+        # Content-derived item factors from trained, genre-similar movies
+        trained_rows, trained_inner = [], []
+        for row, mid in enumerate(movies_df["movie_id"].astype(int)):
+            inner = trainset._raw2inner_id_items.get(str(mid))
+            if inner is not None:
+                trained_rows.append(row)
+                trained_inner.append(inner)
+        sims = cross[:, trained_rows]
+        k = min(NEW_ITEM_NEIGHBOURS, len(trained_rows))
+        new_bi = np.zeros(len(movies))
+        new_qi = np.zeros((len(movies), svd.qi.shape[1]))
+        for i in range(len(movies)):
+            if k == 0:
+                break
+            top = np.argpartition(-sims[i], k - 1)[:k]
+            weights = sims[i][top]
+            if weights.sum() <= 0:
+                continue  # no genre overlap: bias 0, zero factors (global mean)
+            inner = np.asarray(trained_inner)[top]
+            new_bi[i] = weights @ svd.bi[inner] / weights.sum()
+            new_qi[i] = weights @ svd.qi[inner] / weights.sum()
+
+        # Arrays first, then the raw → inner mapping, so concurrent readers
+        # only ever look up ids whose factors already exist
+        first_inner = len(svd.bi)
+        svd.bi = np.concatenate([svd.bi, new_bi])
+        svd.qi = np.vstack([svd.qi, new_qi])
+        for i, (mid, *_) in enumerate(movies):
+            trainset.ir[first_inner + i] = []  # "known" to predict(), with no ratings
+            trainset._raw2inner_id_items[str(int(mid))] = first_inner + i
+        trainset.n_items += len(movies)
+        trainset._inner2raw_id_items = None
+
+        movies_df = pd.concat([movies_df, new_rows], ignore_index=True)
+        movie_idx = {**movie_idx, **{int(mid): len(movie_idx) + i for i, (mid, *_) in enumerate(movies)}}
+        _model = entry._replace(
+            model=(svd, trainset, testset, movies_df, genre_sim, movie_idx),
+            filters=entry.filters.extended(new_rows, [year_of(m[3]) for m in movies]),
+        )
+        _fold_in_stats["appended_movies"] += len(movies)
+
+
+def fold_in_events(events):
+    """Rating event consumer: one fold-in per user in the batch."""
+    for user_id in dict.fromkeys(event.user_id for event in events):
+        fold_in_user(user_id)
+
+
+def recommend_top_n_movies(user_id, n, alpha, filters=Filter()):
+    """
+    Main entrypoint: produce a top-n recommendation for the given user_id from
+    the cached SVD + genre similarity model (retrained on all available
+    ratings every RECOMMENDER_MODEL_TTL seconds), optionally restricted by
+    `filters` (genres, release years, excluded movies; see filters.py).
+    Identical concurrent calls (same user_id, n, alpha, filters) share one
+    computation, and concurrent calls for different users share one model build.
+    """
+    key = (int(user_id), int(n), round(float(alpha), 4), filters)
+    return _recommendations.do(key, _recommend_top_n_movies, user_id, n, alpha, filters)
+
+
+def _popular_unrated(user_id, n):
+    """Top-n by popularity for when no model is available yet."""
+    with db_cursor() as cur:
+        cur.execute("SELECT movie_id FROM ratings WHERE user_id = %s;", (user_id,))
+        rated = {row[0] for row in cur.fetchall()}
+        movie_ids = popularity.index.top(n, kind="top", exclude=rated)
+        cur.execute("SELECT movie_id, title FROM movies WHERE movie_id = ANY(%s);", (movie_ids,))
+        titles = dict(cur.fetchall())
+    scores = popularity.index.scores()
+    movie_ids = [mid for mid in movie_ids if mid in titles]
     return pd.DataFrame({
-        "movie_id": top_n_raw,
-        "title": titles,
-        "hybrid_score": [hybrid_scores[mid] for mid in top_n_raw]
+        "movie_id": movie_ids,
+        "title": [titles[mid] for mid in movie_ids],
+        "hybrid_score": [scores[mid] for mid in movie_ids],
     })
 
 
-def recommend_top_n_movies(user_id, n, alpha):
+def _segment_top(svd, trainset, movies_df, segment, n, alpha):
     """
-    Main entrypoint: retrain SVD + genre similarity on all available ratings,
-    then produce a top-n recommendation for the given user_id.
+    Top-n for a user without ratings: the segment's precomputed top-list, in
+    that order, scored with the segment's factors like hybrid_recommendations would.
     """
-    svd, trainset, testset, movies_df, genre_sim, movie_idx = apply_svd_and_genre()
+    movie_ids = list(segment.top[:n])
+    inner = [trainset._raw2inner_id_items[str(mid)] for mid in movie_ids]
+    est = np.clip(trainset.global_mean + segment.bu + svd.bi[inner] + svd.qi[inner] @ segment.pu, 1.0, 5.0)
+    titles = movies_df.loc[movies_df["movie_id"].isin(movie_ids)].set_index("movie_id")["title"]
+    movie_ids = [mid for mid in movie_ids if mid in titles.index]
+    return pd.DataFrame({
+        "movie_id": movie_ids,
+        "title": [titles[mid] for mid in movie_ids],
+        # content part is 0 for a user without ratings, as in hybrid_recommendations
+        "hybrid_score": [alpha * float(e) for mid, e in zip(segment.top[:n], est) if mid in titles.index],
+    })
+
+
+def _recommend_top_n_movies(user_id, n, alpha, filters):
+    if (_model is None and not filters and popularity.index.ready
+            and _model_builds.in_flight("svd_and_genre")):
+        # The first model is still training: answer from popularity instead of waiting
+        _fold_in_stats["popularity_fallbacks"] += 1
+        return _popular_unrated(user_id, n)
+    entry = _current_model()
+    svd, trainset, testset, movies_df, _, movie_idx = entry.model
+
+    factors = _user_factors.get(str(user_id))
+    if factors is None and str(user_id) not in trainset._raw2inner_id_users:
+        # Unknown to the model: warm start from the user's demographic segment
+        with db_cursor() as cur:
+            segment, n_rated = _user_profile(cur, user_id)
+        if segment is not None:
+            _fold_in_stats["segment_warm_starts"] += 1
+            # The top-list only holds SEGMENT_TOP_N movies; longer lists are scored in full
+            if n_rated == 0 and not filters and n <= len(segment.top):
+                return _segment_top(svd, trainset, movies_df, segment, n, alpha)
+            factors = (segment.bu, segment.pu)
+
     recs_df = hybrid_recommendations(
         svd,
         trainset,
         movies_df,
-        genre_sim,
         movie_idx,
         user_id=user_id,
         top_n=n,
-        alpha=alpha
+        alpha=alpha,
+        user_factors=factors,
+        allowed=entry.filters.mask(filters, movie_idx),
     )
     return recs_df
 
 
+def single_flight_stats():
+    return {
+        "model_build": _model_builds.stats(),
+        "recommendations": _recommendations.stats(),
+    }
+
+
+def model_stats():
+    entry = _model
+    return {
+        "ttl_seconds": RECOMMENDER_MODEL_TTL,
+        "age_seconds": time.monotonic() - entry.built_at if entry else None,
+        "folded_users": len(_user_factors),
+        "segments": entry.segments.stats() if entry else None,
+        **_fold_in_stats,
+    }
+
+
 
 # if __name__ == "__main__":
 #     df_recs = recommend_top_n_movies(user_id=12, n=5, alpha=0.9)
@@ -133,6 +133,9 @@ def overall_precision_recall(precisions, recalls):
 
 
 if __name__ == "__main__":
+    import os, sys
+    # alg.py pulls its DB connections from Backend/db.py
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
     from dataLoader import data_for_surprise, load_movies_gener
     from alg import apply_svd_and_genre
 
@@ -0,0 +1,93 @@
+"""
+filters.py
+
+Precomputed item bitmaps for filtered recommendations ("a comedy from the
+90s"): one boolean array per genre and per release decade, aligned with the
+rows of the model's movies_df. A filter turns into one mask with a few
+vectorized ORs/ANDs, which hybrid_recommendations combines with the
+already-rated mask before picking the top n — so a filtered request scores
+the same arrays as an unfiltered one instead of post-filtering a top list.
+"""
+
+import re
+from typing import Dict, FrozenSet, Iterable, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+_YEAR = re.compile(r"(\d{4})")
+
+
+class Filter(NamedTuple):
+    """Hashable recommendation filter (also part of the single-flight key)."""
+    genres: Tuple[str, ...] = ()          # genre names, any of them
+    year_from: Optional[int] = None
+    year_to: Optional[int] = None
+    exclude: FrozenSet[int] = frozenset()  # movie ids
+
+    def __bool__(self) -> bool:
+        return bool(self.genres or self.year_from or self.year_to or self.exclude)
+
+
+def year_of(release_date) -> int:
+    """Release year from a date, "01-Jan-1995" or "1995-01-01"; 0 if unknown."""
+    if release_date is None or release_date != release_date:  # None / NaN
+        return 0
+    if hasattr(release_date, "year"):
+        return int(release_date.year)
+    if isinstance(release_date, (int, float, np.integer, np.floating)):
+        return int(release_date)
+    match = _YEAR.search(str(release_date))
+    return int(match.group(1)) if match else 0
+
+
+class ItemFilters:
+    def __init__(self, movies_df: pd.DataFrame, years: Iterable[int]):
+        genre_cols = [col for col in movies_df.columns if col not in ["movie_id", "title"]]
+        self.genres: Dict[str, np.ndarray] = {g: movies_df[g].to_numpy() > 0 for g in genre_cols}
+        self.years = np.asarray(list(years), dtype=np.int32)
+        self.decades: Dict[int, np.ndarray] = {
+            int(d): self.years // 10 * 10 == d for d in np.unique(self.years // 10 * 10) if d > 0
+        }
+
+    def __len__(self) -> int:
+        return len(self.years)
+
+    def extended(self, new_rows: pd.DataFrame, years: Iterable[int]) -> "ItemFilters":
+        """A copy with rows appended (movies added to the cached model)."""
+        new = ItemFilters.__new__(ItemFilters)
+        new.genres = {g: np.concatenate([bits, new_rows[g].to_numpy() > 0])
+                      for g, bits in self.genres.items()}
+        new.years = np.concatenate([self.years, np.asarray(list(years), dtype=np.int32)])
+        new.decades = {
+            int(d): new.years // 10 * 10 == d for d in np.unique(new.years // 10 * 10) if d > 0
+        }
+        return new
+
+    def _year_mask(self, year_from: Optional[int], year_to: Optional[int]) -> np.ndarray:
+        lo, hi = year_from or 1, year_to or 9999
+        mask = np.zeros(len(self.years), dtype=bool)
+        for decade, bits in self.decades.items():
+            if decade + 9 < lo or decade > hi:
+                continue
+            if lo <= decade and decade + 9 <= hi:
+                mask |= bits                                   # whole decade inside the range
+            else:
+                mask |= bits & (self.years >= lo) & (self.years <= hi)
+        return mask
+
+    def mask(self, f: Filter, movie_idx: Dict[int, int]) -> Optional[np.ndarray]:
+        """Rows allowed by `f` (None = no restriction)."""
+        if not f:
+            return None
+        mask = np.ones(len(self.years), dtype=bool)
+        if f.genres:
+            none = np.zeros(len(self.years), dtype=bool)
+            mask &= np.logical_or.reduce([self.genres.get(g, none) for g in f.genres])
+        if f.year_from or f.year_to:
+            mask &= self._year_mask(f.year_from, f.year_to)
+        for movie_id in f.exclude:
+            row = movie_idx.get(movie_id)
+            if row is not None:
+                mask[row] = False
+        return mask
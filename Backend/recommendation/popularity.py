@@ -0,0 +1,251 @@
+"""
+popularity.py
+
+Time-decayed popularity of every movie, overall and per genre: the
+fallback ranking for users the model knows nothing about, for when the
+model is still being built, and for the /movies/trending lists.
+
+Every rating counts with weight 2^(-age / POPULARITY_HALF_LIFE_DAYS) +
+POPULARITY_BASELINE, age measured from the newest rating seen (so an old
+dataset still has a "now"). The baseline is a floor for history: without it
+a first live rating after an old import (ML-100k is from 1997–98) decays
+every stored rating to nothing and one user's ratings would be the whole
+index. Per movie we keep
+  - the weighted rating count            → "trending" order
+  - a Bayesian average of the weighted ratings, shrunk towards the global
+    mean by POPULARITY_PRIOR_WEIGHT ratings of average weight  → "top" order
+
+Decayed weights are stored relative to a reference time, so a new rating is
+one addition and every stored value decays together; the reference is moved
+forward when the exponent would get large. Plain counts and sums are kept
+next to them for the baseline. Rating events for a re-rated movie carry the
+previous rating, whose contribution is replaced rather than added to.
+
+The index is built in bulk from one scan of the ratings table (numpy
+bincount), updated from rating events, and the per-genre ranked lists are
+re-sorted at most every POPULARITY_RERANK_INTERVAL seconds, so reading the
+top k is O(k).
+"""
+
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from db import get_db_connection
+
+POPULARITY_HALF_LIFE_DAYS = float(os.getenv("POPULARITY_HALF_LIFE_DAYS", "14"))
+POPULARITY_PRIOR_WEIGHT = float(os.getenv("POPULARITY_PRIOR_WEIGHT", "5"))
+POPULARITY_RERANK_INTERVAL = float(os.getenv("POPULARITY_RERANK_INTERVAL", "5"))
+# Weight every rating keeps however old it is (a fresh one counts 1 + this)
+POPULARITY_BASELINE = float(os.getenv("POPULARITY_BASELINE", "0.01"))
+
+_DECAY = math.log(2) / (POPULARITY_HALF_LIFE_DAYS * 86400)
+# Move the reference time forward before weights reach e^50
+_MAX_EXPONENT = 50.0
+
+KINDS = ("trending", "top")
+
+
+class PopularityIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ready = False
+        self._pos: Dict[int, int] = {}                 # movie_id → array position
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._weight = np.zeros(0)                     # Σ w, relative to _ref
+        self._weighted = np.zeros(0)                   # Σ w·rating, relative to _ref
+        self._count = np.zeros(0)                      # number of ratings (undecayed)
+        self._sum = np.zeros(0)                        # Σ rating (undecayed)
+        self._members: Dict[Optional[int], np.ndarray] = {None: np.zeros(0, dtype=np.int64)}
+        self._ref = 0.0                                # reference time of the weights
+        self.clock = 0.0                               # newest rating seen (epoch seconds)
+        # (kind, genre_id) → movie_ids best first; rebuilt lazily when stale
+        self._ranked: Dict[Tuple[str, Optional[int]], np.ndarray] = {}
+        self._ranked_at = float("-inf")
+        self._dirty = True
+        self.stats_counters = {"builds": 0, "events": 0, "reranks": 0}
+
+    # ─── building ────────────────────────────────────────────────────────────
+    def build(self) -> None:
+        """Loads all ratings and genre memberships in one scan each."""
+        with get_db_connection() as conn:
+            df_ratings = pd.read_sql_query(
+                "SELECT movie_id, rating, EXTRACT(EPOCH FROM rated_at) AS ts FROM ratings;", conn
+            )
+            df_movies = pd.read_sql_query("SELECT movie_id FROM movies;", conn)
+            df_mg = pd.read_sql_query("SELECT movie_id, genre_id FROM movie_genres;", conn)
+        self.load(
+            df_movies["movie_id"].to_numpy(),
+            df_ratings["movie_id"].to_numpy(),
+            df_ratings["rating"].to_numpy(dtype=float),
+            df_ratings["ts"].to_numpy(dtype=float),
+            df_mg["movie_id"].to_numpy(),
+            df_mg["genre_id"].to_numpy(),
+        )
+
+    def load(self, movie_ids, rating_movie_ids, ratings, timestamps,
+             genre_movie_ids, genre_ids) -> None:
+        """Bulk (re)build from columns: movies, ratings and movie→genre pairs."""
+        ids = np.unique(np.concatenate([np.asarray(movie_ids), np.asarray(rating_movie_ids)]))
+        pos = {int(mid): i for i, mid in enumerate(ids)}
+        ref = float(timestamps.max()) if len(timestamps) else time.time()
+
+        rows = np.searchsorted(ids, rating_movie_ids)
+        w = np.exp(_DECAY * (np.asarray(timestamps, dtype=float) - ref))
+        weight = np.bincount(rows, weights=w, minlength=len(ids))
+        weighted = np.bincount(rows, weights=w * ratings, minlength=len(ids))
+        count = np.bincount(rows, minlength=len(ids)).astype(float)
+        total = np.bincount(rows, weights=ratings, minlength=len(ids))
+
+        members = {None: np.arange(len(ids))}
+        genre_movie_ids, genre_ids = np.asarray(genre_movie_ids), np.asarray(genre_ids)
+        known = np.isin(genre_movie_ids, ids)
+        for gid in np.unique(genre_ids):
+            mask = known & (genre_ids == gid)
+            members[int(gid)] = np.searchsorted(ids, genre_movie_ids[mask])
+
+        with self._lock:
+            self._ids, self._pos = ids, pos
+            self._weight, self._weighted = weight, weighted
+            self._count, self._sum = count, total
+            self._members = members
+            self._ref = self.clock = ref
+            self._dirty = True
+            self.ready = True
+            self.stats_counters["builds"] += 1
+
+    # ─── incremental updates ─────────────────────────────────────────────────
+    def _grow(self, movie_id: int) -> int:
+        i = self._pos[movie_id] = len(self._ids)
+        self._ids = np.append(self._ids, movie_id)
+        self._weight = np.append(self._weight, 0.0)
+        self._weighted = np.append(self._weighted, 0.0)
+        self._count = np.append(self._count, 0.0)
+        self._sum = np.append(self._sum, 0.0)
+        self._members[None] = np.append(self._members[None], i)
+        return i
+
+    def add_movies(self, movies: Iterable[Tuple[int, Iterable[int]]]) -> None:
+        """Registers new (movie_id, genre_ids) so they can show up in genre lists."""
+        with self._lock:
+            if not self.ready:
+                return
+            for movie_id, genre_ids in movies:
+                if movie_id in self._pos:
+                    continue
+                i = self._grow(movie_id)
+                for gid in genre_ids:
+                    self._members[gid] = np.append(self._members.get(gid, np.zeros(0, dtype=np.int64)), i)
+            self._dirty = True
+
+    def on_rating_events(self, events) -> None:
+        """
+        Rating event consumer (batched): adds each rating with its decay weight.
+        For a re-rating (event.previous_rating set) the previous rating is taken
+        out first, so a user counts once per movie however often they re-rate.
+        """
+        with self._lock:
+            if not self.ready:
+                return  # counted by the bulk build
+            for event in events:
+                self.clock = max(self.clock, event.ts)
+                if _DECAY * (self.clock - self._ref) > _MAX_EXPONENT:
+                    scale = math.exp(-_DECAY * (self.clock - self._ref))
+                    self._weight *= scale
+                    self._weighted *= scale
+                    self._ref = self.clock
+                i = self._pos.get(event.movie_id)
+                if i is None:
+                    i = self._grow(event.movie_id)
+                if event.previous_rating is not None:
+                    w = math.exp(_DECAY * (event.previous_ts - self._ref))
+                    self._weight[i] = max(self._weight[i] - w, 0.0)
+                    self._weighted[i] = max(self._weighted[i] - w * event.previous_rating, 0.0)
+                    self._count[i] = max(self._count[i] - 1, 0.0)
+                    self._sum[i] = max(self._sum[i] - event.previous_rating, 0.0)
+                w = math.exp(_DECAY * (event.ts - self._ref))
+                self._weight[i] += w
+                self._weighted[i] += w * event.rating
+                self._count[i] += 1
+                self._sum[i] += event.rating
+            self._dirty = True
+            self.stats_counters["events"] += len(events)
+
+    # ─── scores ──────────────────────────────────────────────────────────────
+    def _effective(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(Σ weight, Σ weight·rating) per movie as of `clock`, baseline included."""
+        scale = math.exp(-_DECAY * (self.clock - self._ref))
+        return (self._weight * scale + POPULARITY_BASELINE * self._count,
+                self._weighted * scale + POPULARITY_BASELINE * self._sum)
+
+    def _bayesian(self, weight: np.ndarray, weighted: np.ndarray) -> np.ndarray:
+        # The prior is the plain mean of all ratings, worth POPULARITY_PRIOR_WEIGHT
+        # ratings of average weight: in "fresh ratings" it would swamp an index
+        # whose history is all old (at the baseline weight)
+        count = self._count.sum()
+        mean = self._sum.sum() / count if count > 0 else 3.0
+        prior = POPULARITY_PRIOR_WEIGHT * (weight.sum() / count if count > 0 else 1.0)
+        return (prior * mean + weighted) / (prior + weight)
+
+    def _rerank(self) -> None:
+        """Re-sorts every per-genre list (caller holds the lock)."""
+        weight, weighted = self._effective()
+        orders = {
+            "trending": weight,
+            "top": self._bayesian(weight, weighted),
+        }
+        ranked = {}
+        for kind, values in orders.items():
+            for gid, members in self._members.items():
+                order = members[np.argsort(-values[members], kind="stable")]
+                ranked[(kind, gid)] = self._ids[order]
+        self._ranked = ranked
+        self._ranked_at = time.monotonic()
+        self._dirty = False
+        self.stats_counters["reranks"] += 1
+
+    def top(self, k: int, genre_id: Optional[int] = None, kind: str = "trending",
+            exclude: Iterable[int] = ()) -> List[int]:
+        """Best `k` movie ids overall or in `genre_id`, skipping `exclude`."""
+        if not self.ready:
+            return []
+        if self._dirty and time.monotonic() - self._ranked_at > POPULARITY_RERANK_INTERVAL:
+            with self._lock:
+                if self._dirty and time.monotonic() - self._ranked_at > POPULARITY_RERANK_INTERVAL:
+                    self._rerank()
+        ranked = self._ranked.get((kind, genre_id))
+        if ranked is None:
+            return []
+        exclude = exclude if isinstance(exclude, (set, frozenset, dict)) else set(exclude)
+        result = []
+        for movie_id in ranked:
+            movie_id = int(movie_id)
+            if movie_id not in exclude:
+                result.append(movie_id)
+                if len(result) == k:
+                    break
+        return result
+
+    def scores(self) -> Dict[int, float]:
+        """Bayesian-averaged score (1–5 scale) of every movie."""
+        if not self.ready:
+            return {}
+        with self._lock:
+            return dict(zip(self._ids.tolist(), self._bayesian(*self._effective()).tolist()))
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "movies": len(self._ids),
+            "genres": len(self._members) - 1,
+            "half_life_days": POPULARITY_HALF_LIFE_DAYS,
+            **self.stats_counters,
+        }
+
+
+index = PopularityIndex()
@@ -0,0 +1,114 @@
+"""
+segments.py
+
+Demographic warm start for users the model hasn't seen (or has seen only a
+few ratings from), using the age and gender collected at registration.
+
+At model build time the trained users are grouped into segments, and each
+segment gets
+  - the mean of its members' bias and latent factors, the prior that
+    fold-ins shrink towards (instead of zero);
+  - a top-list: the movies its members most often rated LIKED_RATING or
+    better, what a user without any ratings is shown.
+Lookups take the most specific segment with at least SEGMENT_MIN_USERS
+members:
+
+    (age bucket, gender) → (age bucket,) → everyone
+
+(age bucket, occupation) was tried too; on the ML-100k u1–u5 splits its
+top-lists did worse than age × gender (precision@10 0.090 vs 0.098), the
+segments being too small. See benchmarks/segment_warm_start_eval.py.
+"""
+
+import bisect
+import os
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+SEGMENT_MIN_USERS = int(os.getenv("SEGMENT_MIN_USERS", "5"))
+SEGMENT_TOP_N = int(os.getenv("SEGMENT_TOP_N", "200"))
+LIKED_RATING = 4
+
+# MovieLens-style age buckets: under 18, 18–24, 25–34, 35–44, 45–49, 50–55, 56+
+AGE_BUCKETS = (18, 25, 35, 45, 50, 56)
+
+
+class Segment(NamedTuple):
+    key: tuple
+    users: int
+    bu: float
+    pu: np.ndarray
+    top: Tuple[int, ...]      # raw movie ids, most often liked by members first
+
+
+def age_bucket(age: Optional[int]) -> Optional[int]:
+    if age is None:
+        return None
+    return bisect.bisect_right(AGE_BUCKETS, age)
+
+
+def keys_for(age: Optional[int], gender: Optional[str]) -> Iterable[tuple]:
+    """Segment keys for a user, most specific first."""
+    bucket = age_bucket(age)
+    if bucket is not None:
+        if gender:
+            yield ("age_gender", bucket, gender.upper())
+        yield ("age", bucket)
+    yield ()
+
+
+class Segments:
+    def __init__(self, segments: Dict[tuple, Segment]):
+        self._segments = segments
+
+    def __len__(self) -> int:
+        return len(self._segments)
+
+    def lookup(self, age: Optional[int], gender: Optional[str]) -> Optional[Segment]:
+        for key in keys_for(age, gender):
+            segment = self._segments.get(key)
+            if segment is not None:
+                return segment
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "segments": len(self._segments),
+            "by_level": {
+                level: sum(1 for k in self._segments if (k[0] if k else "all") == level)
+                for level in ("age_gender", "age", "all")
+            },
+        }
+
+
+def build(svd, trainset, users: Iterable[tuple]) -> Segments:
+    """
+    Segments from a trained Surprise SVD. `users` holds (user_id, age, gender)
+    rows; users not in the trainset are skipped, and segments with fewer than
+    SEGMENT_MIN_USERS members dropped.
+    """
+    members: Dict[tuple, list] = {}
+    for user_id, age, gender in users:
+        inner = trainset._raw2inner_id_users.get(str(user_id))
+        if inner is None:
+            continue
+        for key in keys_for(age, gender):
+            members.setdefault(key, []).append(inner)
+
+    raw_items = np.array([int(trainset.to_raw_iid(i)) for i in range(trainset.n_items)])
+    segments = {}
+    for key, inner_users in members.items():
+        if len(inner_users) < SEGMENT_MIN_USERS and key != ():
+            continue
+        liked = [i for u in inner_users for i, r in trainset.ur[u] if r >= LIKED_RATING]
+        counts = np.bincount(np.asarray(liked, dtype=int), minlength=trainset.n_items)
+        top = raw_items[np.argsort(-counts, kind="stable")[:SEGMENT_TOP_N]]
+        segments[key] = Segment(
+            key,
+            len(inner_users),
+            float(svd.bu[inner_users].mean()),
+            svd.pu[inner_users].mean(axis=0),
+            tuple(top.tolist()),
+        )
+    return Segments(segments)
@@ -1,70 +1,252 @@
 # server_manager.py
+"""
+Supervisor for the local `ollama serve` process.
+
+  * Works on Linux/macOS (own session / process group, SIGTERM → SIGKILL)
+    and Windows (new process group, CTRL_BREAK → taskkill).
+  * Readiness is probed over HTTP (GET /api/version), not assumed.
+  * A monitor thread restarts Ollama if it exits unexpectedly.
+  * The models are pulled, loaded and kept resident by an asyncio task
+    (keep_models_warm), so the API can serve non-LLM routes immediately.
+
+If something is already answering on the host (e.g. a system-wide Ollama
+service) it is used as-is and no child process is started.
+"""
+
+import atexit
+import asyncio
+import json
 import os
-import sys
 import signal
 import subprocess
-import atexit
+import sys
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
 from contextlib import ContextDecorator
+from typing import Callable, Dict, List, Optional
 
 # Windows flags
 CREATE_NEW_PROC_GROUP = 0x00000200
 CREATE_NO_WINDOW       = 0x08000000
 
-_server_process = None
+IS_WINDOWS = sys.platform == "win32"
 
-def start_server(host: str = "127.0.0.1:11435") -> None:
-    global _server_process
-    if _server_process:
-        stop_server()
+OLLAMA_READY_TIMEOUT = float(os.getenv("OLLAMA_READY_TIMEOUT", "30"))
+OLLAMA_MONITOR_INTERVAL = float(os.getenv("OLLAMA_MONITOR_INTERVAL", "2"))
+# How long Ollama keeps a model loaded after the last request, and how often
+# we touch it to keep it there.
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_KEEP_WARM_INTERVAL = float(os.getenv("OLLAMA_KEEP_WARM_INTERVAL", "600"))
 
-    os.environ["OLLAMA_HOST"] = host
 
-    _server_process = subprocess.Popen(
-        ["ollama", "serve"],
-        creationflags=CREATE_NEW_PROC_GROUP | CREATE_NO_WINDOW,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-    )
+def probe(host: str, timeout: float = 1.0) -> Optional[str]:
+    """Returns the Ollama version if the server answers on `host`, else None."""
+    try:
+        with urllib.request.urlopen(f"http://{host}/api/version", timeout=timeout) as resp:
+            return json.loads(resp.read().decode("utf-8")).get("version", "unknown")
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
 
-    atexit.register(stop_server)
-    for sig in (signal.SIGINT, signal.SIGTERM, getattr(signal, "SIGBREAK", None)):
-        if sig is not None:
-            signal.signal(sig, _handle_signal)
 
-def stop_server() -> None:
-    global _server_process
-    if not _server_process:
-        return
+class OllamaServer(ContextDecorator):
+    def __init__(self, host: str = "127.0.0.1:11435", restart: bool = True,
+                 max_loaded_models: int = 1):
+        self.host = host
+        self.restart = restart
+        self.max_loaded_models = max_loaded_models
+        self.process: Optional[subprocess.Popen] = None
+        self.external = False
+        self.restarts = 0
+        self.version: Optional[str] = None
+        # model name → "not loaded" | "pulling" | "loading" | "loaded" | "error"
+        self.models: Dict[str, str] = {}
+        self.last_error: Optional[str] = None
+        self._stopping = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
 
-    pid = _server_process.pid
+    # ─── process control ─────────────────────────────────────────────────────
+    def _spawn(self) -> None:
+        env = dict(os.environ, OLLAMA_HOST=self.host)
+        # Keep every routed model resident instead of swapping them in and out
+        env.setdefault("OLLAMA_MAX_LOADED_MODELS", str(self.max_loaded_models))
+        kwargs = {}
+        if IS_WINDOWS:
+            kwargs["creationflags"] = CREATE_NEW_PROC_GROUP | CREATE_NO_WINDOW
+        else:
+            # New session → own process group, so we can signal the whole tree
+            kwargs["start_new_session"] = True
+        try:
+            self.process = subprocess.Popen(
+                ["ollama", "serve"],
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                **kwargs,
+            )
+        except OSError as e:
+            self.process = None
+            self.last_error = f"could not start ollama: {e}"
+            print(f"OllamaServer: {self.last_error}")
 
-    # 1) polite break (may not work if hidden)
-    try:
-        _server_process.send_signal(signal.CTRL_BREAK_EVENT)
-        _server_process.wait(timeout=3)
-    except Exception:
-        pass
+    def _kill(self) -> None:
+        proc, self.process = self.process, None
+        if proc is None or proc.poll() is not None:
+            return
+        if IS_WINDOWS:
+            try:
+                # polite break (may not work if hidden)
+                proc.send_signal(signal.CTRL_BREAK_EVENT)
+                proc.wait(timeout=3)
+                return
+            except Exception:
+                pass
+            # force-kill the entire tree via taskkill
+            subprocess.run(
+                ["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            return
 
-    # 2) force-kill the entire tree via taskkill
-    subprocess.run(
-        ["taskkill", "/F", "/T", "/PID", str(pid)],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-    )
+        try:
+            os.killpg(proc.pid, signal.SIGTERM)
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+                proc.wait(timeout=5)
+            except ProcessLookupError:
+                pass  # exited between the two signals
+            except subprocess.TimeoutExpired:
+                self.last_error = f"ollama (pid {proc.pid}) did not exit after SIGKILL"
+                print(f"OllamaServer: {self.last_error}")
+        except ProcessLookupError:
+            pass
 
-    _server_process = None
+    def start(self) -> None:
+        self._stopping.clear()
+        self.version = probe(self.host)
+        if self.version is not None:
+            # Someone else (e.g. a system service) is already serving this host
+            self.external = True
+            return
+        with self._lock:
+            self._spawn()
+        atexit.register(self.stop)
+        if self.restart:
+            self._monitor = threading.Thread(target=self._watch, name="ollama-monitor", daemon=True)
+            self._monitor.start()
 
-def _handle_signal(signum, frame):
-    stop_server()
-    sys.exit(0)
+    def stop(self) -> None:
+        self._stopping.set()
+        with self._lock:
+            self._kill()
 
-class OllamaServer(ContextDecorator):
-    def __init__(self, host: str = "127.0.0.1:11435"):
-        self.host = host
+    def _watch(self) -> None:
+        """Restarts `ollama serve` whenever it exits while we're not stopping."""
+        backoff = 1.0
+        while not self._stopping.wait(OLLAMA_MONITOR_INTERVAL):
+            with self._lock:
+                proc = self.process
+                if proc is not None and proc.poll() is None:
+                    backoff = 1.0
+                    continue
+                code = proc.returncode if proc is not None else None
+                print(f"OllamaServer: ollama exited (code {code}), restarting in {backoff:.0f}s")
+            if self._stopping.wait(backoff):
+                return
+            with self._lock:
+                self._spawn()
+                self.restarts += 1
+                self.version = None
+                self.models = dict.fromkeys(self.models, "not loaded")
+            backoff = min(backoff * 2, 60.0)
+
+    # ─── readiness ───────────────────────────────────────────────────────────
+    def is_running(self) -> bool:
+        if self.external:
+            return True
+        return self.process is not None and self.process.poll() is None
+
+    def wait_until_ready(self, timeout: float = OLLAMA_READY_TIMEOUT) -> bool:
+        """Blocks until the HTTP API answers (or `timeout` passes)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and not self._stopping.is_set():
+            self.version = probe(self.host)
+            if self.version is not None:
+                return True
+            time.sleep(0.25)
+        return False
+
+    def ready(self) -> bool:
+        """True once Ollama answers and every model has been loaded."""
+        return (
+            self.version is not None
+            and bool(self.models)
+            and all(state == "loaded" for state in self.models.values())
+        )
+
+    def status(self) -> dict:
+        return {
+            "host": self.host,
+            "managed": not self.external,
+            "running": self.is_running(),
+            "version": self.version,
+            "models": dict(self.models),
+            "restarts": self.restarts,
+            "last_error": self.last_error,
+        }
 
     def __enter__(self):
-        start_server(self.host)
+        self.start()
+        return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        stop_server()
+        self.stop()
         return False
+
+
+async def keep_models_warm(server: OllamaServer, get_client: Callable, models: List[str]) -> None:
+    """
+    Background task: waits for Ollama, pulls `models`, loads them into memory
+    and then keeps them resident, re-loading after an Ollama restart.
+    """
+    server.models = dict.fromkeys(models, "not loaded")
+    while True:
+        try:
+            if not await asyncio.to_thread(server.wait_until_ready, OLLAMA_READY_TIMEOUT):
+                await asyncio.sleep(OLLAMA_MONITOR_INTERVAL)
+                continue
+
+            client = get_client()
+            for model in models:
+                if server.models[model] != "loaded":
+                    server.models[model] = "pulling"
+                    await client.pull(model)
+                    server.models[model] = "loading"
+                # An empty prompt just loads the model; keep_alive keeps it resident
+                await client.generate(model=model, prompt="", keep_alive=OLLAMA_KEEP_ALIVE)
+                server.models[model] = "loaded"
+            server.last_error = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            for model, state in server.models.items():
+                if state != "loaded":
+                    server.models[model] = "error"
+            server.last_error = str(e)
+            await asyncio.sleep(OLLAMA_MONITOR_INTERVAL * 5)
+            continue
+
+        # Sleep until the next keep-alive touch, but notice restarts quickly
+        restarts = server.restarts
+        for _ in range(int(OLLAMA_KEEP_WARM_INTERVAL / OLLAMA_MONITOR_INTERVAL) or 1):
+            await asyncio.sleep(OLLAMA_MONITOR_INTERVAL)
+            if server.restarts != restarts or not server.is_running():
+                server.models = dict.fromkeys(models, "not loaded")
+                break
@@ -0,0 +1,116 @@
+"""
+singleflight.py
+
+Coalesces identical concurrent calls: while a call for `key` is running, any
+other caller asking for the same key waits for that call and gets its result
+(or its exception) instead of doing the work again. Nothing is cached once the
+call finishes.
+
+SingleFlight is for blocking code running on threads (e.g. the recommender in
+the threadpool); AsyncSingleFlight is the asyncio equivalent (e.g. Ollama).
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executed = 0
+        self.shared = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"executed": self.executed, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.executed = 0
+        self.shared = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    def _finished(self, key: Hashable, task: asyncio.Future) -> None:
+        self._calls.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every caller went away
+
+    def claim(self, key: Hashable) -> Optional[asyncio.Future]:
+        """
+        For a caller that produces the result itself (e.g. while streaming it):
+        when nothing is in flight for `key`, registers and returns a future that
+        the caller must resolve, and that do() callers for `key` share until
+        then. Returns None if a call is already in flight.
+        """
+        if key in self._calls:
+            return None
+        self.executed += 1
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        future.add_done_callback(lambda f, key=key: self._finished(key, f))
+        return future
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            self.executed += 1
+            # Run as a task so one caller going away doesn't cancel it for the others
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t, key=key: self._finished(key, t))
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"executed": self.executed, "shared": self.shared, "in_flight": len(self._calls)}
@@ -0,0 +1,74 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from recommendation.filters import Filter, ItemFilters, year_of
+
+MOVIES = pd.DataFrame({
+    "movie_id": [10, 11, 12, 13, 14, 15],
+    "title": ["a", "b", "c", "d", "e", "f"],
+    "Comedy": [1, 0, 1, 0, 1, 0],
+    "Drama": [0, 1, 1, 0, 0, 1],
+})
+YEARS = [1988, 1990, 1995, 1999, 2003, 0]   # 0: unknown release date
+MOVIE_IDX = {mid: i for i, mid in enumerate(MOVIES["movie_id"])}
+
+
+@pytest.fixture
+def filters():
+    return ItemFilters(MOVIES, YEARS)
+
+
+def allowed(filters, f):
+    return MOVIES["movie_id"][filters.mask(f, MOVIE_IDX)].tolist()
+
+
+def test_year_of_formats():
+    assert year_of("01-Jan-1995") == 1995
+    assert year_of("1995-01-01") == 1995
+    assert year_of(datetime.date(1987, 5, 1)) == 1987
+    assert year_of(None) == year_of(float("nan")) == year_of("unknown") == 0
+
+
+def test_decade_bitmaps(filters):
+    assert sorted(filters.decades) == [1980, 1990, 2000]
+    assert filters.decades[1990].tolist() == [False, True, True, True, False, False]
+
+
+def test_no_filter_means_no_mask(filters):
+    assert not Filter()
+    assert filters.mask(Filter(), MOVIE_IDX) is None
+
+
+def test_whole_decades(filters):
+    assert allowed(filters, Filter(year_from=1990, year_to=1999)) == [11, 12, 13]
+    assert allowed(filters, Filter(year_from=1980, year_to=2009)) == [10, 11, 12, 13, 14]
+
+
+def test_partial_decades(filters):
+    assert allowed(filters, Filter(year_from=1989, year_to=1995)) == [11, 12]
+    assert allowed(filters, Filter(year_from=1996)) == [13, 14]
+    assert allowed(filters, Filter(year_to=1990)) == [10, 11]
+    assert allowed(filters, Filter(year_from=2010)) == []
+
+
+def test_genres_are_or_combined_and_anded_with_years(filters):
+    assert allowed(filters, Filter(genres=("Comedy",))) == [10, 12, 14]
+    assert allowed(filters, Filter(genres=("Comedy", "Drama"))) == [10, 11, 12, 14, 15]
+    assert allowed(filters, Filter(genres=("Comedy",), year_from=1990)) == [12, 14]
+    assert allowed(filters, Filter(genres=("Western",))) == []
+
+
+def test_exclude_ignores_unknown_ids(filters):
+    assert allowed(filters, Filter(genres=("Comedy",), exclude=frozenset({12, 999}))) == [10, 14]
+
+
+def test_extended_rows(filters):
+    new_rows = pd.DataFrame({"movie_id": [16], "title": ["g"], "Comedy": [1], "Drama": [0]})
+    bigger = filters.extended(new_rows, [2025])
+    idx = {**MOVIE_IDX, 16: 6}
+    mask = bigger.mask(Filter(genres=("Comedy",), year_from=2020), idx)
+    assert np.flatnonzero(mask).tolist() == [6]
+    assert len(filters) == 6   # the original is unchanged
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from types import SimpleNamespace
+
+from recommendation.alg import fold_in
+
+
+@pytest.fixture
+def model():
+    rng = np.random.default_rng(0)
+    svd = SimpleNamespace(qi=rng.normal(size=(6, 3)), bi=rng.normal(scale=0.3, size=6))
+    trainset = SimpleNamespace(
+        global_mean=3.5,
+        _raw2inner_id_items={str(100 + i): i for i in range(6)},
+    )
+    return svd, trainset
+
+
+RATINGS = [(100, 5), (101, 2), (103, 4), (105, 1)]
+
+
+def test_matches_ridge_regression_towards_prior(model):
+    svd, trainset = model
+    reg, bu0, pu0 = 2.0, 0.3, np.array([0.1, -0.2, 0.05])
+    bu, pu = fold_in(svd, trainset, RATINGS, prior=(bu0, pu0), reg=reg)
+
+    inner = [0, 1, 3, 5]
+    r = np.array([5, 2, 4, 1], dtype=float) - trainset.global_mean - svd.bi[inner]
+    # bu: mean residual shrunk towards bu0
+    assert bu == pytest.approx((r.sum() + reg * bu0) / (len(r) + reg))
+    # pu minimises |r - bu - Q pu|² + reg |pu - pu0|²: the gradient vanishes there
+    q = svd.qi[inner]
+    grad = -q.T @ (r - bu - q @ pu) + reg * (pu - pu0)
+    np.testing.assert_allclose(grad, 0, atol=1e-10)
+
+
+def test_no_prior_shrinks_towards_zero(model):
+    svd, trainset = model
+    _, weak = fold_in(svd, trainset, RATINGS, reg=0.1)
+    _, strong = fold_in(svd, trainset, RATINGS, reg=100.0)
+    assert np.linalg.norm(strong) < np.linalg.norm(weak)
+    assert np.linalg.norm(strong) < 0.1
+
+
+def test_unknown_items_are_ignored(model):
+    svd, trainset = model
+    prior = (0.2, np.ones(3))
+    assert fold_in(svd, trainset, [(999, 5)], prior=prior) == prior
+    bu, pu = fold_in(svd, trainset, RATINGS + [(999, 5)], reg=1.0)
+    bu_ref, pu_ref = fold_in(svd, trainset, RATINGS, reg=1.0)
+    assert bu == pytest.approx(bu_ref)
+    np.testing.assert_allclose(pu, pu_ref)
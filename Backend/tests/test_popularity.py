@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from rating_events import RatingEvent
+from recommendation import popularity
+from recommendation.popularity import PopularityIndex
+
+DAY = 86400.0
+T0 = 885_000_000.0  # early 1998, like the ML-100k ratings
+
+
+@pytest.fixture(autouse=True)
+def no_rerank_delay(monkeypatch):
+    monkeypatch.setattr(popularity, "POPULARITY_RERANK_INTERVAL", -1.0)
+
+
+def build(ratings, genres=()):
+    """PopularityIndex over movies 1–5 from (movie_id, rating, ts) rows."""
+    index = PopularityIndex()
+    movie_ids, values, timestamps = (np.array(col) for col in zip(*ratings))
+    genre_movie_ids, genre_ids = (np.array(col) for col in zip(*genres)) if genres else ([], [])
+    index.load(np.arange(1, 6), movie_ids, values.astype(float), timestamps.astype(float),
+               np.asarray(genre_movie_ids), np.asarray(genre_ids))
+    return index
+
+
+HISTORY = (
+    [(1, 4, T0 - i * DAY) for i in range(40)]         # many good ratings
+    + [(2, 5, T0 - i * DAY) for i in range(10)]       # fewer, excellent
+    + [(3, 2, T0 - i * DAY) for i in range(5)]
+    + [(4, 3, T0 - 60 * DAY)] * 30                    # popular two months ago
+)
+
+
+def test_recent_ratings_trend_and_bayesian_average_ranks_top():
+    index = build(HISTORY)
+    assert index.top(5, kind="trending") == [1, 2, 3, 4, 5]
+    assert index.top(2, kind="top") == [2, 1]
+    scores = index.scores()
+    assert scores[2] < 5.0               # shrunk towards the mean
+    assert scores[3] < scores[4] < scores[1]
+
+
+def test_half_life_halves_weight():
+    index = build([(1, 3, T0), (2, 3, T0 - popularity.POPULARITY_HALF_LIFE_DAYS * DAY)])
+    weight, _ = index._effective()
+    fresh, old = weight[0] - popularity.POPULARITY_BASELINE, weight[1] - popularity.POPULARITY_BASELINE
+    assert old == pytest.approx(fresh / 2)
+
+
+def test_genre_lists_and_exclude():
+    index = build(HISTORY, genres=[(1, 10), (3, 10), (4, 11)])
+    assert index.top(5, genre_id=10) == [1, 3]
+    assert index.top(5, genre_id=10, exclude={1}) == [3]
+    assert index.top(5, genre_id=99) == []
+
+
+def test_rerating_replaces_the_previous_rating():
+    index = build(HISTORY)
+    before = index.scores()
+    ts = T0 + 1
+    index.on_rating_events([RatingEvent(9, 3, 5, ts)])
+    for _ in range(4):
+        index.on_rating_events([RatingEvent(9, 3, 5, ts + 1, previous_rating=5, previous_ts=ts)])
+        ts += 1
+    assert index._count[index._pos[3]] == 6          # 5 historical + this user, once
+    assert index.top(1, kind="trending") == [1]
+    assert index.top(1, kind="top") == [2]
+    assert index.scores()[3] > before[3]
+
+
+def test_rerating_a_bulk_loaded_rating():
+    index = build([(3, 1, T0), (1, 4, T0)])
+    index.on_rating_events([RatingEvent(9, 3, 5, T0 + 10, previous_rating=1, previous_ts=T0)])
+    assert index._count[index._pos[3]] == 1
+    assert index._sum[index._pos[3]] == 5
+
+
+def test_live_rating_after_old_history_keeps_the_index():
+    index = build(HISTORY)
+    before = index.top(5, kind="top")
+    now = T0 + 28 * 365 * DAY
+    index.on_rating_events([RatingEvent(9, 5, 5, now)])
+    scores = index.scores()
+    assert len(set(np.round(list(scores.values()), 6))) > 1   # not flattened
+    assert index.top(4, kind="top", exclude={5}) == [m for m in before if m != 5][:4]
+    assert index.top(1, kind="trending") == [5]               # fresh beats old
+    assert index.top(3, kind="trending", exclude={5}) == [1, 4, 2]  # history by count
+
+
+def test_new_movie_joins_genre_list():
+    index = build(HISTORY)
+    index.add_movies([(6, [12])])
+    assert index.top(5, genre_id=12) == [6]
@@ -0,0 +1,68 @@
+import pytest
+
+from catalog import Snapshot
+from title_search import TitleIndex, normalize
+
+MOVIES = [
+    (1, "GoldenEye (1995)"),
+    (2, "Misérables, Les (1995)"),
+    (3, "Eye for an Eye (1996)"),
+    (4, "Eyes Wide Shut (1999)"),
+    (5, "Toy Story (1995)"),
+    (6, "Story of Xinghua, The (1993)"),
+    (7, "Stoned (2005)"),
+]
+
+
+@pytest.fixture
+def index():
+    idx = TitleIndex()
+    idx.sync(Snapshot(MOVIES, []))
+    return idx
+
+
+def ids(results):
+    return [movie_id for movie_id, _ in results]
+
+
+def test_normalize_folds_accents_case_and_punctuation():
+    assert normalize("Misérables, Les (1995)") == "miserables les 1995"
+    assert normalize("  ÉCOLE—Ünïcode! ") == "ecole unicode"
+
+
+def test_accent_free_query_finds_accented_title(index):
+    assert ids(index.search("les miserables")) == [2]
+    assert ids(index.search("MISÉRABLES")) == [2]
+
+
+def test_whole_word_beats_prefix_beats_infix(index):
+    # "eye": whole word in 3, word prefix in 4 ("eyes"), infix in 1 ("goldeneye")
+    assert ids(index.search("eye")) == [3, 4, 1]
+
+
+def test_title_starting_with_query_ranks_first(index):
+    # Both are whole-word matches; "toy story" starts with the query
+    assert ids(index.search("story"))[:2] == [6, 5]
+    assert ids(index.search("toy story")) == [5]
+
+
+def test_short_tokens_only_match_word_starts(index):
+    # Titles starting with "st" first, then shorter titles
+    assert ids(index.search("st")) == [7, 6, 5]
+    assert index.search("ye") == []
+
+
+def test_every_word_must_match(index):
+    assert index.search("toy eyes") == []
+
+
+def test_exclude_and_limit(index):
+    assert ids(index.search("eye", exclude=[3])) == [4, 1]
+    assert ids(index.search("eye", limit=1)) == [3]
+
+
+def test_sync_reindexes_only_changes(index):
+    index.sync(Snapshot([(1, "GoldenEye (1995)"), (8, "Amélie (2001)")], []))
+    assert len(index) == 2
+    assert ids(index.search("amelie")) == [8]
+    assert index.search("toy") == []
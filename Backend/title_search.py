@@ -0,0 +1,170 @@
+"""
+title_search.py
+
+In-process title search for /movies/search.
+
+Titles are normalized (accents stripped, case-folded, punctuation dropped), so
+"les miserables" finds "Misérables, Les (1995)". Every query word must occur in
+the title:
+
+  * words of 3+ characters are looked up through a trigram index (so infix
+    matches like "eye" → "GoldenEye" work) and then verified;
+  * 1–2 character words match the start of a title word via a prefix index.
+
+Matches are ranked by how well each query word hits (whole word > word prefix
+> infix), a bonus when the title starts with the query, then shorter titles.
+Very broad queries ("the", "s") only rank the MAX_CANDIDATES shortest matching
+titles, picked with set operations over titles bucketed by length, so the cost
+stays flat as the catalog grows.
+
+The index follows the catalog snapshot: when the snapshot changes only the
+added/removed movies are (re)indexed.
+"""
+
+import re
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from catalog import Snapshot
+
+# Very broad queries only rank this many candidates (shortest titles first).
+MAX_CANDIDATES = 300
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(" ", stripped.casefold()).strip()
+
+
+def _trigrams(word: str) -> Set[str]:
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+class TitleIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version: Optional[str] = None
+        self._docs: Dict[int, Tuple[str, str, Tuple[str, ...]]] = {}  # id → (title, norm, words)
+        self._trigrams: Dict[str, Set[int]] = {}
+        self._prefixes: Dict[str, Set[int]] = {}
+        # normalized title length → ids, and id → length
+        self._by_length: Dict[int, Set[int]] = {}
+        self._length: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    # ─── maintenance ─────────────────────────────────────────────────────────
+    def add(self, movie_id: int, title: str) -> None:
+        if movie_id in self._docs:
+            self.remove(movie_id)
+        norm = normalize(title)
+        words = tuple(norm.split())
+        self._docs[movie_id] = (title, norm, words)
+        for word in words:
+            for gram in _trigrams(word):
+                self._trigrams.setdefault(gram, set()).add(movie_id)
+            for n in (1, 2):
+                if len(word) >= n:
+                    self._prefixes.setdefault(word[:n], set()).add(movie_id)
+        self._by_length.setdefault(len(norm), set()).add(movie_id)
+        self._length[movie_id] = len(norm)
+
+    def remove(self, movie_id: int) -> None:
+        doc = self._docs.pop(movie_id, None)
+        if doc is None:
+            return
+        _, norm, words = doc
+        for word in words:
+            for gram in _trigrams(word):
+                self._trigrams.get(gram, set()).discard(movie_id)
+            for n in (1, 2):
+                self._prefixes.get(word[:n], set()).discard(movie_id)
+        self._by_length.get(len(norm), set()).discard(movie_id)
+        del self._length[movie_id]
+
+    def sync(self, snapshot: Snapshot) -> None:
+        """Brings the index in line with `snapshot`, touching only what changed."""
+        if self.version == snapshot.version:
+            return
+        with self._lock:
+            if self.version == snapshot.version:
+                return
+            for movie_id in self._docs.keys() - snapshot.titles.keys():
+                self.remove(movie_id)
+            for movie_id, title in snapshot.movies:
+                doc = self._docs.get(movie_id)
+                if doc is None or doc[0] != title:
+                    self.add(movie_id, title)
+            self.version = snapshot.version
+
+    # ─── querying ────────────────────────────────────────────────────────────
+    def _candidates(self, token: str) -> Set[int]:
+        if len(token) < 3:
+            return self._prefixes.get(token, set())
+        postings = sorted((self._trigrams.get(g, set()) for g in _trigrams(token)), key=len)
+        result = postings[0]
+        for posting in postings[1:]:
+            if not result:
+                break
+            result = result & posting
+        return result
+
+    def _shortest(self, candidates: Set[int]) -> List[int]:
+        if len(candidates) <= 10 * MAX_CANDIDATES:
+            return sorted(candidates, key=self._length.__getitem__)[:MAX_CANDIDATES]
+        # Huge sets: walk the length buckets instead of looking at every candidate
+        picked: List[int] = []
+        for length in sorted(self._by_length):
+            picked.extend(self._by_length[length] & candidates)
+            if len(picked) >= MAX_CANDIDATES:
+                break
+        return picked[:MAX_CANDIDATES]
+
+    def search(self, query: str, limit: int = 20,
+               exclude: Iterable[int] = ()) -> List[Tuple[int, str]]:
+        """Returns up to `limit` (movie_id, title) pairs, best match first."""
+        norm_query = normalize(query)
+        tokens = list(dict.fromkeys(norm_query.split()))
+        if not tokens:
+            return []
+
+        with self._lock:
+            sets = sorted((self._candidates(t) for t in tokens), key=len)
+            candidates = sets[0]
+            for s in sets[1:]:
+                if not candidates:
+                    return []
+                candidates = candidates & s
+            if exclude:
+                candidates = candidates.difference(exclude)
+            if len(candidates) > MAX_CANDIDATES:
+                candidates = self._shortest(candidates)
+            docs = [self._docs[movie_id] + (movie_id,) for movie_id in candidates]
+
+        ranked = []
+        for title, norm, words, movie_id in docs:
+            score = 0
+            for token in tokens:
+                if token in words:
+                    score += 3
+                elif any(w.startswith(token) for w in words):
+                    score += 2
+                elif len(token) >= 3 and token in norm:
+                    score += 1
+                else:
+                    break  # trigram false positive, or short token not at a word start
+            else:
+                if norm.startswith(norm_query):
+                    score += 2
+                ranked.append((-score, len(norm), norm, movie_id, title))
+
+        ranked.sort()
+        return [(movie_id, title) for *_, movie_id, title in ranked[:limit]]
+
+
+index = TitleIndex()
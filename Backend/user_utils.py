@@ -1,37 +1,54 @@
 from dotenv import load_dotenv
 
+import asyncio
 import os
+import threading
+import time
 import psycopg2
+from psycopg2.extras import execute_values
 import bcrypt
 import jwt
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from fastapi import HTTPException, Request
+from fastapi import Depends, HTTPException, Request
 from typing import Optional
 
+from db import get_db_connection, db_cursor
+from rating_events import bus as rating_bus
+
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+# Verified identities (user_id → is_admin) are cached for this many seconds,
+# so authenticated requests don't hit the users table every time.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "30"))
 
-load_dotenv()  # Load environment variables from .env file
-
-# ────────────────────────────────────────────────────────────────────────────────
-# Database connection parameters (make sure these match what you used in alg.py)
-DB_NAME = "movielens"
-DB_USER = "postgres"
-DB_PASS = os.getenv("PASSWORD")
-DB_HOST = "localhost"
-DB_PORT = 5432
-# ────────────────────────────────────────────────────────────────────────────────
-def get_db_connection():
-    return psycopg2.connect(
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASS,
-        host=DB_HOST,
-        port=DB_PORT
-    )
+_auth_cache: dict[int, tuple[float, bool]] = {}
+_auth_cache_lock = threading.Lock()
+_auth_cache_hits = 0
+_auth_cache_misses = 0
+
+# bcrypt runs on its own small thread pool so a burst of logins can't
+# starve the event loop or the threads serving database endpoints.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Requests beyond this many queued/running hash jobs are rejected with 503.
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "64"))
+
+_hash_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+)
+_hash_lock = threading.Lock()
+_hash_stats = {
+    "pending": 0,
+    "running": 0,
+    "completed": 0,
+    "rejected": 0,
+    "wait_total": 0.0,
+    "wait_max": 0.0,
+    "run_total": 0.0,
+}
 
 
 def add_new_user(
@@ -40,98 +57,314 @@ def add_new_user(
     gender: str,
     occupation: str,
     zip_code: str,
-    raw_password: str
+    password_hash: bytes
 ) -> int:
     """
     Inserts a brand-new (non-dummy) user into 'users' with:
       - a UNIQUE username
-      - bcrypt-hashed password in password_hash
+      - bcrypt-hashed password in password_hash (see hash_password)
       - is_dummy = FALSE
     Returns the newly assigned user_id.
     """
-    # 1. Hash the plaintext password
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(raw_password.encode("utf-8"), salt)
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                INSERT INTO users (username, age, gender, occupation, zip_code, password_hash, is_dummy)
+                VALUES (%s, %s, %s, %s, %s, %s, FALSE)
+                RETURNING user_id;
+                """,
+                (username, age, gender.upper(), occupation, zip_code, password_hash)
+            )
+            new_id = cur.fetchone()[0]
+            conn.commit()
+            invalidate_auth_cache(new_id)
+        except psycopg2.errors.UniqueViolation:
+            conn.rollback()
+            raise ValueError("Username already taken")
+        finally:
+            cur.close()
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
+    return new_id
+
+
+def get_login_record(username: str) -> Optional[tuple]:
+    """
+    Returns (user_id, is_dummy, password_hash, alpha, is_admin) for `username`,
+    or None if there is no such user.
+    """
+    with db_cursor() as cur:
         cur.execute(
             """
-            INSERT INTO users (username, age, gender, occupation, zip_code, password_hash, is_dummy)
-            VALUES (%s, %s, %s, %s, %s, %s, FALSE)
-            RETURNING user_id;
+            SELECT user_id, is_dummy, password_hash, alpha, is_admin
+              FROM users
+             WHERE username = %s;
             """,
-            (username, age, gender.upper(), occupation, zip_code, hashed)
+            (username,)
         )
-        new_id = cur.fetchone()[0]
-        conn.commit()
-    except psycopg2.errors.UniqueViolation:
-        conn.rollback()
-        raise ValueError("Username already taken")
+        return cur.fetchone()
+
+
+def _timed_hash_job(fn, submitted: float, *args):
+    started = time.perf_counter()
+    waited = started - submitted
+    with _hash_lock:
+        _hash_stats["running"] += 1
+        _hash_stats["wait_total"] += waited
+        _hash_stats["wait_max"] = max(_hash_stats["wait_max"], waited)
+    try:
+        return fn(*args)
     finally:
-        cur.close()
-        conn.close()
+        with _hash_lock:
+            _hash_stats["running"] -= 1
+            _hash_stats["completed"] += 1
+            _hash_stats["run_total"] += time.perf_counter() - started
 
-    return new_id
 
+async def _run_hash_job(fn, *args):
+    """
+    Runs a bcrypt call on the hashing pool. Fails fast with 503 when the
+    queue is already full instead of letting logins pile up.
+    """
+    with _hash_lock:
+        if _hash_stats["pending"] >= PASSWORD_HASH_QUEUE:
+            _hash_stats["rejected"] += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Too many sign-ins in progress, please retry shortly.",
+                headers={"Retry-After": "1"},
+            )
+        _hash_stats["pending"] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _hash_executor, _timed_hash_job, fn, time.perf_counter(), *args
+        )
+    finally:
+        with _hash_lock:
+            _hash_stats["pending"] -= 1
 
 
+async def hash_password(raw_password: str) -> bytes:
+    """Returns a bcrypt hash of `raw_password`, computed off the event loop."""
+    return await _run_hash_job(
+        lambda raw: bcrypt.hashpw(raw.encode("utf-8"), bcrypt.gensalt()), raw_password
+    )
+
+
+async def check_password(raw_password: str, stored_hash: bytes) -> bool:
+    """Verifies `raw_password` against a bcrypt hash, off the event loop."""
+    return await _run_hash_job(
+        lambda raw, hashed: bcrypt.checkpw(raw.encode("utf-8"), hashed),
+        raw_password,
+        stored_hash,
+    )
+
+
+def password_hash_stats() -> dict:
+    with _hash_lock:
+        completed = _hash_stats["completed"]
+        return {
+            "workers": PASSWORD_HASH_WORKERS,
+            "queue_limit": PASSWORD_HASH_QUEUE,
+            "pending": _hash_stats["pending"],
+            "running": _hash_stats["running"],
+            "queued": _hash_stats["pending"] - _hash_stats["running"],
+            "completed": completed,
+            "rejected": _hash_stats["rejected"],
+            "wait_avg_ms": 1000 * _hash_stats["wait_total"] / completed if completed else 0.0,
+            "wait_max_ms": 1000 * _hash_stats["wait_max"],
+            "run_avg_ms": 1000 * _hash_stats["run_total"] / completed if completed else 0.0,
+        }
+
 
 def user_exists(user_id: int) -> bool:
     """
     Returns True if there is a row in users with this user_id; otherwise False.
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT 1 FROM users WHERE user_id = %s;", (user_id,))
-    exists = cur.fetchone() is not None
-    cur.close()
-    conn.close()
-    return exists
+    with db_cursor() as cur:
+        cur.execute("SELECT 1 FROM users WHERE user_id = %s;", (user_id,))
+        return cur.fetchone() is not None
 
 
 def list_all_movies() -> list[tuple[int, str]]:
     """
     Returns a list of (movie_id, title) for every row in movies, ordered by movie_id.
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT movie_id, title FROM movies ORDER BY movie_id;")
-    movies = cur.fetchall()   # e.g. [(1, 'Toy Story (1995)'), (2, 'GoldenEye (1995)'), …]
-    cur.close()
-    conn.close()
-    return movies
+    with db_cursor() as cur:
+        cur.execute("SELECT movie_id, title FROM movies ORDER BY movie_id;")
+        return cur.fetchall()   # e.g. [(1, 'Toy Story (1995)'), (2, 'GoldenEye (1995)'), …]
+
+
+def insert_movies(movies: list[tuple[str, str, list[int]]]) -> list[int]:
+    """
+    Inserts (title, release_date, genre_ids) rows into movies and movie_genres
+    in one transaction, with one multi-row INSERT per table. Genre ids must
+    already be validated. Returns the new movie_ids, in input order.
+    """
+    with db_cursor(commit=True) as cur:
+        # Draw the ids up front so each movie's genres can go in the same batch
+        cur.execute(
+            "SELECT nextval(pg_get_serial_sequence('movies', 'movie_id')) FROM generate_series(1, %s);",
+            (len(movies),)
+        )
+        movie_ids = [row[0] for row in cur.fetchall()]
+        execute_values(
+            cur,
+            "INSERT INTO movies (movie_id, title, release_date) VALUES %s;",
+            [(movie_id, title, release_date)
+             for movie_id, (title, release_date, _) in zip(movie_ids, movies)],
+            page_size=1000,
+        )
+        pairs = [
+            (movie_id, genre_id)
+            for movie_id, (_, _, genre_ids) in zip(movie_ids, movies)
+            for genre_id in dict.fromkeys(genre_ids)
+        ]
+        if pairs:
+            execute_values(
+                cur,
+                "INSERT INTO movie_genres (movie_id, genre_id) VALUES %s ON CONFLICT DO NOTHING;",
+                pairs,
+                page_size=1000,
+            )
+    return movie_ids
+
+
+def _previous_ratings(cur, user_id: int, movie_ids: list) -> dict:
+    """
+    movie_id → (rating, rated_at as epoch seconds) of the user's existing
+    ratings among `movie_ids`, locked until the upsert commits. Lets rating
+    events tell a re-rating from a new rating.
+    """
+    cur.execute(
+        """
+        SELECT movie_id, rating, EXTRACT(EPOCH FROM rated_at)
+          FROM ratings
+         WHERE user_id = %s AND movie_id = ANY(%s)
+           FOR UPDATE;
+        """,
+        (user_id, list(movie_ids)),
+    )
+    return {movie_id: (rating, float(ts)) for movie_id, rating, ts in cur.fetchall()}
 
 
 def add_or_update_rating(user_id: int, movie_id: int, rating: int) -> None:
     """
     Inserts or updates a rating by user_id for movie_id. 
     Rating must be 1–5. Raises ValueError if the user doesn’t exist or rating is invalid.
+    The saved rating is published on the rating event bus, with the rating it
+    replaced (if any).
     """
     # Validate rating
     if rating < 1 or rating > 5:
         raise ValueError("Rating must be between 1 and 5.")
 
-    if not user_exists(user_id):
-        raise ValueError(f"user_id {user_id} does not exist.")
+    # Existence check and upsert share one pooled connection
+    with db_cursor(commit=True) as cur:
+        cur.execute("SELECT 1 FROM users WHERE user_id = %s;", (user_id,))
+        if cur.fetchone() is None:
+            raise ValueError(f"user_id {user_id} does not exist.")
+        previous = _previous_ratings(cur, user_id, [movie_id])
+        cur.execute(
+            """
+            INSERT INTO ratings (user_id, movie_id, rating)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (user_id, movie_id)
+            DO UPDATE SET
+              rating = EXCLUDED.rating,
+              rated_at = NOW();
+            """,
+            (user_id, movie_id, rating)
+        )
+    rating_bus.publish(user_id, [(movie_id, rating, *previous.get(movie_id, ()))])
+
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO ratings (user_id, movie_id, rating)
-        VALUES (%s, %s, %s)
-        ON CONFLICT (user_id, movie_id)
-        DO UPDATE SET
-          rating = EXCLUDED.rating,
-          rated_at = NOW();
-        """,
-        (user_id, movie_id, rating)
+def add_or_update_ratings(user_id: int, ratings: list[tuple[int, int]]) -> None:
+    """
+    Bulk version of add_or_update_rating: upserts many (movie_id, rating) pairs
+    for one user in a single transaction with one multi-row INSERT.
+    Each movie_id may appear only once. Raises ValueError if the user doesn’t exist.
+    The saved ratings are published on the rating event bus as one batch.
+    """
+    with db_cursor(commit=True) as cur:
+        cur.execute("SELECT 1 FROM users WHERE user_id = %s;", (user_id,))
+        if cur.fetchone() is None:
+            raise ValueError(f"user_id {user_id} does not exist.")
+        previous = _previous_ratings(cur, user_id, [movie_id for movie_id, _ in ratings])
+        execute_values(
+            cur,
+            """
+            INSERT INTO ratings (user_id, movie_id, rating)
+            VALUES %s
+            ON CONFLICT (user_id, movie_id)
+            DO UPDATE SET
+              rating = EXCLUDED.rating,
+              rated_at = NOW();
+            """,
+            [(user_id, movie_id, rating) for movie_id, rating in ratings],
+            page_size=len(ratings) or 1,
+        )
+    rating_bus.publish(
+        user_id, [(movie_id, rating, *previous.get(movie_id, ())) for movie_id, rating in ratings]
     )
-    conn.commit()
-    cur.close()
-    conn.close()
+
+
+def chat_history_page(
+    user1: int,
+    user2: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = 50,
+) -> tuple[list[tuple], bool]:
+    """
+    One page of the conversation between user1 and user2, oldest first.
+      * before=<message_id>: the `limit` messages just older than that message
+      * after=<message_id>:  up to `limit` messages newer than that message
+      * neither:             the latest `limit` messages
+    Returns (rows, has_more), rows being (message_id, from, to, text, created_at)
+    and has_more telling whether more messages lie past the page in the same
+    direction. Filters on (LEAST, GREATEST) so the conversation index is used.
+    """
+    low, high = min(user1, user2), max(user1, user2)
+    conversation = (
+        "LEAST(from_user_id, to_user_id) = %s AND GREATEST(from_user_id, to_user_id) = %s"
+    )
+    params: list = [low, high]
+    if after is not None:
+        cursor_sql = "AND (created_at, message_id) > (SELECT created_at, message_id FROM messages WHERE message_id = %s)"
+        order = "ASC"
+        params.append(after)
+    elif before is not None:
+        cursor_sql = "AND (created_at, message_id) < (SELECT created_at, message_id FROM messages WHERE message_id = %s)"
+        order = "DESC"
+        params.append(before)
+    else:
+        cursor_sql = ""
+        order = "DESC"
+    params.append(limit + 1)
+
+    with db_cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT message_id, from_user_id, to_user_id, text, created_at
+              FROM messages
+             WHERE {conversation}
+               {cursor_sql}
+             ORDER BY created_at {order}, message_id {order}
+             LIMIT %s;
+            """,
+            params,
+        )
+        rows = cur.fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if order == "DESC":
+        rows.reverse()
+    return rows, has_more
+
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -139,8 +372,66 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def _cached_admin_flag(user_id: int) -> Optional[bool]:
+    """
+    Returns the user's is_admin flag, or None if the user doesn't exist.
+    Positive lookups are cached for AUTH_CACHE_TTL seconds.
+    """
+    global _auth_cache_hits, _auth_cache_misses
+    now = time.monotonic()
+    with _auth_cache_lock:
+        entry = _auth_cache.get(user_id)
+        if entry is not None and entry[0] > now:
+            _auth_cache_hits += 1
+            return entry[1]
+        _auth_cache_misses += 1
+
+    # One query answers both "does the user exist?" and "are they an admin?"
+    with db_cursor() as cur:
+        cur.execute("SELECT is_admin FROM users WHERE user_id = %s;", (user_id,))
+        row = cur.fetchone()
+    if row is None:
+        return None
+
+    is_admin = bool(row[0])
+    with _auth_cache_lock:
+        _auth_cache[user_id] = (now + AUTH_CACHE_TTL, is_admin)
+    return is_admin
+
+
+def invalidate_auth_cache(user_id: Optional[int] = None) -> None:
+    """
+    Drops the cached identity for `user_id` (or every entry if None).
+    Call this whenever a user row is created, deleted or has is_admin changed.
+    """
+    with _auth_cache_lock:
+        if user_id is None:
+            _auth_cache.clear()
+        else:
+            _auth_cache.pop(user_id, None)
+
+
+def auth_cache_stats() -> dict:
+    with _auth_cache_lock:
+        lookups = _auth_cache_hits + _auth_cache_misses
+        return {
+            "entries": len(_auth_cache),
+            "ttl_seconds": AUTH_CACHE_TTL,
+            "hits": _auth_cache_hits,
+            "misses": _auth_cache_misses,
+            "hit_rate": _auth_cache_hits / lookups if lookups else 0.0,
+        }
+
+
 def get_current_user(request: Request):
-    token = request.cookies.get("session_token")
+    return user_from_session_token(request.cookies.get("session_token"))
+
+
+def user_from_session_token(token: Optional[str]) -> int:
+    """
+    Validates a session_token cookie value and returns its user_id.
+    Raises 401 if it is missing, invalid or belongs to no user.
+    """
     if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     try:
@@ -148,7 +439,19 @@ def get_current_user(request: Request):
         user_id: int = payload.get("user_id")
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid auth token")
-    if user_id is None or not user_exists(user_id):
+    if user_id is None or _cached_admin_flag(user_id) is None:
         raise HTTPException(status_code=401, detail="User not found")
     # you can fetch and return a full user object here if needed
+    return user_id
+
+
+def get_current_admin(
+    user_id: int = Depends(get_current_user)   # <-- only depends on get_current_user
+):
+    """
+    Ensures the logged-in user is an admin.
+    """
+    if not _cached_admin_flag(user_id):
+        raise HTTPException(status_code=403, detail="Admin privileges required.")
+
     return user_id
\ No newline at end of file
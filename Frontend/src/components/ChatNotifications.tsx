@@ -20,36 +20,75 @@ export const ChatNotifications: React.FC<{ currentUserId: number }> = ({ current
 
   useEffect(() => {
     let stopped = false;
+    let socket: WebSocket | null = null;
+    let pollTimer: ReturnType<typeof setInterval> | null = null;
+    let retryTimer: ReturnType<typeof setTimeout> | null = null;
+    let retryDelay = 1000;
 
+    const showToast = (msg: Unread) => {
+      const id = nextId.current++;
+      setToasts((prev) => [
+        ...prev,
+        { id, content: `${msg.from_username}: ${msg.text}` },
+      ]);
+      // auto-remove toast after 5s
+      setTimeout(() => {
+        setToasts((prev) => prev.filter((t) => t.id !== id));
+      }, 5000);
+    };
+
+    // Fallback when the push channel is unavailable
     const poll = async () => {
       try {
         const resp = await fetch('/api/chats/unread', {credentials: 'include'});
         if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
         const data: Unread[] = await resp.json();
         if (stopped) return;
-
-        data.forEach((msg) => {
-          const id = nextId.current++;
-          setToasts((prev) => [
-            ...prev,
-            { id, content: `${msg.from_username}: ${msg.text}` },
-          ]);
-          // auto-remove toast after 5s
-          setTimeout(() => {
-            setToasts((prev) => prev.filter((t) => t.id !== id));
-          }, 5000);
-        });
+        data.forEach(showToast);
       } catch (err) {
         console.error('Error polling unread messages:', err);
       }
     };
 
-    // initial fetch + interval
-    poll();
-    const iv = setInterval(poll, 5000);
+    const startPolling = () => {
+      if (pollTimer === null) {
+        poll();
+        pollTimer = setInterval(poll, 5000);
+      }
+    };
+
+    const stopPolling = () => {
+      if (pollTimer !== null) {
+        clearInterval(pollTimer);
+        pollTimer = null;
+      }
+    };
+
+    // Messages are pushed over a WebSocket; reconnect with backoff if it drops
+    const connect = () => {
+      const proto = window.location.protocol === 'https:' ? 'wss' : 'ws';
+      socket = new WebSocket(`${proto}://${window.location.host}/api/chats/ws`);
+      socket.onopen = () => {
+        retryDelay = 1000;
+        stopPolling();
+      };
+      socket.onmessage = (event) => {
+        if (!stopped) showToast(JSON.parse(event.data));
+      };
+      socket.onclose = () => {
+        if (stopped) return;
+        startPolling();
+        retryTimer = setTimeout(connect, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 30000);
+      };
+    };
+
+    connect();
     return () => {
       stopped = true;
-      clearInterval(iv);
+      stopPolling();
+      if (retryTimer !== null) clearTimeout(retryTimer);
+      socket?.close();
     };
   }, [currentUserId]);
 
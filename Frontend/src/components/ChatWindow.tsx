@@ -2,6 +2,7 @@
 import React, { useEffect, useState, useRef } from 'react';
 
 type Message = {
+  message_id: number;
   from: number;
   to: number;
   text: string;
@@ -23,40 +24,78 @@ const ChatWindow: React.FC<ChatWindowProps> = ({
   const [text, setText] = useState('');
   const [sending, setSending] = useState(false);
   const historyRef = useRef<HTMLDivElement | null>(null);
-  const lastTsRef = useRef<string | null>(null);
+  const [hasOlder, setHasOlder] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  // Cursors: newest message we have (for polling) and oldest (for paging back)
+  const newestIdRef = useRef<number | null>(null);
+  const oldestIdRef = useRef<number | null>(null);
 
-  // Fetch only if there’s newer content
+  const scrollToBottom = () => {
+    setTimeout(() => {
+      historyRef.current?.scrollTo({
+        top: historyRef.current.scrollHeight,
+        behavior: 'smooth',
+      });
+    }, 50);
+  };
+
+  // First call loads the latest page; after that only fetch what's new
   const fetchHistory = async () => {
     try {
-      const resp = await fetch(`/api/chats/history?peer_id=${peerId}`, {
-        credentials: 'include',
-      });
+      const after = newestIdRef.current;
+      const url = after === null
+        ? `/api/chats/history?peer_id=${peerId}`
+        : `/api/chats/history?peer_id=${peerId}&after=${after}`;
+      const resp = await fetch(url, { credentials: 'include' });
       if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
       const data = await resp.json();
       const msgs: Message[] = data.messages;
 
-      const newest = msgs.length ? msgs[msgs.length - 1].ts : null;
-      if (newest && newest === lastTsRef.current) {
+      if (after === null) {
+        oldestIdRef.current = msgs.length ? msgs[0].message_id : null;
+        setHasOlder(data.has_more);
+        setMessages(msgs);
+      } else if (msgs.length) {
+        setMessages(prev => [...prev, ...msgs]);
+      } else {
         return; // no change
       }
-
-      lastTsRef.current = newest;
-      setMessages(msgs);
-
-      // scroll to bottom
-      setTimeout(() => {
-        historyRef.current?.scrollTo({
-          top: historyRef.current.scrollHeight,
-          behavior: 'smooth',
-        });
-      }, 50);
+      if (msgs.length) {
+        newestIdRef.current = msgs[msgs.length - 1].message_id;
+      }
+      scrollToBottom();
     } catch (err) {
       console.error('Failed to load chat history:', err);
     }
   };
 
+  const loadOlder = async () => {
+    if (oldestIdRef.current === null) return;
+    setLoadingOlder(true);
+    try {
+      const resp = await fetch(
+        `/api/chats/history?peer_id=${peerId}&before=${oldestIdRef.current}`,
+        { credentials: 'include' },
+      );
+      if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+      const data = await resp.json();
+      const msgs: Message[] = data.messages;
+      if (msgs.length) {
+        oldestIdRef.current = msgs[0].message_id;
+        setMessages(prev => [...msgs, ...prev]);
+      }
+      setHasOlder(data.has_more);
+    } catch (err) {
+      console.error('Failed to load older messages:', err);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   // poll every 3s
   useEffect(() => {
+    newestIdRef.current = null;
+    oldestIdRef.current = null;
     fetchHistory();
     const id = setInterval(fetchHistory, 3000);
     return () => clearInterval(id);
@@ -96,12 +135,23 @@ const ChatWindow: React.FC<ChatWindowProps> = ({
         className="chat-history border rounded p-2 mb-2 flex-grow-1"
         style={{ overflowY: 'auto', backgroundColor: '#f9f9f9' }}
       >
+        {hasOlder && (
+          <div className="text-center mb-2">
+            <button
+              className="btn btn-sm btn-outline-secondary"
+              onClick={loadOlder}
+              disabled={loadingOlder}
+            >
+              {loadingOlder ? 'Loading…' : 'Load older messages'}
+            </button>
+          </div>
+        )}
         {messages.length === 0 ? (
           <div className="text-center text-muted">No messages yet.</div>
         ) : (
-          messages.map((m, i) => (
+          messages.map((m) => (
             <div
-              key={i}
+              key={m.message_id}
               className={`d-flex mb-1 ${
                 m.from === currentUserId ? 'justify-content-end' : 'justify-content-start'
               }`}
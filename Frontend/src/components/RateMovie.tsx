@@ -16,6 +16,8 @@ const RateMovie: React.FC<RateMovieProps> = ({ currentCount, onCountChange }) =>
   const [rating, setRating] = useState<number | ''>('');
   const [error, setError] = useState<string | null>(null);
   const [success, setSuccess] = useState<string | null>(null);
+  const [query, setQuery] = useState('');
+  const [results, setResults] = useState<Movie[] | null>(null);
 
   // 1) Fetch unrated movies on mount
   useEffect(() => {
@@ -32,6 +34,36 @@ const RateMovie: React.FC<RateMovieProps> = ({ currentCount, onCountChange }) =>
     })();
   }, []);
 
+  // Server-side title search (debounced); an empty box shows the full list again
+  useEffect(() => {
+    const q = query.trim();
+    if (!q) {
+      setResults(null);
+      return;
+    }
+    const controller = new AbortController();
+    const timer = setTimeout(async () => {
+      try {
+        const resp = await fetch(
+          `/api/movies/search?q=${encodeURIComponent(q)}&exclude_rated=true&limit=50`,
+          { credentials: 'include', signal: controller.signal },
+        );
+        if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+        const data: { movies: Movie[] } = await resp.json();
+        setResults(data.movies);
+        setSelectedMovieId(data.movies.length ? data.movies[0].movie_id : '');
+      } catch (err: any) {
+        if (err.name !== 'AbortError') console.error('Search error:', err);
+      }
+    }, 200);
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [query]);
+
+  const options = results ?? movies;
+
   // 2) Handle form submission
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
@@ -67,6 +99,7 @@ const RateMovie: React.FC<RateMovieProps> = ({ currentCount, onCountChange }) =>
       onCountChange(currentCount + 1);
       // remove the just-rated movie from the dropdown
       setMovies((m) => m.filter((mv) => mv.movie_id !== selectedMovieId));
+      setResults((r) => r && r.filter((mv) => mv.movie_id !== selectedMovieId));
       setSelectedMovieId('');
       setRating('');
     } catch (err: any) {
@@ -86,6 +119,13 @@ const RateMovie: React.FC<RateMovieProps> = ({ currentCount, onCountChange }) =>
         {/* Movie selector */}
         <div className="mb-3">
           <label htmlFor="movie-select" className="form-label">Movie</label>
+          <input
+            type="search"
+            className="form-control mb-2"
+            placeholder="Search titles…"
+            value={query}
+            onChange={(e) => setQuery(e.target.value)}
+          />
           <select
             id="movie-select"
             className="form-select"
@@ -95,7 +135,7 @@ const RateMovie: React.FC<RateMovieProps> = ({ currentCount, onCountChange }) =>
             }
           >
             <option value="">— Select a movie —</option>
-            {movies.map((m) => (
+            {options.map((m) => (
               <option key={m.movie_id} value={m.movie_id}>
                 {m.title}
               </option>
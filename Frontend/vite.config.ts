@@ -10,6 +10,7 @@ export default defineConfig({
       "/api": {
         target: "http://localhost:5000",
         changeOrigin: true,
+        ws: true, // /api/chats/ws
         rewrite: (path) => path.replace(/^\/api/, ""),
       },
     },